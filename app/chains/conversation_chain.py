@@ -1,13 +1,19 @@
 from langgraph.graph import StateGraph, START, END
 from app.core.config import settings
 from app.models.state import State
-from app.utils.prompt_templates import general_rag_prompt, evaluation_rag_prompt, tracking_prompt, intent_classification_prompt, contextualize_q_prompt
+from app.utils.prompt_templates import general_rag_prompt, general_rag_stream_prompt, evaluation_rag_prompt, tracking_prompt, intent_classification_prompt, contextualize_q_prompt, fused_router_prompt
 from app.agents.document_tracking_agent import DocumentTrackingAgent
-from app.utils.helpers import get_time, preprocess_question
-from app.services.llm_service import get_llm_model
+from app.utils.helpers import get_time, preprocess_question, extract_tracking_number
+from app.utils.token_budget import pack_context
+from app.services.vector_store.reranker import rerank_documents
+from app.services.faq_index import get_faq_index
+from app.services.intent_classifier import get_intent_pre_classifier
+from app.services.llm_service import get_llm_model, llm_concurrency
+import asyncio
 import json
 import logging
 import re
+from typing import List
 from langchain_core.messages import HumanMessage, AIMessage
 
 logger = logging.getLogger(__name__)
@@ -20,6 +26,49 @@ tracking_agent = DocumentTrackingAgent()
 
 # --- Nodes ---
 
+# Node fast path FAQ: pertanyaan yang sama (atau hampir sama) dengan FAQ langsung dijawab
+async def match_faq(state: State):
+    if state.get("is_eval"):
+        return {}
+    entry = get_faq_index().match(state["question"])
+    if entry is None:
+        return {}
+    logger.info(f"FAQ fast path matched FAQ {entry.faq_id} for question: '{state['question']}'")
+    return {"answer": entry.answer, "category": entry.category, "intent": "faq", "context": []}
+
+async def ainvoke_llm(chain, inputs: dict):
+    """
+    Panggil chain LLM secara async dengan batas waktu LLM_TIMEOUT_SECONDS per panggilan,
+    di dalam batas konkurensi model (LLM_MAX_CONCURRENCY).
+    """
+    async with llm_concurrency():
+        return await asyncio.wait_for(chain.ainvoke(inputs), timeout=settings.LLM_TIMEOUT_SECONDS)
+
+def recent_history(state: State) -> List[dict]:
+    """Jendela history yang dipakai prompt: HISTORY_MAX_TURNS giliran (user+assistant) terakhir."""
+    window = max(settings.HISTORY_MAX_TURNS, 0) * 2
+    history = state.get("conversation_history") or []
+    return history[-window:] if window else []
+
+def format_history_messages(state: State) -> list:
+    """History percakapan sebagai pesan LangChain."""
+    history_messages = []
+    # Jika history terlalu panjang, ambil N terakhir saja agar prompt tidak penuh
+    for msg in recent_history(state):
+        if msg.get("role") == "user":
+            history_messages.append(HumanMessage(content=msg.get("content", "")))
+        elif msg.get("role") == "assistant":
+            history_messages.append(AIMessage(content=msg.get("content", "")))
+    return history_messages
+
+def pipeline_mode(state: State) -> str:
+    """Mode pipeline satu pemanggilan: override di state (evaluasi A/B) atau PIPELINE_MODE."""
+    return state.get("pipeline_mode") or settings.PIPELINE_MODE
+
+def standalone_question(state: State) -> str:
+    """Pertanyaan hasil contextualize jika ada, selain itu pertanyaan asli."""
+    return state.get("standalone_question") or state["question"]
+
 # Node untuk memformulasikan ulang pertanyaan berdasarkan history
 async def contextualize_question(state: State):
     print(f"Checking if question needs contextualization: {state['question']}")
@@ -28,19 +77,10 @@ async def contextualize_question(state: State):
         print("No history, skipping contextualization.")
         return {}
 
-    # Format history
-    history_messages = []
-    for msg in state["conversation_history"]:
-        if msg.get("role") == "user":
-            history_messages.append(HumanMessage(content=msg.get("content", "")))
-        elif msg.get("role") == "assistant":
-            history_messages.append(AIMessage(content=msg.get("content", "")))
-            
-    # Jika history terlalu panjang, ambil N terakhir saja agar prompt tidak penuh
-    history_messages = history_messages[-6:] 
+    history_messages = format_history_messages(state)
 
     chain = contextualize_q_prompt | model
-    response = await chain.ainvoke({
+    response = await ainvoke_llm(chain, {
         "history": history_messages,
         "question": state["question"]
     })
@@ -50,53 +90,139 @@ async def contextualize_question(state: State):
     print(f"[Contextualize] Rewritten Question: '{new_question}'")
     logger.info(f"Contextualized question: '{state['question']}' -> '{new_question}'")
     
-    return {"question": new_question}
+    # Disimpan terpisah: berjalan paralel dengan classifier, dan handler tracking tetap
+    # memakai pertanyaan asli pengguna
+    return {"standalone_question": new_question}
 
 # Node untuk mengambil konteks dari retriever
 def retrieve_context_node(retriever: object): # Fungsi pembungkus untuk LangGraph yang menerima retriever
     async def node_func(state: State):
-        print(f"Retrieving context for question: {state['question']}")
+        question = standalone_question(state)
+        print(f"Retrieving context for question: {question}")
         # Preprocess question sebelum mengirim ke retriever
-        cleaned_question = preprocess_question(state["question"])
-        # Panggil metode retriever
-        retrieved_docs = retriever.invoke(cleaned_question)
+        cleaned_question = preprocess_question(question)
+        # Panggil retriever secara async agar event loop tidak terblokir selama retrieval
+        retrieved_docs = await retriever.ainvoke(cleaned_question)
 
                 # --- TAMBAHKAN LOGGING KONTEKS DI SINI ---
         print(f"Retrieved {len(retrieved_docs)} documents.")
-        logger.info(f"Retrieved {len(retrieved_docs)} documents for question: '{state['question']}'")
+        logger.info(f"Retrieved {len(retrieved_docs)} documents for question: '{question}'")
         print(f"retrieved_docs: \n{retrieved_docs}")
         return {"context": retrieved_docs}
     return node_func
 
+# Node untuk rerank + dedup konteks sebelum dikirim ke LLM; batas token diterapkan pack_context
+async def rerank_context(state: State):
+    context = state.get("context") or []
+    reranked = await rerank_documents(preprocess_question(standalone_question(state)), context)
+    logger.info(f"Reranked context: {len(context)} -> {len(reranked)} documents")
+    return {"context": reranked}
+
+# Penanda kategori di akhir jawaban mode streaming (lihat general_rag_stream_prompt)
+# Awal penanda kategori ("[[KATEGORI", spasi setelah "[[" diterima); dipakai bersama oleh
+# split_category_marker dan AnswerStreamFilter agar jawaban yang di-stream sama dengan yang disimpan
+CATEGORY_MARKER = "KATEGORI"
+_CATEGORY_MARKER_START = re.compile(r"\[\[\s*KATEGORI", re.IGNORECASE)
+_CATEGORY_MARKER_PATTERN = re.compile(r"\[\[\s*KATEGORI\s*:\s*([^\]]*)\]\]", re.IGNORECASE)
+
+def split_category_marker(content: str):
+    """Pisahkan jawaban streaming menjadi (jawaban, kategori); kategori default 'Umum'."""
+    start = _CATEGORY_MARKER_START.search(content)
+    if not start:
+        return content.strip(), "Umum"
+    match = _CATEGORY_MARKER_PATTERN.match(content, start.start())
+    category = match.group(1).strip() if match else ""
+    return content[:start.start()].strip(), category or "Umum"
+
+def _may_start_category_marker(text: str) -> bool:
+    """True jika `text` (diawali '[') masih bisa menjadi awal penanda kategori."""
+    if text == "[":
+        return True
+    if not text.startswith("[["):
+        return False
+    rest = text[2:].lstrip()
+    return CATEGORY_MARKER.startswith(rest.upper())
+
+class AnswerStreamFilter:
+    """
+    Meneruskan token jawaban streaming ke klien dan menahan baris penanda kategori.
+    Karakter '[' ditahan sampai cukup untuk memastikan bukan awal penanda kategori.
+    """
+
+    def __init__(self):
+        self._pending = ""
+        self._stopped = False
+
+    def feed(self, text: str) -> str:
+        if self._stopped:
+            return ""
+        self._pending += text
+        emitted = []
+        while self._pending:
+            index = self._pending.find("[")
+            if index < 0:
+                emitted.append(self._pending)
+                self._pending = ""
+                break
+            emitted.append(self._pending[:index])
+            self._pending = self._pending[index:]
+            if _CATEGORY_MARKER_START.match(self._pending):
+                # Sisa output hanyalah penanda kategori
+                self._stopped = True
+                self._pending = ""
+                break
+            if _may_start_category_marker(self._pending):
+                break  # belum cukup karakter untuk memutuskan
+            emitted.append(self._pending[0])
+            self._pending = self._pending[1:]
+        return "".join(emitted)
+
+    def flush(self) -> str:
+        remaining = "" if self._stopped else self._pending
+        self._pending = ""
+        return remaining
+
 # Node untuk menghasilkan jawaban umum berdasarkan konteks
-def generate_general_answer(state: State): # Tidak perlu menerima retriever
+async def generate_general_answer(state: State): # Tidak perlu menerima retriever
     print("Generating general answer...")
-    docs_content = "\n\n".join(doc.page_content for doc in state["context"])
+    # Isi konteks sesuai peringkat retriever sampai CONTEXT_TOKEN_BUDGET token
+    docs_content, used_docs = pack_context(state["context"])
+    logger.info(f"Context packed: {len(used_docs)}/{len(state['context'])} documents")
     current_date = get_time()
 
-    # Format history menjadi string yang mudah dibaca LLM
+    # Format history menjadi string yang mudah dibaca LLM; percakapan yang lebih lama
+    # dari jendela history masuk lewat ringkasan bergulir (ChatSession.history_summary)
     history_text = ""
-    if state.get("conversation_history"):
-        for msg in state["conversation_history"]:
-            role = msg.get("role", "unknown")
-            content = msg.get("content", "")
-            history_text += f"{role}: {content}\n"
+    if state.get("history_summary"):
+        history_text += f"Ringkasan percakapan sebelumnya: {state['history_summary']}\n"
+    for msg in recent_history(state):
+        role = msg.get("role", "unknown")
+        content = msg.get("content", "")
+        history_text += f"{role}: {content}\n"
     
     if not history_text:
         history_text = "Belum ada riwayat percakapan."
 
+    # Mode streaming: jawaban teks biasa agar token bisa diteruskan langsung ke klien
+    streaming = state.get("stream") and not state.get("is_eval")
     if state.get("is_eval"):
         chain = evaluation_rag_prompt | model
+    elif streaming:
+        chain = general_rag_stream_prompt | model
     else:
         chain = general_rag_prompt | model
-    response = chain.invoke({ 
-        "question": state["question"],
+    response = await ainvoke_llm(chain, { 
+        "question": standalone_question(state),
         "context": docs_content,
         "date": current_date,
         "history": history_text
     })
     print("General answer generated.")
     print(f"response: \n{response.content.strip()}")  
+
+    if streaming:
+        answer, category = split_category_marker(response.content)
+        return {"answer": answer, "category": category}
     
     # Parse JSON response using Regex for robustness
     try:
@@ -121,11 +247,63 @@ def generate_general_answer(state: State): # Tidak perlu menerima retriever
         
     return {"answer": answer, "category": category}
 
+# Node mode "fused": intent, pertanyaan mandiri, dan nomor registrasi dalam satu panggilan LLM
+async def route_and_rewrite(state: State):
+    logger.debug(f"Routing (fused) question: {state['question']}")
+    history_messages = format_history_messages(state)
+
+    # Tanpa history tidak ada yang perlu dirumuskan ulang; aturan lokal cukup jika sinyalnya jelas
+    if settings.INTENT_RULES_ENABLED and not history_messages:
+        intent = get_intent_pre_classifier().classify(state["question"])
+        if intent is not None:
+            logger.info(f"Intent classified by rules as: {intent}")
+            return {"intent": intent}
+
+    chain = fused_router_prompt | model
+    response = await ainvoke_llm(chain, {
+        "history": history_messages,
+        "question": state["question"]
+    })
+    content = response.content.strip()
+    try:
+        json_match = re.search(r"\{.*\}", content, re.DOTALL)
+        if not json_match:
+            raise ValueError("No JSON object found")
+        parsed = json.loads(json_match.group(0))
+    except (json.JSONDecodeError, ValueError) as e:
+        logger.warning(f"Failed to parse fused router response: {e}. Content: {content[:100]}...")
+        return {"intent": "general"}
+
+    intent = str(parsed.get("intent", "")).strip().lower()
+    if intent not in ['tracking', 'general']:
+        intent = 'general' # Fallback
+    update = {"intent": intent}
+
+    rewritten = str(parsed.get("standalone_question") or "").strip()
+    if history_messages and rewritten:
+        update["standalone_question"] = rewritten
+        logger.info(f"Contextualized question (fused): '{state['question']}' -> '{rewritten}'")
+
+    # Nomor hanya dipakai jika valid dan benar-benar muncul di percakapan (bukan karangan LLM)
+    number = extract_tracking_number(str(parsed.get("tracking_number") or ""))
+    conversation_text = " ".join([state["question"]] + [m.content for m in history_messages])
+    if number and number in conversation_text:
+        update["tracking_number"] = number
+
+    logger.info(f"Fused routing result: {update}")
+    return update
+
 # Node untuk klasifikasi intent
 async def classify_intent(state: State):
     print(f"Classifying intent for question: {state['question']}")
+    # Tier lokal: pesan dengan sinyal jelas tidak perlu memanggil LLM
+    if settings.INTENT_RULES_ENABLED:
+        intent = get_intent_pre_classifier().classify(state["question"])
+        if intent is not None:
+            print(f"Intent classified by rules as: {intent}")
+            return {"intent": intent}
     chain = intent_classification_prompt | model
-    response = await chain.ainvoke({"question": state["question"]}) 
+    response = await ainvoke_llm(chain, {"question": state["question"]}) 
     intent = response.content.strip().lower()
     if intent not in ['tracking', 'general']:
         intent = 'general' # Fallback
@@ -176,7 +354,7 @@ async def handle_tracking_intent(state: State):
                 # Jika berhasil mendapatkan data, kirimkan ke LLM untuk diformat
                 current_date = get_time()
                 chain = tracking_prompt | model
-                formatted_response = await chain.ainvoke({
+                formatted_response = await ainvoke_llm(chain, {
                     "question": state["question"],
                     "tracking_data": json.dumps(result.get('tracking_data', {}), indent=2, ensure_ascii=False),
                     "date": current_date
@@ -201,40 +379,88 @@ async def handle_tracking_intent(state: State):
 
 
 # --- LangGraph Setup ---
+
+def is_tracking_intent(state: State) -> bool:
+    return state.get("intent", "general") in ["tracking", "tracking_pending_number"]
+
+# Node kosong sebagai titik temu cabang paralel (menunggu semua cabang selesai)
+def join_branches(state: State):
+    return {}
+
+# Titik temu classifier + retrieval spekulatif: konteks dibuang jika ternyata intent tracking
+def join_speculative_retrieval(state: State):
+    if is_tracking_intent(state):
+        return {"context": []}
+    return {}
+
 def create_conversation_graph(retriever): # Terima retriever sebagai parameter
     graph_builder = StateGraph(State)
+    retrieve_node = retrieve_context_node(retriever) # Fungsi pembungkus yang membawa retriever
+    after_retrieval = "reranker" if settings.RERANK_ENABLED else "llm_generator"
 
     # Tambahkan node-node ke graph
+    if settings.FAQ_FAST_PATH_ENABLED:
+        graph_builder.add_node("faq_matcher", match_faq)
+    graph_builder.add_node("fused_router", route_and_rewrite)
     graph_builder.add_node("classifier", classify_intent)
     graph_builder.add_node("tracking_handler", handle_tracking_intent)
-    graph_builder.add_node("contextualize", contextualize_question) # Node baru
-    # Gunakan fungsi pembungkus yang membawa retriever
-    graph_builder.add_node("retriever", retrieve_context_node(retriever)) 
+    graph_builder.add_node("contextualize", contextualize_question)
+    graph_builder.add_node("retriever", retrieve_node)
+    # Retrieval spekulatif pada pertanyaan asli (tanpa history tidak ada yang perlu dirumuskan ulang)
+    graph_builder.add_node("speculative_retriever", retrieve_node)
+    graph_builder.add_node("intent_router", join_branches)
+    graph_builder.add_node("speculative_router", join_speculative_retrieval)
+    if settings.RERANK_ENABLED:
+        graph_builder.add_node("reranker", rerank_context)
     graph_builder.add_node("llm_generator", generate_general_answer)
 
-    # Tambahkan edge awal
-    graph_builder.add_edge(START, "classifier")
+    # Classifier tidak bergantung pada contextualize/retrieval, jadi keduanya dijalankan paralel:
+    # - ada history  : classifier || contextualize, lalu retriever jika intent general
+    # - tanpa history: classifier || retrieval spekulatif, hasil dibuang jika intent tracking
+    # Mode "fused": satu panggilan router+rewriter menggantikan classifier & contextualize
+    def fan_out(state):
+        if state.get("intent") == "faq":
+            return END
+        if pipeline_mode(state) == "fused":
+            return "fused_router"
+        if state.get("conversation_history"):
+            return ["classifier", "contextualize"]
+        return ["classifier", "speculative_retriever"]
 
-    # Kondisional edge dari classifier
+    fan_out_targets = ["fused_router", "classifier", "contextualize", "speculative_retriever", END]
+    if settings.FAQ_FAST_PATH_ENABLED:
+        # FAQ fast path dulu, selebihnya fan-out
+        graph_builder.add_edge(START, "faq_matcher")
+        graph_builder.add_conditional_edges("faq_matcher", fan_out, fan_out_targets)
+    else:
+        graph_builder.add_conditional_edges(START, fan_out, fan_out_targets)
+
+    # Join cabang paralel, lalu routing berdasarkan intent
     def route_intent(state):
-        intent = state.get("intent", "general")
-        if intent in ["tracking", "tracking_pending_number"]: 
-            return "tracking_handler"
-        else:
-            return "contextualize" # Arahkan ke contextualize, tidak langsung retriever
+        return "tracking_handler" if is_tracking_intent(state) else "general"
 
+    graph_builder.add_edge(["classifier", "contextualize"], "intent_router")
     graph_builder.add_conditional_edges(
-        "classifier",
+        "intent_router",
         route_intent,
-        {
-            "tracking_handler": "tracking_handler",
-            "contextualize": "contextualize"
-        }
+        {"tracking_handler": "tracking_handler", "general": "retriever"}
     )
-    
-    # Alur General: Contextualize -> Retriever -> LLM
-    graph_builder.add_edge("contextualize", "retriever")
-    graph_builder.add_edge("retriever", "llm_generator")
+    graph_builder.add_conditional_edges(
+        "fused_router",
+        route_intent,
+        {"tracking_handler": "tracking_handler", "general": "retriever"}
+    )
+    graph_builder.add_edge(["classifier", "speculative_retriever"], "speculative_router")
+    graph_builder.add_conditional_edges(
+        "speculative_router",
+        route_intent,
+        {"tracking_handler": "tracking_handler", "general": after_retrieval}
+    )
+
+    # Alur General: Retriever -> (Reranker) -> LLM
+    graph_builder.add_edge("retriever", after_retrieval)
+    if settings.RERANK_ENABLED:
+        graph_builder.add_edge("reranker", "llm_generator")
     
     # Alur Tracking: Selesai di handler
     graph_builder.add_edge("tracking_handler", END)
@@ -244,4 +470,4 @@ def create_conversation_graph(retriever): # Terima retriever sebagai parameter
     graph = graph_builder.compile()
     logger.info("LangGraph compiled.")
     print("LangGraph compiled.")
-    return graph
\ No newline at end of file
+    return graph
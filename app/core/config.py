@@ -18,19 +18,81 @@ class Settings(BaseSettings):
     OLLAMA_LLM_MODEL_NAME: str = os.getenv("OLLAMA_LLM_MODEL_NAME", "")
     OLLAMA_EMBEDDING_MODEL_NAME: str = os.getenv("OLLAMA_EMBEDDING_MODEL_NAME", "bge-m3:latest")
 
+    # Cache embedding (LRU + TTL di depan model embedding)
+    EMBEDDING_CACHE_SIZE: int = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+    EMBEDDING_CACHE_TTL_SECONDS: float = float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", "3600"))
+
     # Laravel API
     LARAVEL_API_BASE_URL: str = os.getenv("LARAVEL_API_BASE_URL", "http://127.0.0.1:8002/api")
     LARAVEL_PUBLIC_URL: str = os.getenv("LARAVEL_PUBLIC_URL", "")
     LARAVEL_API_TIMEOUT: int = int(os.getenv("LARAVEL_API_TIMEOUT", "30"))
     LARAVEL_API_TOKEN: str = os.getenv("LARAVEL_API_TOKEN", "token")
+    # Unduhan PDF: client HTTP bersama (pooled) + cache di disk (ETag/Last-Modified)
+    HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "10"))
+    HTTP_DOWNLOAD_TIMEOUT: float = float(os.getenv("HTTP_DOWNLOAD_TIMEOUT", "60"))
+    DOWNLOAD_CACHE_DIR: str = os.getenv("DOWNLOAD_CACHE_DIR", "./download_cache")
 
     # ChromaDB
     CHROMA_PERSIST_DIR: str = os.getenv("CHROMA_PERSIST_DIR", "./vector_store_db_llm_rag")
     CHROMA_COLLECTION_NAME: str = os.getenv("CHROMA_COLLECTION_NAME", "faq_document_vector")
 
+    # BM25 (index keyword yang dipersist & di-mmap di samping direktori Chroma)
+    BM25_INDEX_DIR: str = os.getenv("BM25_INDEX_DIR", f"{CHROMA_PERSIST_DIR}_bm25")
+    BM25_PERSIST_DELAY_SECONDS: float = float(os.getenv("BM25_PERSIST_DELAY_SECONDS", "30"))
+    # Interval tiap worker mengecek pointer koleksi aktif (blue/green swap oleh worker lain); 0 = nonaktif
+    ACTIVE_COLLECTION_POLL_SECONDS: float = float(os.getenv("ACTIVE_COLLECTION_POLL_SECONDS", "5"))
+    # Pipeline ingestion bertahap: jumlah worker per stage & kapasitas antrean antar stage
+    INGEST_DOWNLOAD_CONCURRENCY: int = int(os.getenv("INGEST_DOWNLOAD_CONCURRENCY", "4"))
+    INGEST_EXTRACT_CONCURRENCY: int = int(os.getenv("INGEST_EXTRACT_CONCURRENCY", "2"))
+    INGEST_SPLIT_CONCURRENCY: int = int(os.getenv("INGEST_SPLIT_CONCURRENCY", "2"))
+    INGEST_EMBED_CONCURRENCY: int = int(os.getenv("INGEST_EMBED_CONCURRENCY", "2"))
+    INGEST_UPSERT_CONCURRENCY: int = int(os.getenv("INGEST_UPSERT_CONCURRENCY", "1"))
+    INGEST_QUEUE_SIZE: int = int(os.getenv("INGEST_QUEUE_SIZE", "8"))
+    # Jumlah proses untuk ekstraksi + split PDF (0 = pakai thread, tanpa process pool)
+    PDF_PROCESS_WORKERS: int = int(os.getenv("PDF_PROCESS_WORKERS", "2"))
+
+    # Ukuran chunk: "chars" (chunk_size/overlap dalam karakter) atau "tokens" (tiktoken)
+    CHUNK_SIZE_MODE: str = os.getenv("CHUNK_SIZE_MODE", "chars")
+    CHUNK_SIZE_TOKENS: int = int(os.getenv("CHUNK_SIZE_TOKENS", "400"))
+    CHUNK_OVERLAP_TOKENS: int = int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))
+    TOKEN_ENCODING: str = os.getenv("TOKEN_ENCODING", "cl100k_base")
+    # Batas token konteks dokumen di prompt jawaban, diterapkan oleh pack_context (0 = tanpa batas)
+    CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+    # Rerank + prune hasil retriever sebelum LLM (cosine ke query, dedup antar chunk)
+    RERANK_ENABLED: bool = os.getenv("RERANK_ENABLED", "true").lower() == "true"
+    RERANK_MAX_DOCS: int = int(os.getenv("RERANK_MAX_DOCS", "4"))
+    RERANK_DEDUP_THRESHOLD: float = float(os.getenv("RERANK_DEDUP_THRESHOLD", "0.95"))
+    RERANK_MIN_SCORE: float = float(os.getenv("RERANK_MIN_SCORE", "0.0"))
+    RERANK_TIMEOUT_SECONDS: float = float(os.getenv("RERANK_TIMEOUT_SECONDS", "1.5"))
+    # Cache jawaban semantik (pertanyaan tanpa riwayat, di-invalidate saat FAQ/dokumen berubah)
+    ANSWER_CACHE_ENABLED: bool = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_THRESHOLD: float = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+    ANSWER_CACHE_SIZE: int = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+    ANSWER_CACHE_TTL_SECONDS: float = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+    # Fast path FAQ: pertanyaan yang (hampir) sama persis dengan FAQ dijawab tanpa LLM
+    FAQ_FAST_PATH_ENABLED: bool = os.getenv("FAQ_FAST_PATH_ENABLED", "true").lower() == "true"
+    FAQ_MATCH_MAX_DISTANCE: int = int(os.getenv("FAQ_MATCH_MAX_DISTANCE", "2"))
+    FAQ_MATCH_MIN_FUZZY_LENGTH: int = int(os.getenv("FAQ_MATCH_MIN_FUZZY_LENGTH", "12"))
+    # Pipeline percakapan: "staged" (classifier + contextualize terpisah) atau "fused"
+    # (satu panggilan LLM untuk intent + pertanyaan mandiri + nomor registrasi)
+    PIPELINE_MODE: str = os.getenv("PIPELINE_MODE", "staged")
+    # Klasifikasi intent berbasis aturan sebelum LLM (LLM hanya untuk pesan ambigu)
+    INTENT_RULES_ENABLED: bool = os.getenv("INTENT_RULES_ENABLED", "true").lower() == "true"
+
+    # Store embedding content-addressed (SQLite) agar refresh hanya meng-embed chunk yang berubah
+    EMBEDDING_STORE_PATH: str = os.getenv("EMBEDDING_STORE_PATH", f"{CHROMA_PERSIST_DIR}_embeddings.sqlite3")
+
     # AI Provider
     LLM_PROVIDER: str = os.getenv("LLM_PROVIDER", "google_genai")
     EMBEDDING_PROVIDER: str = os.getenv("EMBEDDING_PROVIDER", "ollama")
+    # Batas waktu satu panggilan LLM di graph percakapan (detik)
+    LLM_TIMEOUT_SECONDS: float = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+    # Maksimum panggilan LLM bersamaan per model (juga ukuran pool koneksi keep-alive)
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    # History percakapan: hanya N giliran (pasangan user+assistant) terakhir yang diambil dari DB;
+    # pesan yang lebih lama diringkas ke ChatSession.history_summary secara bertahap
+    HISTORY_MAX_TURNS: int = int(os.getenv("HISTORY_MAX_TURNS", "3"))
+    HISTORY_SUMMARY_ENABLED: bool = os.getenv("HISTORY_SUMMARY_ENABLED", "true").lower() == "true"
 
     # Redis
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379")
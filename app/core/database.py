@@ -1,4 +1,5 @@
 import contextlib
+import logging
 from typing import AsyncIterator
 
 from sqlalchemy.ext.asyncio import (
@@ -6,10 +7,12 @@ from sqlalchemy.ext.asyncio import (
     async_sessionmaker,
     create_async_engine,
 )
-from sqlalchemy import select, text
+from sqlalchemy import inspect, select, text
 from sqlalchemy.orm import declarative_base
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
 # Create async engine
 # For MySQL, we use pool_size and max_overflow
 # For SQLite, we need check_same_thread=False
@@ -41,11 +44,29 @@ AsyncSessionLocal = async_sessionmaker(
 
 Base = declarative_base()
 
+def _add_missing_columns(sync_conn) -> None:
+    """
+    create_all tidak mengubah tabel yang sudah ada; kolom nullable yang ditambahkan
+    ke model setelahnya (misal chat_sessions.history_summary) ditambahkan di sini.
+    """
+    inspector = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=sync_conn.dialect)
+            sync_conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            logger.info(f"✅ Column added: {table.name}.{column.name}")
+
 async def init_db() -> None:
     """Initialize database tables and seed initial data."""
     async with engine.begin() as conn:
         # Create all tables
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
     
     # Seed admin user
     from app.models.domain import User
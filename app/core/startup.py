@@ -3,12 +3,17 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.services.vector_store.vector_store_service import (
     initialize_vector_store,
-    get_retriever
+    get_retriever,
+    watch_active_collection
 )
+from app.services.vector_store.pdf_processing import shutdown_process_pool
+from app.services.api_client import close_http_client
+from app.services.faq_index import rebuild_faq_index
 from app.chains.conversation_chain import create_conversation_graph
 from app.core.config import settings
 from app.core.database import init_db
 import app.models.domain as domain_models
+import asyncio
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +36,7 @@ async def lifespan(app: FastAPI):
         # Initialize SQLite DB schemas
         await init_db()
         logger.info("Database schemas initialized.")
+        await rebuild_faq_index()
         await initialize_vector_store(
             force_refresh=False, 
             persist_directory=settings.CHROMA_PERSIST_DIR, 
@@ -43,10 +49,21 @@ async def lifespan(app: FastAPI):
         logger.error(f"Startup failed: {e}")
         raise
 
+    # Worker lain bisa menjalankan reindex blue/green; ikuti pointer koleksi aktifnya
+    watcher = None
+    if settings.ACTIVE_COLLECTION_POLL_SECONDS > 0:
+        watcher = asyncio.create_task(
+            watch_active_collection(on_swap=lambda retriever: set_graph(create_conversation_graph(retriever)))
+        )
+
     yield
 
     logger.info("Shutting down LLM RAG Service...")
     print("Shutting down LLM RAG Service...")
+    if watcher is not None:
+        watcher.cancel()
+    shutdown_process_pool()
+    await close_http_client()
 
 async def init_graph():
     """
@@ -66,7 +66,8 @@ class User(Base):
     role = Column(String(50), default="user") # admin / user
     created_at = Column(DateTime, default=now_wib)
 
-    sessions = relationship("ChatSession", back_populates="user", cascade="all, delete-orphan", lazy="selectin")
+    # Tidak dimuat otomatis (get_current_user dipanggil tiap request); pakai selectinload jika perlu
+    sessions = relationship("ChatSession", back_populates="user", cascade="all, delete-orphan", lazy="raise")
 
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
@@ -74,11 +75,15 @@ class ChatSession(Base):
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     title = Column(String(255), nullable=True)
+    history_summary = Column(Text, nullable=True)  # Ringkasan bergulir pesan di luar jendela history
+    summary_message_id = Column(Integer, nullable=True)  # ID pesan terakhir yang sudah masuk ringkasan
     created_at = Column(DateTime, default=now_wib)
     updated_at = Column(DateTime, default=now_wib, onupdate=now_wib)
 
     user = relationship("User", back_populates="sessions")
-    messages = relationship("ChatMessage", back_populates="session", cascade="all, delete-orphan", lazy="selectin")
+    # Tidak dimuat otomatis: history diambil terbatas lewat get_recent_messages,
+    # detail sesi memakai selectinload eksplisit, pesan dihapus di delete_chat_session
+    messages = relationship("ChatMessage", back_populates="session", cascade="all, delete-orphan", lazy="raise", passive_deletes=True)
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
@@ -4,11 +4,13 @@ from typing_extensions import TypedDict
 
 class State(TypedDict):
     question: str
+    standalone_question: Optional[str]  # Pertanyaan hasil contextualize (jika ada history)
     context: List[Document]
     answer: str
 
     # --- Untuk percakapan ---
     conversation_history: List[dict] # Riwayat percakapan
+    history_summary: Optional[str]  # Ringkasan percakapan sebelum jendela conversation_history
     user_id: Optional[str]          # ID sesi pengguna
     
     # --- Untuk pelacakan dokumen ---
@@ -17,3 +19,5 @@ class State(TypedDict):
     tracking_data: Optional[dict]   # Data status dari API Laravel
     category: Optional[str]         # Kategori pertanyaan (KTP, KK, dll)
     is_eval: Optional[bool]         # Switch untuk pengujian evaluasi (jawaban singkat)
+    pipeline_mode: Optional[str]    # 'staged' / 'fused'; override PIPELINE_MODE per pemanggilan (A/B)
+    stream: Optional[bool]          # True untuk /chat/stream (jawaban teks biasa, bukan JSON)
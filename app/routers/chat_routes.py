@@ -1,8 +1,8 @@
-from fastapi import APIRouter, HTTPException, Depends, Request
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Depends, Request, BackgroundTasks
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from app.core.database import get_db
+from app.core.database import get_db, AsyncSessionLocal
 from app.core.auth import get_current_user
 from app.models.domain import User, ChatSession, ChatMessage
 from app.schemas.chat import ChatRequest, ChatSessionResponse, ChatMessageResponse, ChatSessionWithMessages, ChatSessionBase
@@ -10,23 +10,122 @@ from app.services.chat_service import (
     create_chat_session, 
     save_chat_message, 
     get_user_sessions, 
-    get_session_messages,
+    get_conversation_context,
+    history_window_size,
     update_chat_session,
-    delete_chat_session
+    delete_chat_session,
+    refresh_session_title,
+    refresh_history_summary
 )
 from app.core.startup import get_graph
+from app.chains.conversation_chain import AnswerStreamFilter
+from app.services.answer_cache import get_answer_cache, is_cacheable_question, embed_question
 from app.models.state import State
-from typing import List
+from typing import List, Optional, Tuple
+import asyncio
+import json
 import logging
 import time
 
 router = APIRouter(prefix="/chat", tags=["Chatbot"])
 logger = logging.getLogger(__name__)
 
+# Node graph yang token LLM-nya diteruskan ke klien /chat/stream
+STREAMED_NODES = {"llm_generator", "tracking_handler"}
+
+async def _resolve_session_id(db: AsyncSession, current_user: User, request_body: ChatRequest) -> Tuple[str, Optional[str]]:
+    """(session_id, judul placeholder jika sesi baru dibuat, None jika sesi lama)."""
+    session_id = request_body.session_id
+    if not session_id:
+        session = await create_chat_session(db, current_user.id, request_body.message)
+        return session.id, session.title
+    # Verify session belongs to user
+    session = await db.get(ChatSession, session_id)
+    if not session or session.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session_id, None
+
+async def _load_history(db: AsyncSession, session_id: str) -> Tuple[List[dict], Optional[str]]:
+    """History terbatas (HISTORY_MAX_TURNS giliran terakhir) + ringkasan bergulir pesan yang lebih lama."""
+    return await get_conversation_context(db, session_id)
+
+def _schedule_history_summary(background_tasks: BackgroundTasks, session_id: str, history: List[dict]) -> None:
+    # Setelah giliran ini (+2 pesan) ada pesan yang keluar jendela history -> ringkas setelah response
+    if len(history) + 2 > history_window_size():
+        background_tasks.add_task(refresh_history_summary, session_id)
+
+def _initial_state(question: str, history: List[dict], user_id: str, stream: bool = False, summary: Optional[str] = None) -> State:
+    return {
+        "question": question,
+        "context": [],
+        "answer": "",
+        "conversation_history": history,
+        "history_summary": summary,
+        "user_id": user_id,
+        "intent": "unknown",
+        "tracking_number": None,
+        "tracking_data": None,
+        "category": None,
+        "is_eval": False,
+        "stream": stream
+    }
+
+async def _lookup_cached_answer(question: str, history: List[dict]):
+    """Semantic answer cache: (jawaban cache atau None, vektor pertanyaan, generasi cache)."""
+    answer_cache = get_answer_cache()
+    generation = answer_cache.generation
+    if not is_cacheable_question(question, history):
+        return None, None, generation
+    try:
+        vector = await embed_question(question)
+        cached = answer_cache.lookup(vector) if vector is not None else None
+    except Exception as e:
+        logger.warning(f"Answer cache lookup failed: {e}")
+        return None, None, generation
+    if cached is not None:
+        logger.info(f"Answer cache hit ({cached.similarity:.3f}): '{question}' ~ '{cached.question}'")
+    return cached, vector, generation
+
+def _store_cached_answer(vector, generation: int, question: str, intent: str, answer: str, category: str, retrieved_docs: List[str]):
+    # Hanya jawaban jalur general yang disimpan (tracking bergantung data live)
+    if vector is not None and intent == "general" and answer:
+        get_answer_cache().store(
+            vector,
+            question,
+            {"answer": answer, "category": category, "retrieved_docs": retrieved_docs},
+            generation,
+        )
+
+class ClientDisconnected(Exception):
+    pass
+
+async def _run_until_disconnected(request: Request, coro, poll_interval: float = 0.5):
+    """
+    Jalankan `coro` sebagai task dan batalkan jika klien memutus koneksi, agar graph
+    (dan panggilan LLM di dalamnya) tidak terus berjalan untuk jawaban yang tidak dibaca.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 @router.post("", response_class=JSONResponse)
 @router.post("/", response_class=JSONResponse)
 async def chatbot_endpoint(
     request_body: ChatRequest, 
+    request: Request,
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -34,51 +133,62 @@ async def chatbot_endpoint(
     if not graph:
         raise HTTPException(status_code=503, detail="Service not ready")
 
-    # 1. Handle Session
-    session_id = request_body.session_id
-    if not session_id:
-        session = await create_chat_session(db, current_user.id, request_body.message)
-        session_id = session.id
-    else:
-        # Verify session belongs to user
-        session = await db.get(ChatSession, session_id)
-        if not session or session.user_id != current_user.id:
-            raise HTTPException(status_code=404, detail="Session not found")
-
-    # 2. Get history for LangGraph
-    history_messages = await get_session_messages(db, session_id)
-    langchain_history = []
-    for m in history_messages:
-        langchain_history.append({"role": m.role, "content": m.content})
+    # 1. Handle Session (sesi baru memakai judul placeholder; judul LLM dibuat setelah response terkirim)
+    session_id, new_title = await _resolve_session_id(db, current_user, request_body)
+    if new_title is not None:
+        background_tasks.add_task(refresh_session_title, session_id, request_body.message)
+    title_fields = {"title": new_title, "title_pending": True} if new_title is not None else {}
+
+    # 2. Get history for LangGraph (N giliran terakhir + ringkasan)
+    langchain_history, history_summary = await _load_history(db, session_id)
+    _schedule_history_summary(background_tasks, session_id, langchain_history)
 
     # 3. Save User Message
     await save_chat_message(db, session_id, "user", request_body.message)
 
-    # 4. Invoke RAG Graph
-    state: State = {
-        "question": request_body.message,
-        "context": [],
-        "answer": "",
-        "conversation_history": langchain_history,
-        "user_id": str(current_user.id),
-        "intent": "unknown",
-        "tracking_number": None,
-        "tracking_data": None,
-        "category": None,
-        "is_eval": False
-    }
+    # 4. Semantic answer cache: pertanyaan berulang tanpa riwayat dijawab dari cache
+    start_time = time.time()
+    cached, cache_vector, cache_generation = await _lookup_cached_answer(request_body.message, langchain_history)
+    if cached is not None:
+        duration = time.time() - start_time
+        payload = cached.payload
+        await save_chat_message(
+            db,
+            session_id,
+            "assistant",
+            payload["answer"],
+            retrieved_docs=payload["retrieved_docs"],
+            response_time=duration,
+            category=payload["category"]
+        )
+        return JSONResponse(content={
+            "session_id": session_id,
+            "response": payload["answer"],
+            "intent": "general",
+            "category": payload["category"],
+            "retrieved_docs": payload["retrieved_docs"],
+            "response_time": duration,
+            "cached": True,
+            **title_fields
+        })
+
+    # 5. Invoke RAG Graph
+    state = _initial_state(request_body.message, langchain_history, str(current_user.id), summary=history_summary)
 
     try:
-        start_time = time.time()
-        final_state = await graph.ainvoke(state)
+        final_state = await _run_until_disconnected(request, graph.ainvoke(state))
         end_time = time.time()
         duration = end_time - start_time
 
         answer = final_state.get("answer", "Maaf, belum bisa menjawab.")
         retrieved_docs = [doc.page_content for doc in final_state.get("context", [])]
         category = final_state.get("category", "Umum")
+        _store_cached_answer(
+            cache_vector, cache_generation, request_body.message,
+            final_state.get("intent"), answer, category, retrieved_docs
+        )
         
-        # 5. Save Assistant Message with response_time and category
+        # 6. Save Assistant Message with response_time and category
         await save_chat_message(
             db, 
             session_id, 
@@ -95,12 +205,146 @@ async def chatbot_endpoint(
             "intent": final_state.get("intent", "general"),
             "category": final_state.get("category", "Umum"),
             "retrieved_docs": retrieved_docs,
-            "response_time": duration
+            "response_time": duration,
+            **title_fields
         })
+    except ClientDisconnected:
+        logger.info(f"Client disconnected, chat processing cancelled for session {session_id}")
+        return JSONResponse(status_code=499, content={"detail": "Client disconnected"})
+    except asyncio.TimeoutError:
+        logger.error(f"LLM call timed out for session {session_id}")
+        return JSONResponse(status_code=504, content={"detail": "LLM response timed out"})
     except Exception as e:
         logger.exception("Chat error:")
         return JSONResponse(status_code=500, content={"detail": f"Internal processing error: {str(e)}"})
 
+@router.post("/stream")
+async def chatbot_stream_endpoint(
+    request_body: ChatRequest,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Versi streaming dari /chat (Server-Sent Events). Urutan event:
+    `session` (session_id, title) -> `token` (potongan jawaban, berulang) -> `done`
+    (intent, category, retrieved_docs, response_time, title_pending), atau `error`
+    jika gagal. Untuk sesi baru, event `title` (judul LLM) menyusul setelah `done`.
+    Pesan assistant disimpan setelah stream selesai. Jika klien memutus koneksi,
+    stream (beserta graph dan panggilan LLM yang sedang berjalan) dibatalkan.
+    """
+    graph = get_graph()
+    if not graph:
+        raise HTTPException(status_code=503, detail="Service not ready")
+
+    session_id, new_title = await _resolve_session_id(db, current_user, request_body)
+    langchain_history, history_summary = await _load_history(db, session_id)
+    # Background task dijalankan setelah stream selesai (StreamingResponse.background)
+    _schedule_history_summary(background_tasks, session_id, langchain_history)
+    await save_chat_message(db, session_id, "user", request_body.message)
+
+    start_time = time.time()
+    cached, cache_vector, cache_generation = await _lookup_cached_answer(request_body.message, langchain_history)
+
+    async def event_stream():
+        yield _sse("session", {"session_id": session_id, "title": new_title})
+
+        if cached is not None:
+            payload = cached.payload
+            answer, category, intent = payload["answer"], payload["category"], "general"
+            retrieved_docs = payload["retrieved_docs"]
+            yield _sse("token", {"text": answer})
+        else:
+            state = _initial_state(request_body.message, langchain_history, str(current_user.id), stream=True, summary=history_summary)
+            answer_filter = AnswerStreamFilter()
+            streamed = False
+            final_state = {}
+            try:
+                async for mode, chunk in graph.astream(state, stream_mode=["messages", "values"]):
+                    if await request.is_disconnected():
+                        raise ClientDisconnected()
+                    if mode == "values":
+                        final_state = chunk
+                        continue
+                    message, metadata = chunk
+                    # Hanya token dari node penghasil jawaban (bukan classifier/contextualize)
+                    if metadata.get("langgraph_node") not in STREAMED_NODES or not isinstance(message.content, str):
+                        continue
+                    text = answer_filter.feed(message.content)
+                    if text:
+                        streamed = True
+                        yield _sse("token", {"text": text})
+                text = answer_filter.flush()
+                if text:
+                    streamed = True
+                    yield _sse("token", {"text": text})
+            except ClientDisconnected:
+                # Keluar dari `async for` menutup generator astream -> task graph dibatalkan
+                logger.info(f"Client disconnected, chat stream cancelled for session {session_id}")
+                return
+            except asyncio.CancelledError:
+                # Server membatalkan response (klien terputus saat menulis)
+                logger.info(f"Chat stream cancelled for session {session_id}")
+                raise
+            except asyncio.TimeoutError:
+                logger.error(f"LLM call timed out for session {session_id}")
+                yield _sse("error", {"detail": "LLM response timed out"})
+                return
+            except Exception as e:
+                logger.exception("Chat stream error:")
+                yield _sse("error", {"detail": f"Internal processing error: {str(e)}"})
+                return
+
+            answer = final_state.get("answer") or "Maaf, belum bisa menjawab."
+            category = final_state.get("category") or "Umum"
+            intent = final_state.get("intent", "general")
+            retrieved_docs = [doc.page_content for doc in final_state.get("context") or []]
+            if not streamed:
+                # Jawaban tanpa token LLM (FAQ fast path, permintaan nomor registrasi, dll.)
+                yield _sse("token", {"text": answer})
+            _store_cached_answer(
+                cache_vector, cache_generation, request_body.message,
+                intent, answer, category, retrieved_docs
+            )
+
+        duration = time.time() - start_time
+        # Session request sudah ditutup saat body streaming berjalan; pakai session baru
+        async with AsyncSessionLocal() as stream_db:
+            await save_chat_message(
+                stream_db,
+                session_id,
+                "assistant",
+                answer,
+                retrieved_docs=retrieved_docs,
+                response_time=duration,
+                category=category
+            )
+
+        yield _sse("done", {
+            "session_id": session_id,
+            "intent": intent,
+            "category": category,
+            "retrieved_docs": retrieved_docs,
+            "response_time": duration,
+            "cached": cached is not None,
+            "title_pending": new_title is not None
+        })
+
+        if new_title is not None:
+            # Jawaban sudah lengkap (`done` terkirim); judul dibuat sesudahnya lalu dikabarkan ke UI.
+            # Jika stream berhenti lebih awal (error/disconnect), placeholder tetap dipakai.
+            title = await refresh_session_title(session_id, request_body.message)
+            if title:
+                yield _sse("title", {"session_id": session_id, "title": title})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=background_tasks
+    )
+
 @router.get("/sessions", response_model=List[ChatSessionResponse])
 async def list_sessions(
     db: AsyncSession = Depends(get_db),
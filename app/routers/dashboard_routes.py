@@ -25,9 +25,22 @@ from app.services.vector_store.vector_store_service import (
     update_document_in_vector_store,
     delete_document_from_vector_store
 )
+from app.services.answer_cache import invalidate_answer_cache
+from app.services.faq_index import rebuild_faq_index
 
 router = APIRouter(prefix="/dashboard", tags=["Dashboard CMS"])
 
+
+def _sync_vector_store(background_tasks: BackgroundTasks, func, **kwargs):
+    """
+    Jadwalkan sinkronisasi vector store di background. Cache jawaban di-invalidate
+    sekarang dan sekali lagi setelah sync selesai, agar jawaban yang dihitung dari
+    index lama selama sync tidak tertinggal di cache.
+    """
+    invalidate_answer_cache()
+    background_tasks.add_task(func, **kwargs)
+    background_tasks.add_task(invalidate_answer_cache)
+
 # ==========================================
 # FAQs CRUD
 # ==========================================
@@ -72,9 +85,13 @@ async def create_faq(faq: FaqCreate, background_tasks: BackgroundTasks, db: Asyn
     await db.commit()
     await db.refresh(new_faq)
     
+    # Fast path FAQ memakai data terbaru
+    await rebuild_faq_index()
+
     # Sync with Vector Store
     content = f"Q: {new_faq.question}\nA: {new_faq.answer}"
-    background_tasks.add_task(
+    _sync_vector_store(
+        background_tasks,
         add_faq_to_vector_store,
         content=content,
         metadata={"faq_id": str(new_faq.id), "type": "faq"}
@@ -104,9 +121,13 @@ async def update_faq(faq_id: int, faq: FaqUpdate, background_tasks: BackgroundTa
     await db.commit()
     await db.refresh(db_faq)
     
+    # Fast path FAQ memakai data terbaru
+    await rebuild_faq_index()
+
     # Sync with Vector Store
     content = f"Q: {db_faq.question}\nA: {db_faq.answer}"
-    background_tasks.add_task(
+    _sync_vector_store(
+        background_tasks,
         update_faq_in_vector_store,
         faq_id=str(db_faq.id),
         content=content,
@@ -125,8 +146,12 @@ async def delete_faq(faq_id: int, background_tasks: BackgroundTasks, db: AsyncSe
     await db.delete(faq)
     await db.commit()
     
+    # Fast path FAQ memakai data terbaru
+    await rebuild_faq_index()
+
     # Sync with Vector Store
-    background_tasks.add_task(
+    _sync_vector_store(
+        background_tasks,
         delete_faq_from_vector_store,
         faq_id=str(faq_id)
     )
@@ -200,7 +225,8 @@ async def create_document(
     await db.refresh(new_doc)
     
     # Sync with Vector Store
-    background_tasks.add_task(
+    _sync_vector_store(
+        background_tasks,
         add_document_to_vector_store,
         pdf_url=file_path, 
         metadata={"doc_id": str(new_doc.id), "type": "document", "title": new_doc.title}
@@ -231,7 +257,8 @@ async def update_document(doc_id: int, doc: DocumentUpdate, background_tasks: Ba
     await db.refresh(db_doc)
     
     # Sync with Vector Store
-    background_tasks.add_task(
+    _sync_vector_store(
+        background_tasks,
         update_document_in_vector_store,
         doc_id=str(db_doc.id),
         pdf_url=db_doc.source_path,
@@ -258,7 +285,8 @@ async def delete_document(doc_id: int, background_tasks: BackgroundTasks, db: As
     await db.commit()
     
     # Sync with Vector Store
-    background_tasks.add_task(
+    _sync_vector_store(
+        background_tasks,
         delete_document_from_vector_store,
         doc_id=str(doc_id)
     )
@@ -1,10 +1,12 @@
 # app/routers/vector_routes.py
 
-from fastapi import APIRouter, HTTPException, Security, Body
+from fastapi import APIRouter, HTTPException, Security, Body, Query
 from app.core.auth import verify_api_key
 from app.services.vector_store.vector_store_service import (
+    REFRESH_MODES,
     refresh_vector_store_data,
     get_retriever,
+    get_cache_stats,
     add_faq_to_vector_store,
     update_faq_in_vector_store,
     delete_faq_from_vector_store,
@@ -14,6 +16,8 @@ from app.services.vector_store.vector_store_service import (
 )
 from app.chains.conversation_chain import create_conversation_graph
 from app.core.startup import set_graph
+from app.services.answer_cache import get_answer_cache, invalidate_answer_cache
+from app.services.intent_classifier import get_intent_pre_classifier
 from app.schemas.document import CreateDocumentPayload, UpdateDocumentPayload
 
 import logging
@@ -21,22 +25,48 @@ router = APIRouter(prefix="/vector-store", tags=["Vector Store"])
 logger = logging.getLogger(__name__)
 
 @router.post("/refresh")
-async def refresh_data(api_key: str = Security(verify_api_key)):
+async def refresh_data(
+    mode: str = Query("full", description="'full' (blue/green: koleksi bayangan lalu swap) atau 'reconcile' (diff berbasis ID chunk)"),
+    api_key: str = Security(verify_api_key)
+):
     """
     Refresh vector store & rebuild graph
     """
+    if mode not in REFRESH_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {REFRESH_MODES}")
+
     try:
-        await refresh_vector_store_data()
-        retriever = get_retriever()
-        new_graph = create_conversation_graph(retriever)
-        set_graph(new_graph)  # Update global reference
+        if mode == "full":
+            # Graph ditukar bersamaan dengan vector store & retriever (atomik)
+            result = await refresh_vector_store_data(
+                mode=mode, on_swap=lambda retriever: set_graph(create_conversation_graph(retriever))
+            )
+        else:
+            result = await refresh_vector_store_data(mode=mode)
+            retriever = get_retriever()
+            new_graph = create_conversation_graph(retriever)
+            set_graph(new_graph)  # Update global reference
+        invalidate_answer_cache()
         logger.info("Graph refreshed successfully.")
-        return {"message": "Data and graph refreshed successfully"}
+        return {"message": "Data and graph refreshed successfully", "result": result}
     except Exception as e:
         logger.error(f"Error refreshing data: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/cache-stats")
+async def cache_stats(api_key: str = Security(verify_api_key)):
+    """
+    Statistik hit/miss cache embedding query & cache jawaban semantik, serta seberapa
+    sering klasifikasi intent diputuskan aturan lokal tanpa LLM.
+    """
+    return {
+        **get_cache_stats(),
+        "answers": get_answer_cache().stats(),
+        "intent_rules": get_intent_pre_classifier().stats(),
+    }
+
+
 @router.post("/faqs")
 async def create_faq(payload: dict = Body(...), api_key: str = Security(verify_api_key)):
     content = payload.get("content")
@@ -45,7 +75,9 @@ async def create_faq(payload: dict = Body(...), api_key: str = Security(verify_a
         raise HTTPException(status_code=400, detail="Content is required")
 
     try:
-        return await add_faq_to_vector_store(content, metadata)
+        result = await add_faq_to_vector_store(content, metadata)
+        invalidate_answer_cache()
+        return result
     except Exception as e:
         logger.error(f"Error adding FAQ: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -59,7 +91,9 @@ async def update_faq(faq_id: str, payload: dict = Body(...), api_key: str = Secu
         raise HTTPException(status_code=400, detail="Content is required")
 
     try:
-        return await update_faq_in_vector_store(faq_id, content, metadata)
+        result = await update_faq_in_vector_store(faq_id, content, metadata)
+        invalidate_answer_cache()
+        return result
     except Exception as e:
         logger.error(f"Error updating FAQ {faq_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -68,7 +102,9 @@ async def update_faq(faq_id: str, payload: dict = Body(...), api_key: str = Secu
 @router.delete("/faqs/{faq_id}")
 async def delete_faq(faq_id: str, api_key: str = Security(verify_api_key)):
     try:
-        return await delete_faq_from_vector_store(faq_id)
+        result = await delete_faq_from_vector_store(faq_id)
+        invalidate_answer_cache()
+        return result
     except Exception as e:
         logger.error(f"Error deleting FAQ {faq_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -94,7 +130,9 @@ async def create_document(payload: CreateDocumentPayload, api_key: str = Securit
 
     try:
         # Menggunakan fungsi layanan dokumen yang baru
-        return await add_document_to_vector_store(pdf_url=pdf_url, metadata=metadata)
+        result = await add_document_to_vector_store(pdf_url=pdf_url, metadata=metadata)
+        invalidate_answer_cache()
+        return result
     except Exception as e:
         logger.error(f"Error adding Document: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -121,7 +159,9 @@ async def update_document(
     try:
         # Panggil fungsi layanan update yang akan menerima URL PDF
         # Logika pemrosesan akan dilakukan di dalam update_document_in_vector_store
-        return await update_document_in_vector_store(doc_id, pdf_url, metadata)
+        result = await update_document_in_vector_store(doc_id, pdf_url, metadata)
+        invalidate_answer_cache()
+        return result
     except RuntimeError as e:
         logger.error(f"Runtime error during PDF update for doc {doc_id}: {e}")
         raise HTTPException(status_code=422, detail=str(e))
@@ -137,7 +177,9 @@ async def delete_document(doc_id: str, api_key: str = Security(verify_api_key)):
     """
     try:
         # Menggunakan fungsi layanan dokumen yang baru
-        return await delete_document_from_vector_store(doc_id)
+        result = await delete_document_from_vector_store(doc_id)
+        invalidate_answer_cache()
+        return result
     except Exception as e:
         logger.error(f"Error deleting Document {doc_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
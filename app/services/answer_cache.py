@@ -0,0 +1,143 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.vector_store.base import get_state
+from app.utils.helpers import extract_tracking_number, preprocess_question
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    payload: Dict[str, Any]
+    stored_at: float
+    similarity: float = 1.0
+
+
+class SemanticAnswerCache:
+    """
+    Cache jawaban RAG utuh yang di-key oleh embedding pertanyaan.
+
+    Lookup mencari pertanyaan tersimpan dengan cosine similarity tertinggi; hit jika
+    >= `threshold` dan belum melewati TTL. `invalidate()` mengosongkan cache dan menaikkan
+    generasi, sehingga jawaban yang dihitung sebelum FAQ/dokumen berubah tidak ikut disimpan.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_size: int = 512, ttl_seconds: float = 3600):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None  # (n, dim), sudah dinormalisasi
+        self._entries: List[CachedAnswer] = []
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def _evict_expired(self, now: float) -> None:
+        keep = [i for i, entry in enumerate(self._entries) if now - entry.stored_at <= self.ttl_seconds]
+        if len(keep) == len(self._entries):
+            return
+        self._entries = [self._entries[i] for i in keep]
+        self._vectors = self._vectors[keep] if keep else None
+
+    def lookup(self, vector: List[float]) -> Optional[CachedAnswer]:
+        query = self._normalize(vector)
+        with self._lock:
+            self._evict_expired(time.monotonic())
+            if self._vectors is None or self._vectors.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+            scores = self._vectors @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry = self._entries[best]
+            return CachedAnswer(entry.question, entry.payload, entry.stored_at, float(scores[best]))
+
+    def store(self, vector: List[float], question: str, payload: Dict[str, Any], generation: int) -> bool:
+        """Simpan jawaban; diabaikan jika cache sudah di-invalidate sejak `generation` diambil."""
+        row = self._normalize(vector)
+        with self._lock:
+            if generation != self._generation:
+                return False
+            now = time.monotonic()
+            self._evict_expired(now)
+            if self._vectors is not None and self._vectors.shape[1] != row.shape[0]:
+                # Model embedding berganti: vektor lama tidak sebanding lagi
+                self._vectors, self._entries = None, []
+            self._entries.append(CachedAnswer(question, payload, now))
+            self._vectors = row[None, :] if self._vectors is None else np.vstack([self._vectors, row])
+            if len(self._entries) > self.max_size:
+                # Buang entri tertua
+                overflow = len(self._entries) - self.max_size
+                self._entries = self._entries[overflow:]
+                self._vectors = self._vectors[overflow:]
+            return True
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._vectors = None
+            self._entries = []
+            self._generation += 1
+        logger.info("Semantic answer cache di-invalidate")
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "generation": self._generation,
+            }
+
+
+_answer_cache = SemanticAnswerCache(
+    threshold=settings.ANSWER_CACHE_THRESHOLD,
+    max_size=settings.ANSWER_CACHE_SIZE,
+    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+)
+
+
+def get_answer_cache() -> SemanticAnswerCache:
+    return _answer_cache
+
+
+def invalidate_answer_cache() -> None:
+    """Dipanggil setiap kali FAQ/dokumen berubah (dashboard) atau vector store di-refresh."""
+    _answer_cache.invalidate()
+
+
+def is_cacheable_question(question: str, history: List[dict]) -> bool:
+    """Hanya pertanyaan tanpa riwayat percakapan dan tanpa nomor registrasi (tracking) yang di-cache."""
+    return settings.ANSWER_CACHE_ENABLED and not history and not extract_tracking_number(question)
+
+
+async def embed_question(question: str) -> Optional[List[float]]:
+    """Embedding pertanyaan (lewat cache embedding yang sama dengan retriever)."""
+    embeddings = get_state().embeddings
+    if embeddings is None:
+        return None
+    return await embeddings.aembed_query(preprocess_question(question))
@@ -1,4 +1,4 @@
-import httpx, tempfile, logging
+import asyncio, hashlib, json, httpx, logging
 from app.core.config import settings
 from typing import List, Dict, Any, Optional
 
@@ -13,47 +13,180 @@ from app.services.vector_store.fetcher import fetch_faqs_from_api, fetch_documen
     
 import os
 
-async def download_file_to_temp(relative_url: str, suffix: str = ".pdf") -> str:
-    """
-    Returns the local path if the file exists locally, otherwise downloads it into a temp file.
-    """
-    # 1. Jika URL adalah path lokal yang sudah ada (misal: uploads/file.pdf)
-    if os.path.exists(relative_url):
-        return relative_url
-        
-    temp_path = None
-    
-    # 2. Jika bukan path lokal, asumsikan itu adalah sisa-sisa URL Laravel lama
-    full_url = relative_url
+# =========================================================
+# Unduhan file (PDF) dengan client bersama + cache di disk
+# =========================================================
+
+_http_client: Optional[httpx.AsyncClient] = None
+_download_locks: Dict[str, asyncio.Lock] = {}
+
+CACHE_META_SUFFIX = ".json"
+PARTIAL_SUFFIX = ".part"
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Satu AsyncClient untuk semua unduhan, agar koneksi (keep-alive) ke Laravel dipakai ulang."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=settings.HTTP_DOWNLOAD_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_MAX_CONNECTIONS,
+            ),
+            follow_redirects=True,
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def _resolve_download_url(relative_url: str) -> str:
+    # Jika bukan path lokal, asumsikan itu adalah sisa-sisa URL Laravel lama
     if relative_url.startswith("public/"):
         corrected_url_path = relative_url.replace('public/', 'storage/')
-        full_url = f"{settings.LARAVEL_PUBLIC_URL}/{corrected_url_path}"
-    elif not full_url.startswith("http"):
+        return f"{settings.LARAVEL_PUBLIC_URL}/{corrected_url_path}"
+    if not relative_url.startswith("http"):
         # Jika tidak ada path lokal & bukan URL, berarti ada kesalahan database path
         logger.error(f"File lokal tidak ditemukan dan bukan URL HTTP: {relative_url}")
         raise RuntimeError(f"File tidak ditemukan lokal: {relative_url}")
-    
+    return relative_url
+
+
+def _cache_paths(url: str, suffix: str):
+    """(file cache, metadata cache) untuk sebuah URL. Nama file = hash URL."""
+    name = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    path = os.path.join(settings.DOWNLOAD_CACHE_DIR, f"{name}{suffix}")
+    return path, f"{path}{CACHE_META_SUFFIX}"
+
+
+def _read_cache_meta(meta_path: str) -> Dict[str, Any]:
     try:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.get(full_url)
-            response.raise_for_status() # Raise untuk 4xx/5xx errors
-
-            # Membuat dan menulis ke file temporer
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-            temp_file.write(response.content)
-            temp_file.close()
-            temp_path = temp_file.name
-            
-            logger.info(f"Successfully downloaded file from {full_url} to {temp_path}")
-            return temp_path
-            
-    except httpx.HTTPStatusError as e:
-        logger.error(f"HTTP Error {e.response.status_code} accessing URL: {full_url}")
-        # Angkat Runtime Error untuk ditangani oleh pemanggil
-        raise RuntimeError(f"Gagal mengunduh file: {e}")
-    except Exception as e:
-        logger.exception(f"Error during file download from {full_url}")
-        raise RuntimeError(f"Gagal koneksi atau I/O saat mengunduh: {e}")
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_cache_meta(meta_path: str, meta: Dict[str, Any]) -> None:
+    tmp_path = f"{meta_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+
+def is_cached_download(path: str) -> bool:
+    """True jika `path` berada di cache unduhan (tidak boleh dihapus pemanggil)."""
+    cache_dir = os.path.abspath(settings.DOWNLOAD_CACHE_DIR)
+    return os.path.abspath(path).startswith(cache_dir + os.sep)
+
+
+def release_downloaded_file(path: Optional[str], source: str) -> None:
+    """
+    Bersihkan hasil `download_file_to_temp` setelah dipakai. File uploads lokal dan
+    file di cache unduhan dibiarkan; hanya file temporer yang dihapus.
+    """
+    if not path or path == source or is_cached_download(path):
+        return
+    if os.path.exists(path):
+        os.unlink(path)
+
+
+async def _stream_to_cache(client: httpx.AsyncClient, url: str, cache_path: str, meta_path: str) -> str:
+    """
+    GET kondisional + streaming ke disk.
+      - Cache lengkap dengan ETag/Last-Modified -> If-None-Match/If-Modified-Since (304 = pakai cache).
+      - Ada file .part dari unduhan yang terputus -> lanjutkan dengan Range + If-Range.
+    Body tidak pernah ditampung utuh di memori.
+    """
+    meta = _read_cache_meta(meta_path)
+    partial_path = f"{cache_path}{PARTIAL_SUFFIX}"
+    validator = meta.get("etag") or meta.get("last_modified")
+
+    request_headers = {}
+    if meta.get("complete") and os.path.exists(cache_path):
+        if meta.get("etag"):
+            request_headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            request_headers["If-Modified-Since"] = meta["last_modified"]
+    offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+    if offset and validator and not request_headers:
+        request_headers["Range"] = f"bytes={offset}-"
+        request_headers["If-Range"] = validator
+
+    async with client.stream("GET", url, headers=request_headers) as response:
+        if response.status_code == 304:
+            logger.info(f"File tidak berubah (304), memakai cache: {url}")
+            return cache_path
+        response.raise_for_status()
+
+        resumed = response.status_code == 206
+        mode = "ab" if resumed else "wb"
+        # Simpan validator sebelum streaming agar unduhan yang terputus bisa dilanjutkan
+        meta = {
+            "url": url,
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+            "complete": False,
+        }
+        _write_cache_meta(meta_path, meta)
+
+        with open(partial_path, mode) as f:
+            async for chunk in response.aiter_bytes(STREAM_CHUNK_SIZE):
+                f.write(chunk)
+
+    os.replace(partial_path, cache_path)
+    meta["complete"] = True
+    _write_cache_meta(meta_path, meta)
+    logger.info(
+        f"Successfully downloaded file from {url} to {cache_path}"
+        + (f" (resumed from byte {offset})" if resumed else "")
+    )
+    return cache_path
+
+
+async def download_file_to_temp(relative_url: str, suffix: str = ".pdf") -> str:
+    """
+    Returns the local path if the file exists locally, otherwise downloads it into the
+    download cache (keyed by URL, revalidated with ETag/Last-Modified).
+    Bersihkan hasilnya dengan `release_downloaded_file`, bukan os.unlink langsung.
+    """
+    # 1. Jika URL adalah path lokal yang sudah ada (misal: uploads/file.pdf)
+    if os.path.exists(relative_url):
+        return relative_url
+
+    # 2. URL Laravel (lama) -> unduh ke cache
+    full_url = _resolve_download_url(relative_url)
+    os.makedirs(settings.DOWNLOAD_CACHE_DIR, exist_ok=True)
+    cache_path, meta_path = _cache_paths(full_url, suffix)
+
+    # Satu unduhan per URL pada satu waktu (refresh & update bisa meminta file yang sama)
+    lock = _download_locks.setdefault(full_url, asyncio.Lock())
+    async with lock:
+        try:
+            return await _stream_to_cache(get_http_client(), full_url, cache_path, meta_path)
+
+        except httpx.HTTPStatusError as e:
+            logger.error(f"HTTP Error {e.response.status_code} accessing URL: {full_url}")
+            if e.response.status_code == 416:
+                # Range tidak valid lagi: buang file parsial agar percobaan berikutnya mulai dari awal
+                partial_path = f"{cache_path}{PARTIAL_SUFFIX}"
+                if os.path.exists(partial_path):
+                    os.unlink(partial_path)
+            # Angkat Runtime Error untuk ditangani oleh pemanggil
+            raise RuntimeError(f"Gagal mengunduh file: {e}")
+        except Exception as e:
+            if _read_cache_meta(meta_path).get("complete") and os.path.exists(cache_path):
+                logger.warning(f"Gagal revalidasi {full_url} ({e}), memakai salinan cache")
+                return cache_path
+            logger.exception(f"Error during file download from {full_url}")
+            raise RuntimeError(f"Gagal koneksi atau I/O saat mengunduh: {e}")
 
 
 
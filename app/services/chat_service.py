@@ -1,30 +1,61 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import delete, select, update
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
 from app.models.domain import ChatSession, ChatMessage, User
-from app.services.llm_service import get_llm_model
+from app.services.llm_service import get_llm_model, llm_concurrency
 from langchain_core.messages import HumanMessage
+from app.utils.prompt_templates import history_summary_prompt
+from typing import List, Optional, Tuple
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
-async def create_chat_session(db: AsyncSession, user_id: int, initial_message: str = None) -> ChatSession:
-    title = "New Chat"
-    if initial_message:
-        try:
-            llm = get_llm_model()
-            prompt = f"Buatlah judul singkat (maksimal 5 kata) untuk percakapan yang dimulai dengan pesan ini: '{initial_message}'. Berikan hanya judulnya saja tanpa tanda kutip."
-            response = await llm.ainvoke([HumanMessage(content=prompt)])
-            title = response.content.strip().replace('"', '')
-        except Exception as e:
-            logger.error(f"Failed to generate chat title: {e}")
-            title = initial_message[:30] + "..." if len(initial_message) > 30 else initial_message
+def placeholder_title(initial_message: str) -> str:
+    """Judul sementara dari potongan pesan pertama, dipakai sampai judul LLM selesai dibuat."""
+    message = " ".join(initial_message.split())
+    return message[:30] + "..." if len(message) > 30 else message
 
+async def create_chat_session(db: AsyncSession, user_id: int, initial_message: str = None) -> ChatSession:
+    # Judul LLM dibuat di luar request (lihat refresh_session_title), bukan di sini
+    title = placeholder_title(initial_message) if initial_message else "New Chat"
     session = ChatSession(user_id=user_id, title=title)
     db.add(session)
     await db.commit()
     # await db.refresh(session) # Removed to avoid potential MissingGreenlet issues
     return session
 
+async def generate_chat_title(initial_message: str) -> str:
+    llm = get_llm_model()  # client bersama dari registry, tidak dibuat ulang per sesi
+    prompt = f"Buatlah judul singkat (maksimal 5 kata) untuk percakapan yang dimulai dengan pesan ini: '{initial_message}'. Berikan hanya judulnya saja tanpa tanda kutip."
+    async with llm_concurrency():
+        response = await asyncio.wait_for(
+            llm.ainvoke([HumanMessage(content=prompt)]), timeout=settings.LLM_TIMEOUT_SECONDS
+        )
+    return response.content.strip().replace('"', '')[:255]
+
+async def refresh_session_title(session_id: str, initial_message: str) -> Optional[str]:
+    """
+    Buat judul sesi dengan LLM dan simpan (background task setelah jawaban dikirim).
+    Judul hanya diganti jika masih berupa placeholder (belum diubah user lewat PUT /session).
+    Mengembalikan judul baru, atau None jika gagal/tidak diganti.
+    """
+    try:
+        title = await generate_chat_title(initial_message)
+    except Exception as e:
+        logger.error(f"Failed to generate chat title: {e}")
+        return None
+    if not title:
+        return None
+    async with AsyncSessionLocal() as db:
+        session = await db.get(ChatSession, session_id)
+        if not session or session.title != placeholder_title(initial_message):
+            return None
+        session.title = title
+        await db.commit()
+    return title
+
 async def save_chat_message(db: AsyncSession, session_id: str, role: str, content: str, retrieved_docs: list = None, response_time: float = None, category: str = None):
     message = ChatMessage(
         session_id=session_id,
@@ -54,6 +85,103 @@ async def get_session_messages(db: AsyncSession, session_id: str):
     )
     return result.scalars().all()
 
+def history_window_size() -> int:
+    """Jumlah pesan yang dimuat sebagai history (HISTORY_MAX_TURNS giliran user+assistant)."""
+    return max(settings.HISTORY_MAX_TURNS, 0) * 2
+
+async def get_recent_messages(db: AsyncSession, session_id: str, limit: int) -> List[ChatMessage]:
+    """`limit` pesan terakhir sesi (urut lama -> baru); dibatasi di SQL, bukan di Python."""
+    if limit <= 0:
+        return []
+    result = await db.execute(
+        select(ChatMessage)
+        .where(ChatMessage.session_id == session_id)
+        .order_by(ChatMessage.id.desc())
+        .limit(limit)
+    )
+    return list(reversed(result.scalars().all()))
+
+async def get_conversation_context(db: AsyncSession, session_id: str) -> Tuple[List[dict], Optional[str]]:
+    """(history jendela terakhir untuk State, ringkasan bergulir pesan yang lebih lama)."""
+    messages = await get_recent_messages(db, session_id, history_window_size())
+    summary = None
+    if settings.HISTORY_SUMMARY_ENABLED:
+        summary = (await db.execute(
+            select(ChatSession.history_summary).where(ChatSession.id == session_id)
+        )).scalar_one_or_none()
+    return [{"role": m.role, "content": m.content} for m in messages], summary
+
+async def refresh_history_summary(session_id: str) -> Optional[str]:
+    """
+    Gabungkan pesan yang sudah keluar dari jendela history (dan belum diringkas) ke
+    ChatSession.history_summary. Inkremental: tiap giliran hanya pesan yang baru keluar
+    jendela yang dikirim ke LLM. Dijalankan sebagai background task setelah jawaban disimpan.
+    """
+    if not settings.HISTORY_SUMMARY_ENABLED:
+        return None
+    try:
+        async with AsyncSessionLocal() as db:
+            session = await db.get(ChatSession, session_id)
+            if not session:
+                return None
+            # Pesan tertua di dalam jendela history; pesan sebelum ID ini sudah di luar jendela
+            boundary_id = (await db.execute(
+                select(ChatMessage.id)
+                .where(ChatMessage.session_id == session_id)
+                .order_by(ChatMessage.id.desc())
+                .offset(max(history_window_size() - 1, 0))
+                .limit(1)
+            )).scalar_one_or_none()
+            if boundary_id is None:
+                return None
+            last_summarized = session.summary_message_id or 0
+            result = await db.execute(
+                select(ChatMessage)
+                .where(
+                    ChatMessage.session_id == session_id,
+                    ChatMessage.id > last_summarized,
+                    ChatMessage.id < boundary_id,
+                )
+                .order_by(ChatMessage.id.asc())
+            )
+            pending = result.scalars().all()
+            if not pending:
+                return None
+
+            conversation = "\n".join(f"{m.role}: {m.content}" for m in pending)
+            llm = get_llm_model()
+            async with llm_concurrency():
+                response = await asyncio.wait_for(
+                    (history_summary_prompt | llm).ainvoke({
+                        "summary": session.history_summary or "Belum ada ringkasan.",
+                        "conversation": conversation,
+                    }),
+                    timeout=settings.LLM_TIMEOUT_SECONDS,
+                )
+            summary = response.content.strip()
+            if not summary:
+                return None
+
+            # Compare-and-set: lewati jika ringkasan sudah diperbarui task lain sementara LLM berjalan
+            updated = await db.execute(
+                update(ChatSession)
+                .where(ChatSession.id == session_id)
+                .where(
+                    ChatSession.summary_message_id == session.summary_message_id
+                    if session.summary_message_id is not None
+                    else ChatSession.summary_message_id.is_(None)
+                )
+                .values(history_summary=summary, summary_message_id=pending[-1].id)
+            )
+            await db.commit()
+            if not updated.rowcount:
+                return None
+            logger.info(f"History summary updated for session {session_id} (+{len(pending)} messages)")
+            return summary
+    except Exception as e:
+        logger.error(f"Failed to update history summary: {e}")
+        return None
+
 async def update_chat_session(db: AsyncSession, session_id: str, title: str):
     session = await db.get(ChatSession, session_id)
     if session:
@@ -64,8 +192,8 @@ async def update_chat_session(db: AsyncSession, session_id: str, title: str):
 async def delete_chat_session(db: AsyncSession, session_id: str):
     session = await db.get(ChatSession, session_id)
     if session:
-        # Messages usually deleted by cascade, but let's be explicit if needed
-        # Or depend on FK cascade in DB
+        # Messages dihapus eksplisit dengan satu DELETE (relasi tidak dimuat, passive_deletes)
+        await db.execute(delete(ChatMessage).where(ChatMessage.session_id == session_id))
         await db.delete(session)
         await db.commit()
         return True
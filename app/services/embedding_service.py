@@ -1,10 +1,137 @@
 from langchain_ollama import OllamaEmbeddings
+from langchain_core.embeddings import Embeddings
+import asyncio
 import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
 from app.core.config import settings
+from app.utils.helpers import preprocess_question
+from app.services.llm_service import http_client_kwargs
 
 logger = logging.getLogger(__name__)
 
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wrapper Embeddings dengan cache LRU + TTL untuk embedding query.
+
+    Key cache = (nama model, teks yang sudah dinormalisasi `preprocess_question`),
+    sehingga pertanyaan berulang ("syarat KTP?" / "Syarat ktp") tidak memicu
+    panggilan HTTP embedding lagi. Embedding dokumen tidak melewati cache ini (chunk
+    yang hanya beda huruf/tanda baca tidak boleh berbagi vektor, dan reindex tidak
+    boleh mengusir query populer); vektor chunk disimpan di EmbeddingStore.
+    """
+
+    def __init__(self, underlying: Embeddings, model_name: str, max_size: int = 2048, ttl_seconds: float = 3600):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, text: str) -> Tuple[str, str]:
+        return (self.model_name, preprocess_question(text))
+
+    def _get(self, key: Tuple[str, str]) -> Optional[List[float]]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                stored_at, vector = entry
+                if time.monotonic() - stored_at <= self.ttl_seconds:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                del self._cache[key]
+            self.misses += 1
+            return None
+
+    def _put(self, key: Tuple[str, str], vector: List[float]) -> None:
+        with self._lock:
+            self._cache[key] = (time.monotonic(), vector)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "model": self.model_name,
+                "size": len(self._cache),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    # --- Query ---
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        vector = self._get(key)
+        if vector is None:
+            vector = self.underlying.embed_query(text)
+            self._put(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        vector = self._get(key)
+        if vector is not None:
+            return vector
+
+        # Gabungkan permintaan identik yang sedang berjalan (single-flight). Panggilan model
+        # berjalan di task sendiri: pemanggil yang dibatalkan (klien terputus) tidak ikut
+        # membatalkan embedding yang ditunggu pemanggil lain.
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._embed_query_and_store(key, text))
+            # Ambil exception walau semua pemanggil sudah batal, agar tidak ada warning "never retrieved"
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _embed_query_and_store(self, key: Tuple[str, str], text: str) -> List[float]:
+        try:
+            vector = await self.underlying.aembed_query(text)
+            self._put(key, vector)
+            return vector
+        finally:
+            self._inflight.pop(key, None)
+
+    # --- Documents (tanpa cache; lihat embed_texts_with_store / EmbeddingStore) ---
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.underlying.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.underlying.aembed_documents(texts)
+
+
+_embeddings_model = None
+_embeddings_lock = threading.Lock()
+
+
 def get_embeddings_model():
+    """Model embedding bersama (dibuat sekali per proses, dipakai ulang saat re-inisialisasi)."""
+    global _embeddings_model
+    with _embeddings_lock:
+        if _embeddings_model is None:
+            _embeddings_model = _build_embeddings_model()
+        return _embeddings_model
+
+
+def _build_embeddings_model():
     print("Initializing Ollama embeddings model uy...")
     logger.info("Initializing Ollama embeddings model...")
 
@@ -12,8 +139,16 @@ def get_embeddings_model():
     # Pastikan model ini sudah di-pull di Ollama
     embeddings = OllamaEmbeddings(
         model=settings.OLLAMA_EMBEDDING_MODEL_NAME, # Contoh: "nomic-embed-text"
-        base_url=settings.OLLAMA_BASE_URL # Contoh: "http://localhost:11434"
+        base_url=settings.OLLAMA_BASE_URL, # Contoh: "http://localhost:11434"
+        client_kwargs=http_client_kwargs(),
     )
     logger.info("Ollama embeddings model initialized.")
     print("embedding model berjalan ✅")
-    return embeddings
\ No newline at end of file
+
+    # Bungkus dengan cache LRU agar query berulang tidak memanggil Ollama lagi
+    return CachedEmbeddings(
+        embeddings,
+        model_name=settings.OLLAMA_EMBEDDING_MODEL_NAME,
+        max_size=settings.EMBEDDING_CACHE_SIZE,
+        ttl_seconds=settings.EMBEDDING_CACHE_TTL_SECONDS,
+    )
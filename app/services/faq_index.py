@@ -0,0 +1,190 @@
+import logging
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set
+
+from app.core.config import settings
+from app.services.vector_store.fetcher import fetch_all_faqs
+from app.utils.helpers import preprocess_question
+
+logger = logging.getLogger(__name__)
+
+# Kategori FAQ ditebak dari kata kunci pertanyaan (sama dengan daftar kategori di general_rag_prompt)
+_CATEGORY_PATTERNS = [
+    ("Akta Kelahiran", re.compile(r"\b(akta|akte)\s+(kelahiran|lahir)\b")),
+    ("Akta Kematian", re.compile(r"\b(akta|akte)\s+(kematian|mati)\b")),
+    ("Pindah Datang", re.compile(r"\b(pindah|datang|skpwni)\b")),
+    ("KIA", re.compile(r"\b(kia|kartu identitas anak)\b")),
+    ("KK", re.compile(r"\b(kk|kartu keluarga)\b")),
+    ("KTP", re.compile(r"\b(ktp|e ktp|ektp|kartu tanda penduduk)\b")),
+]
+
+
+# Token yang menentukan dokumen/layanan yang ditanyakan; fuzzy match tidak boleh mengubahnya
+_DOCUMENT_KEYWORDS = {
+    "ktp", "ektp", "kk", "kia", "akta", "akte", "kelahiran", "lahir", "kematian", "mati",
+    "pindah", "datang", "skpwni", "perkawinan", "perceraian", "kartu", "keluarga", "anak",
+}
+
+
+def normalize_question(text: str) -> str:
+    """Normalisasi pertanyaan untuk pencocokan FAQ (huruf kecil, tanpa tanda baca, spasi tunggal)."""
+    return preprocess_question(text or "")
+
+
+def guess_category(normalized_question: str) -> str:
+    for category, pattern in _CATEGORY_PATTERNS:
+        if pattern.search(normalized_question):
+            return category
+    return "Umum"
+
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def bounded_edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance a-b, berhenti lebih awal (mengembalikan limit + 1) jika > `limit`."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        for j, char_b in enumerate(b, start=1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            )
+            row_min = min(row_min, current[j])
+        if row_min > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def is_safe_fuzzy_match(question: str, candidate: str, max_distance: int) -> bool:
+    """
+    Fuzzy match hanya untuk salah ketik: jumlah token harus sama dan setiap token yang
+    berbeda hanya boleh berubah sebagian (bukan diganti utuh) serta bukan kata kunci
+    dokumen. "biaya ktp" vs "biaya kk" ditolak walau jarak editnya kecil.
+    """
+    question_tokens, candidate_tokens = question.split(), candidate.split()
+    if len(question_tokens) != len(candidate_tokens):
+        return False
+    if guess_category(question) != guess_category(candidate):
+        return False
+    for token_a, token_b in zip(question_tokens, candidate_tokens):
+        if token_a == token_b:
+            continue
+        if token_a in _DOCUMENT_KEYWORDS or token_b in _DOCUMENT_KEYWORDS:
+            return False
+        if bounded_edit_distance(token_a, token_b, max_distance) >= min(len(token_a), len(token_b)):
+            return False
+    return True
+
+
+@dataclass(frozen=True)
+class FaqEntry:
+    faq_id: str
+    question: str
+    answer: str
+    category: str
+    normalized: str
+
+
+class FaqIndex:
+    """
+    Index pertanyaan FAQ ternormalisasi di memori.
+
+    `match` mencari exact match dulu; jika tidak ada, kandidat diambil dari index trigram
+    lalu dicek dengan edit distance (<= `max_distance`) dan is_safe_fuzzy_match (hanya
+    salah ketik, bukan penggantian kata kunci dokumen seperti KTP/KK/KIA). Index tidak diubah setelah dibangun;
+    rebuild membuat instance baru lalu ditukar, sehingga aman dibaca tanpa lock.
+    """
+
+    def __init__(self, entries: Iterable[FaqEntry] = (), max_distance: int = 2, min_fuzzy_length: int = 12):
+        self.max_distance = max_distance
+        self.min_fuzzy_length = min_fuzzy_length
+        self._exact: Dict[str, FaqEntry] = {}
+        self._entries: List[FaqEntry] = []
+        self._trigram_index: Dict[str, List[int]] = {}
+        for entry in entries:
+            if not entry.normalized or entry.normalized in self._exact:
+                continue
+            self._exact[entry.normalized] = entry
+            position = len(self._entries)
+            self._entries.append(entry)
+            for gram in _trigrams(entry.normalized):
+                self._trigram_index.setdefault(gram, []).append(position)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def match(self, question: str) -> Optional[FaqEntry]:
+        normalized = normalize_question(question)
+        if not normalized:
+            return None
+        entry = self._exact.get(normalized)
+        if entry is not None or self.max_distance <= 0 or len(normalized) < self.min_fuzzy_length:
+            return entry
+
+        # Satu edit mengubah paling banyak 3 trigram, jadi kandidat valid berbagi
+        # setidaknya len(trigram) - 3 * max_distance trigram dengan pertanyaan
+        grams = _trigrams(normalized)
+        shared: Dict[int, int] = {}
+        for gram in grams:
+            for position in self._trigram_index.get(gram, ()):
+                shared[position] = shared.get(position, 0) + 1
+        required = len(grams) - 3 * self.max_distance
+        candidates = sorted(
+            (position for position, count in shared.items() if count >= required),
+            key=lambda position: -shared[position],
+        )
+
+        best, best_distance = None, self.max_distance + 1
+        for position in candidates:
+            candidate = self._entries[position]
+            distance = bounded_edit_distance(normalized, candidate.normalized, best_distance - 1)
+            if distance < best_distance and is_safe_fuzzy_match(normalized, candidate.normalized, self.max_distance):
+                best, best_distance = candidate, distance
+                if distance == 0:
+                    break
+        return best
+
+
+def build_faq_index(faqs: Iterable[Dict]) -> FaqIndex:
+    entries = []
+    for faq in faqs:
+        question, answer = faq.get("question") or "", faq.get("answer") or ""
+        normalized = normalize_question(question)
+        if not normalized or not answer.strip():
+            continue
+        entries.append(FaqEntry(
+            faq_id=str(faq.get("id")),
+            question=question,
+            answer=answer.strip(),
+            category=guess_category(normalized),
+            normalized=normalized,
+        ))
+    return FaqIndex(entries, max_distance=settings.FAQ_MATCH_MAX_DISTANCE, min_fuzzy_length=settings.FAQ_MATCH_MIN_FUZZY_LENGTH)
+
+
+_faq_index = FaqIndex()
+
+
+def get_faq_index() -> FaqIndex:
+    return _faq_index
+
+
+async def rebuild_faq_index() -> FaqIndex:
+    """Bangun ulang index dari tabel Faq (dipanggil saat startup dan setiap CRUD FAQ)."""
+    global _faq_index
+    faqs = (await fetch_all_faqs()).get("data", [])
+    _faq_index = build_faq_index(faqs)
+    logger.info(f"FAQ index dibangun ulang: {len(_faq_index)} pertanyaan")
+    return _faq_index
@@ -0,0 +1,80 @@
+import logging
+import re
+import threading
+from typing import Dict, Optional, Tuple
+
+from app.utils.helpers import extract_tracking_number, preprocess_question
+
+logger = logging.getLogger(__name__)
+
+# Kata kunci dari intent_classification_prompt + variasi yang sering muncul di chat.
+# Dicocokkan pada teks hasil preprocess_question (huruf kecil, tanpa tanda baca);
+# akhiran "-nya"/"-kah" ikut diterima ("syaratnya", "bagaimanakah").
+_TRACKING_CUES = re.compile(
+    r"\b("
+    r"cek status|status (dokumen|permohonan|pengajuan|berkas)|sampai mana|sudah sampai|"
+    r"sudah jadi|sudah selesai|lacak|melacak|tracking|progres|progress|posisi (dokumen|berkas)"
+    r")(?:nya|kah)?\b"
+)
+_GENERAL_CUES = re.compile(
+    r"\b("
+    r"syarat|persyaratan|cara|bagaimana|prosedur|langkah|berapa lama|berapa hari|biaya|"
+    r"tarif|gratis|jam (buka|kerja|operasional|pelayanan)|buka|tutup|lokasi|alamat|"
+    r"di ?mana|apa itu|apa saja|dokumen apa|bisakah|bolehkah|dasar hukum"
+    r")(?:nya|kah)?\b"
+)
+
+
+def score_intent(question: str) -> Tuple[int, int]:
+    """Jumlah sinyal (tracking, general) pada pertanyaan; nomor registrasi dihitung sinyal tracking."""
+    text = preprocess_question(question or "")
+    tracking = len(_TRACKING_CUES.findall(text))
+    general = len(_GENERAL_CUES.findall(text))
+    if extract_tracking_number(text):
+        tracking += 1
+    return tracking, general
+
+
+class IntentPreClassifier:
+    """
+    Tier klasifikasi intent lokal di depan LLM.
+
+    Pesan yang sinyalnya jelas ('tracking' atau 'general') diputuskan langsung dari
+    kata kunci dan nomor registrasi, hanya jika tidak ada sinyal dari intent lawan.
+    Pesan ambigu (sinyal campuran atau tanpa sinyal) mengembalikan None agar classify_intent
+    memakai LLM. Menyimpan hitungan keputusan untuk memantau tingkat short-circuit.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {"tracking": 0, "general": 0, "llm_fallback": 0}
+
+    def classify(self, question: str) -> Optional[str]:
+        tracking, general = score_intent(question)
+        if tracking and not general:
+            intent = "tracking"
+        elif general and not tracking:
+            intent = "general"
+        else:
+            intent = None
+        with self._lock:
+            self._counts[intent or "llm_fallback"] += 1
+        return intent
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            counts = dict(self._counts)
+        total = sum(counts.values())
+        short_circuit = counts["tracking"] + counts["general"]
+        return {
+            **counts,
+            "total": total,
+            "short_circuit_rate": round(short_circuit / total, 4) if total else 0.0,
+        }
+
+
+_pre_classifier = IntentPreClassifier()
+
+
+def get_intent_pre_classifier() -> IntentPreClassifier:
+    return _pre_classifier
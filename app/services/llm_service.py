@@ -1,12 +1,62 @@
 # app/services/llm_service.py
 
+import asyncio
 import logging
+import threading
+from typing import Any, Dict, Tuple
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Registry client model per proses: (provider, nama model) -> instance yang dipakai bersama
+_models: Dict[Tuple[str, str], Any] = {}
+_models_lock = threading.Lock()
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+
+def http_client_kwargs() -> Dict[str, Any]:
+    """Opsi httpx untuk client Ollama: pool koneksi keep-alive seukuran batas konkurensi model."""
+    import httpx
+    limit = max(settings.LLM_MAX_CONCURRENCY, 1)
+    return {"limits": httpx.Limits(max_connections=limit, max_keepalive_connections=limit)}
+
+
+def _llm_model_name(provider: str) -> str:
+    if provider == "google":
+        return settings.GOOGLE_LLM_MODEL_NAME
+    return settings.OLLAMA_LLM_MODEL_NAME
+
+
 def get_llm_model():
+    """
+    Client LLM bersama: dibuat sekali per (provider, model) lalu dipakai ulang di seluruh
+    proses, sehingga koneksi HTTP/TLS ke provider juga dipakai ulang antar request.
+    """
     provider = settings.LLM_PROVIDER.lower()
+    key = (provider, _llm_model_name(provider))
+    with _models_lock:
+        llm = _models.get(key)
+        if llm is None:
+            llm = _build_llm_model(provider)
+            _models[key] = llm
+    return llm
+
+
+def get_model_semaphore(model_name: str, limit: int) -> asyncio.Semaphore:
+    """Semaphore per model untuk membatasi jumlah panggilan yang berjalan bersamaan."""
+    semaphore = _semaphores.get(model_name)
+    if semaphore is None:
+        semaphore = _semaphores[model_name] = asyncio.Semaphore(max(limit, 1))
+    return semaphore
+
+
+def llm_concurrency() -> asyncio.Semaphore:
+    """Batas konkurensi LLM aktif (LLM_MAX_CONCURRENCY), dipakai dengan `async with`."""
+    provider = settings.LLM_PROVIDER.lower()
+    return get_model_semaphore(f"{provider}:{_llm_model_name(provider)}", settings.LLM_MAX_CONCURRENCY)
+
+
+def _build_llm_model(provider: str):
 
     if provider == "google":
         print("Initializing Google LLM model...")
@@ -30,6 +80,7 @@ def get_llm_model():
             model=settings.OLLAMA_LLM_MODEL_NAME,
             base_url=settings.OLLAMA_BASE_URL,
             temperature=0.1,
+            client_kwargs=http_client_kwargs(),
         )
         logger.info("Ollama LLM model initialized.")
     else:
@@ -12,6 +12,8 @@ class _VectorState:
         self._vector_store = None
         self._retriever = None
         self._embeddings = None
+        self._bm25_index = None
+        self._embedding_store = None
         self._initialized = False
         self._lock = asyncio.Lock()  # protect rebuilds
 
@@ -39,6 +41,22 @@ class _VectorState:
     def embeddings(self, e):
         self._embeddings = e
 
+    @property
+    def bm25_index(self):
+        return self._bm25_index
+
+    @bm25_index.setter
+    def bm25_index(self, index):
+        self._bm25_index = index
+
+    @property
+    def embedding_store(self):
+        return self._embedding_store
+
+    @embedding_store.setter
+    def embedding_store(self, store):
+        self._embedding_store = store
+
     @property
     def initialized(self):
         return self._initialized
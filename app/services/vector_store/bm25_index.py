@@ -0,0 +1,272 @@
+# app/services/vector_store/bm25_index.py
+
+import logging
+import math
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.services.vector_store.bm25_store import MmapSegment, open_segment, write_segment
+from app.utils.helpers import preprocess_question
+
+logger = logging.getLogger(__name__)
+
+# Field metadata yang menjadi identitas sumber sebuah chunk
+KEY_FIELDS = (("faq_id", "faq"), ("doc_id", "doc"))
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokenisasi yang sama untuk dokumen dan query (lowercase, tanpa tanda baca)."""
+    return preprocess_question(text or "").split()
+
+
+def index_key(metadata: Optional[Dict]) -> Optional[str]:
+    """
+    Bangun key index dari metadata chunk, misal {"faq_id": "3"} -> "faq:3".
+    Mengembalikan None jika chunk tidak punya faq_id / doc_id.
+    """
+    metadata = metadata or {}
+    for field, prefix in KEY_FIELDS:
+        value = metadata.get(field)
+        if value not in (None, ""):
+            return f"{prefix}:{value}"
+    return None
+
+
+class BM25Index:
+    """
+    Inverted index BM25 yang bisa di-update per sumber (faq_id / doc_id).
+
+    Index terdiri dari dua bagian:
+      - segmen dasar read-only (`MmapSegment`) yang dibaca dari disk via mmap, dan
+      - segmen in-memory untuk chunk yang ditambahkan setelahnya.
+    Chunk segmen dasar yang dihapus hanya ditandai (tombstone) dan df-nya dikoreksi
+    lewat forward index, sehingga add/remove hanya menyentuh term milik chunk yang
+    berubah. `save` memadatkan kedua segmen menjadi segmen dasar yang baru.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, base: Optional[MmapSegment] = None):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._docs: Dict[int, Document] = {}
+        self._doc_terms: Dict[int, Counter] = {}
+        self._doc_len: Dict[int, int] = {}
+        self._key_slots: Dict[Optional[str], List[int]] = {}
+        self._free_slots: List[int] = []  # slot in-memory yang sudah dihapus, dipakai ulang oleh add
+        self._total_len = 0
+
+        # Segmen dasar (mmap) + koreksi akibat penghapusan
+        self._base = base
+        self._base_alive = np.ones(base.n_docs if base is not None else 0, dtype=bool)
+        self._base_live = len(self._base_alive)
+        self._base_df_removed: Counter = Counter()
+        self._base_total_len = 0
+        self._next_slot = 0
+        if base is not None:
+            self._base_total_len = base.total_len
+            self._next_slot = base.n_docs
+            for key, start, end in base.key_ranges:
+                self._key_slots[key] = list(range(start, end))
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[Document], **kwargs) -> "BM25Index":
+        index = cls(**kwargs)
+        grouped: Dict[Optional[str], List[Document]] = {}
+        for doc in documents:
+            grouped.setdefault(index_key(doc.metadata), []).append(doc)
+        for key, docs in grouped.items():
+            index.add(key, docs)
+        return index
+
+    @classmethod
+    def load(cls, directory: str, fingerprint: Optional[str] = None) -> Optional["BM25Index"]:
+        """Buka index dari disk (mmap). None jika tidak ada atau fingerprint tidak cocok."""
+        segment = open_segment(directory, expected_fingerprint=fingerprint)
+        if segment is None:
+            return None
+        return cls(k1=segment.manifest.get("k1", 1.5), b=segment.manifest.get("b", 0.75), base=segment)
+
+    @property
+    def fingerprint(self) -> Optional[str]:
+        return self._base.fingerprint if self._base is not None else None
+
+    def __len__(self) -> int:
+        return self._base_live + len(self._docs)
+
+    def keys(self) -> List[Optional[str]]:
+        with self._lock:
+            return list(self._key_slots)
+
+    def _is_base(self, slot: int) -> bool:
+        return self._base is not None and slot < self._base.n_docs
+
+    def _document(self, slot: int) -> Document:
+        if self._is_base(slot):
+            return self._base.document(slot)
+        return self._docs[slot]
+
+    def add(self, key: Optional[str], documents: Iterable[Document]) -> int:
+        """Tambahkan chunk untuk `key`. Biaya sebanding dengan jumlah token chunk baru."""
+        added = 0
+        with self._lock:
+            slots = self._key_slots.setdefault(key, [])
+            for doc in documents:
+                terms = Counter(tokenize(doc.page_content))
+                if self._free_slots:
+                    slot = self._free_slots.pop()
+                else:
+                    slot = self._next_slot
+                    self._next_slot += 1
+
+                self._docs[slot] = doc
+                self._doc_terms[slot] = terms
+                length = sum(terms.values())
+                self._doc_len[slot] = length
+                self._total_len += length
+                for term, tf in terms.items():
+                    self._postings.setdefault(term, {})[slot] = tf
+                slots.append(slot)
+                added += 1
+        return added
+
+    def remove(self, key: Optional[str]) -> int:
+        """Hapus semua chunk milik `key`. Mengembalikan jumlah chunk yang dihapus."""
+        with self._lock:
+            slots = self._key_slots.pop(key, [])
+            for slot in slots:
+                if self._is_base(slot):
+                    self._remove_base_slot(slot)
+                    continue
+                terms = self._doc_terms.pop(slot)
+                for term in terms:
+                    postings = self._postings.get(term)
+                    if postings is None:
+                        continue
+                    postings.pop(slot, None)
+                    if not postings:
+                        del self._postings[term]
+                self._total_len -= self._doc_len.pop(slot)
+                del self._docs[slot]
+                self._free_slots.append(slot)
+            return len(slots)
+
+    def _remove_base_slot(self, slot: int) -> None:
+        if not self._base_alive[slot]:
+            return
+        self._base_alive[slot] = False
+        self._base_live -= 1
+        term_ids, _ = self._base.doc_term_items(slot)
+        self._base_df_removed.update(term_ids.tolist())
+        self._base_total_len -= int(self._base.doc_len[slot])
+
+    def replace(self, key: Optional[str], documents: Iterable[Document]) -> int:
+        """Ganti semua chunk milik `key` dengan `documents` secara atomik."""
+        documents = list(documents)
+        with self._lock:
+            self.remove(key)
+            return self.add(key, documents)
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[Document, float]]:
+        """
+        Kembalikan top-k (Document, skor BM25) dengan skor > 0.
+
+        Postings semua term query dikumpulkan menjadi satu larik (slot, tf, bobot IDF),
+        lalu skor dihitung sekaligus dengan satu sparse mat-vec (`np.bincount` atas slot
+        unik yang cocok, bukan seluruh ruang slot) dan top-k dipilih dengan
+        `np.argpartition` tanpa mengurutkan seluruh korpus.
+        """
+        query_terms = tokenize(query)
+        if not query_terms or k <= 0:
+            return []
+
+        with self._lock:
+            n_docs = len(self)
+            if n_docs == 0:
+                return []
+            total_len = self._base_total_len + self._total_len
+            avgdl = total_len / n_docs if total_len else 1.0
+
+            slot_parts, tf_parts, len_parts, weight_parts = [], [], [], []
+            for term, qtf in Counter(query_terms).items():
+                postings = self._postings.get(term) or {}
+                df = len(postings)
+
+                base_tid = self._base.term_id(term) if self._base is not None else None
+                if base_tid is not None:
+                    df += int(self._base.df[base_tid]) - self._base_df_removed.get(base_tid, 0)
+                if df <= 0:
+                    continue
+                # IDF ala Lucene (selalu positif, tidak butuh rata-rata IDF global)
+                weight = qtf * math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+
+                if base_tid is not None:
+                    start, end = self._base.post_indptr[base_tid], self._base.post_indptr[base_tid + 1]
+                    slots = np.asarray(self._base.post_docs[start:end], dtype=np.int64)
+                    slot_parts.append(slots)
+                    tf_parts.append(np.asarray(self._base.post_tf[start:end], dtype=np.float64))
+                    len_parts.append(np.asarray(self._base.doc_len[slots], dtype=np.float64))
+                    weight_parts.append(np.full(len(slots), weight))
+                if postings:
+                    slots = np.fromiter(postings.keys(), dtype=np.int64, count=len(postings))
+                    slot_parts.append(slots)
+                    tf_parts.append(np.fromiter(postings.values(), dtype=np.float64, count=len(postings)))
+                    len_parts.append(np.fromiter((self._doc_len[s] for s in postings), dtype=np.float64, count=len(postings)))
+                    weight_parts.append(np.full(len(slots), weight))
+
+            if not slot_parts:
+                return []
+            slots = np.concatenate(slot_parts)
+            tfs = np.concatenate(tf_parts)
+            norms = self.k1 * (1.0 - self.b + self.b * np.concatenate(len_parts) / avgdl)
+            contrib = np.concatenate(weight_parts) * tfs * (self.k1 + 1.0) / (tfs + norms)
+
+            # Skor per slot unik yang muncul di postings (ukuran sebanding hasil, bukan riwayat slot)
+            matched, inverse = np.unique(slots, return_inverse=True)
+            scores = np.bincount(inverse, weights=contrib, minlength=len(matched))
+            n_base = len(self._base_alive)
+            if n_base:
+                in_base = matched < n_base
+                scores[in_base] *= self._base_alive[matched[in_base]]
+
+            candidates = np.flatnonzero(scores > 0)
+            if len(candidates) > k:
+                candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            top = candidates[np.argsort(-scores[candidates], kind="stable")]
+            return [(self._document(int(matched[i])), float(scores[i])) for i in top]
+
+    def save(self, directory: str, fingerprint: Optional[str] = None) -> None:
+        """Padatkan semua chunk yang masih hidup dan tulis sebagai segmen mmap baru."""
+        with self._lock:
+            records = []
+            for key, slots in self._key_slots.items():
+                for slot in slots:
+                    if self._is_base(slot):
+                        if not self._base_alive[slot]:
+                            continue
+                        term_ids, tfs = self._base.doc_term_items(slot)
+                        counts = {self._base.vocab[t]: tf for t, tf in zip(term_ids.tolist(), tfs.tolist())}
+                        doc = self._base.document(slot)
+                    else:
+                        counts = dict(self._doc_terms[slot])
+                        doc = self._docs[slot]
+                    records.append((key, doc.page_content, doc.metadata, counts))
+        write_segment(directory, records, fingerprint=fingerprint, k1=self.k1, b=self.b)
+
+
+class BM25IndexRetriever(BaseRetriever):
+    """Retriever LangChain di atas BM25Index; index bisa berubah tanpa membangun ulang retriever."""
+
+    index: BM25Index
+    k: int = 4
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return [doc for doc, _ in self.index.search(query, self.k)]
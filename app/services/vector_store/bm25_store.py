@@ -0,0 +1,236 @@
+# app/services/vector_store/bm25_store.py
+
+import json
+import logging
+import os
+import shutil
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+KEYS_FILE = "keys.json"
+
+
+class _StringTable(Sequence):
+    """Tabel string UTF-8 di atas blob + offsets yang di-memory-map (decode per item)."""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        start, end = self._offsets[i], self._offsets[i + 1]
+        return self._blob[start:end].tobytes().decode("utf-8")
+
+
+def _pack_strings(values: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        offsets[1:] = np.cumsum([len(e) for e in encoded])
+    blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return blob, offsets
+
+
+class MmapSegment:
+    """
+    Segmen BM25 read-only hasil `write_segment`, dibuka dengan np.load(mmap_mode="r").
+    Beberapa worker uvicorn yang membuka direktori yang sama berbagi page cache.
+
+    Layout (semua array .npy):
+      - vocab_blob/vocab_offsets : daftar term terurut (lookup dengan binary search)
+      - df                       : document frequency per term
+      - post_indptr/post_docs/post_tf : postings CSR per term (term -> slot, tf)
+      - doc_indptr/doc_terms/doc_tf   : forward index per slot (slot -> term id, tf)
+      - doc_len                  : panjang (jumlah token) tiap slot
+      - text_*/meta_*            : isi chunk dan metadata JSON per slot
+    """
+
+    def __init__(self, directory: str, manifest: Dict):
+        self.directory = directory
+        self.manifest = manifest
+
+        def _load(name: str) -> np.ndarray:
+            return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+
+        self.vocab = _StringTable(_load("vocab_blob"), _load("vocab_offsets"))
+        self.df = _load("df")
+        self.post_indptr = _load("post_indptr")
+        self.post_docs = _load("post_docs")
+        self.post_tf = _load("post_tf")
+        self.doc_indptr = _load("doc_indptr")
+        self.doc_terms = _load("doc_terms")
+        self.doc_tf = _load("doc_tf")
+        self.doc_len = _load("doc_len")
+        self._texts = _StringTable(_load("text_blob"), _load("text_offsets"))
+        self._metas = _StringTable(_load("meta_blob"), _load("meta_offsets"))
+
+        with open(os.path.join(directory, KEYS_FILE), "r", encoding="utf-8") as f:
+            self.key_ranges: List[Tuple[Optional[str], int, int]] = [tuple(r) for r in json.load(f)]
+
+    @property
+    def n_docs(self) -> int:
+        return len(self.doc_len)
+
+    @property
+    def total_len(self) -> int:
+        return int(self.manifest.get("total_len", 0))
+
+    @property
+    def fingerprint(self) -> Optional[str]:
+        return self.manifest.get("fingerprint")
+
+    def term_id(self, term: str) -> Optional[int]:
+        i = bisect_left(self.vocab, term)
+        if i < len(self.vocab) and self.vocab[i] == term:
+            return i
+        return None
+
+    def doc_term_items(self, slot: int) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = self.doc_indptr[slot], self.doc_indptr[slot + 1]
+        return self.doc_terms[start:end], self.doc_tf[start:end]
+
+    def text(self, slot: int) -> str:
+        return self._texts[slot]
+
+    def document(self, slot: int) -> Document:
+        return Document(page_content=self._texts[slot], metadata=json.loads(self._metas[slot]))
+
+
+def read_manifest(directory: str) -> Optional[Dict]:
+    path = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Manifest BM25 tidak bisa dibaca ({path}): {e}")
+        return None
+    if manifest.get("version") != FORMAT_VERSION:
+        return None
+    return manifest
+
+
+def open_segment(directory: str, expected_fingerprint: Optional[str] = None) -> Optional[MmapSegment]:
+    """Buka segmen dari disk. Mengembalikan None jika tidak ada, rusak, atau fingerprint berbeda."""
+    manifest = read_manifest(directory)
+    if manifest is None:
+        return None
+    if expected_fingerprint is not None and manifest.get("fingerprint") != expected_fingerprint:
+        logger.info("Fingerprint index BM25 di disk berbeda dengan koleksi, perlu rebuild.")
+        return None
+    try:
+        return MmapSegment(directory, manifest)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Gagal membuka index BM25 di {directory}: {e}")
+        return None
+
+
+def write_segment(
+    directory: str,
+    records: List[Tuple[Optional[str], str, Dict, Dict[str, int]]],
+    fingerprint: Optional[str] = None,
+    k1: float = 1.5,
+    b: float = 0.75,
+) -> None:
+    """
+    Tulis segmen baru secara atomik ke `directory`.
+
+    records: list (key, text, metadata, term_counts). Record dengan key yang sama
+    ditulis berurutan sehingga setiap key menempati rentang slot yang kontigu.
+    """
+    records = sorted(records, key=lambda r: "" if r[0] is None else r[0])
+
+    vocab = sorted({term for _, _, _, counts in records for term in counts})
+    term_ids = {term: i for i, term in enumerate(vocab)}
+
+    doc_indptr = np.zeros(len(records) + 1, dtype=np.int64)
+    doc_terms_parts, doc_tf_parts = [], []
+    doc_len = np.zeros(len(records), dtype=np.int32)
+    key_ranges: List[List] = []
+    for slot, (key, _, _, counts) in enumerate(records):
+        ids = np.fromiter((term_ids[t] for t in counts), dtype=np.int32, count=len(counts))
+        tfs = np.fromiter(counts.values(), dtype=np.int32, count=len(counts))
+        order = np.argsort(ids)
+        doc_terms_parts.append(ids[order])
+        doc_tf_parts.append(tfs[order])
+        doc_indptr[slot + 1] = doc_indptr[slot] + len(ids)
+        doc_len[slot] = int(tfs.sum())
+        if key_ranges and key_ranges[-1][0] == key:
+            key_ranges[-1][2] = slot + 1
+        else:
+            key_ranges.append([key, slot, slot + 1])
+
+    doc_terms = np.concatenate(doc_terms_parts) if doc_terms_parts else np.zeros(0, dtype=np.int32)
+    doc_tf = np.concatenate(doc_tf_parts) if doc_tf_parts else np.zeros(0, dtype=np.int32)
+    doc_of_entry = np.repeat(np.arange(len(records), dtype=np.int32), np.diff(doc_indptr))
+
+    # Transpose forward index -> postings CSR per term
+    order = np.argsort(doc_terms, kind="stable")
+    df = np.bincount(doc_terms, minlength=len(vocab)).astype(np.int32)
+    post_indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+    post_indptr[1:] = np.cumsum(df)
+
+    vocab_blob, vocab_offsets = _pack_strings(vocab)
+    text_blob, text_offsets = _pack_strings([r[1] for r in records])
+    meta_blob, meta_offsets = _pack_strings(
+        [json.dumps(r[2] or {}, ensure_ascii=False) for r in records]
+    )
+
+    arrays = {
+        "vocab_blob": vocab_blob,
+        "vocab_offsets": vocab_offsets,
+        "df": df,
+        "post_indptr": post_indptr,
+        "post_docs": doc_of_entry[order],
+        "post_tf": doc_tf[order],
+        "doc_indptr": doc_indptr,
+        "doc_terms": doc_terms,
+        "doc_tf": doc_tf,
+        "doc_len": doc_len,
+        "text_blob": text_blob,
+        "text_offsets": text_offsets,
+        "meta_blob": meta_blob,
+        "meta_offsets": meta_offsets,
+    }
+    manifest = {
+        "version": FORMAT_VERSION,
+        "fingerprint": fingerprint,
+        "n_docs": len(records),
+        "n_terms": len(vocab),
+        "total_len": int(doc_len.sum()),
+        "k1": k1,
+        "b": b,
+    }
+
+    # Tulis ke direktori sementara lalu tukar, agar worker lain tidak membaca file setengah jadi.
+    # Worker yang masih me-mmap file lama tetap aman karena inode lama baru dibebaskan saat di-unmap.
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = f"{directory}.tmp-{os.getpid()}"
+    old_dir = f"{directory}.old-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+    with open(os.path.join(tmp_dir, KEYS_FILE), "w", encoding="utf-8") as f:
+        json.dump(key_ranges, f, ensure_ascii=False)
+    # Manifest ditulis terakhir: direktori tanpa manifest dianggap belum lengkap
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+    if os.path.exists(directory):
+        os.replace(directory, old_dir)
+    os.replace(tmp_dir, directory)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    logger.info(f"Index BM25 ditulis ke {directory}: {len(records)} chunk, {len(vocab)} term")
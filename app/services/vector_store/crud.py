@@ -1,21 +1,62 @@
 # app/services/vector_store/crud.py
 
+import asyncio
+import hashlib
 import logging
-from typing import List, Iterable
+import uuid
+from typing import Dict, List, Iterable, Optional, Set
+from langchain_core.documents import Document
 from app.services.vector_store.base import get_state, retry_async
+from app.services.vector_store.bm25_index import KEY_FIELDS, index_key
+from app.services.vector_store.embedding_store import content_key
+from app.services.vector_store.pdf_processing import page_hash_map
 
 logger = logging.getLogger(__name__)
 
-async def _upsert_documents_in_store(docs: Iterable, batch_size: int = 10) -> None:
+def chunk_id(key: Optional[str], chunk_index, content_hash: str) -> str:
+    """
+    ID chunk deterministik dari (sumber + faq_id/doc_id, indeks chunk, hash konten).
+    `key` berbentuk "faq:<id>" / "doc:<id>" sehingga sudah memuat sumber dan ID-nya.
+    """
+    raw = f"{key or ''}|{chunk_index}|{content_hash}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+def assign_chunk_ids(documents: List) -> List[str]:
+    """
+    Tetapkan `chunk_index`, `content_hash`, dan `doc.id` deterministik untuk setiap chunk.
+    Indeks chunk dihitung per sumber (urutan kemunculan). Idempoten: chunk yang sudah
+    punya `chunk_index` tidak diubah, sehingga retry menghasilkan ID yang sama.
+    """
+    counters = {}
+    ids = []
+    for doc in documents:
+        key = index_key(doc.metadata)
+        position = counters.get(key, 0)
+        counters[key] = position + 1
+
+        # Salin metadata: splitter bisa memakai dict yang sama untuk banyak chunk
+        meta = dict(doc.metadata or {})
+        meta.setdefault("chunk_index", position)
+        meta["content_hash"] = hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()[:16]
+        doc.metadata = meta
+        doc.id = chunk_id(key, meta["chunk_index"], meta["content_hash"])
+        ids.append(doc.id)
+    return ids
+
+async def _upsert_documents_in_store(docs: Iterable, batch_size: int = 10, chroma=None) -> None:
     """
     Upsert documents into vector store in batches.
     Each document is expected to be a langchain Document with metadata.
+    `chroma` defaults to the live vector store (blue/green reindex passes a shadow collection).
     """
     state = get_state()
-    chroma = state.vector_store
+    chroma = chroma or state.vector_store
     if chroma is None:
         raise RuntimeError("Vector store is not initialized")
 
+    docs = list(docs)
+    assign_chunk_ids(docs)
+
     batch = []
     for doc in docs:
         batch.append(doc)
@@ -26,36 +67,135 @@ async def _upsert_documents_in_store(docs: Iterable, batch_size: int = 10) -> No
     if batch:
         await _chroma_upsert(chroma, batch)
 
+def _embedding_model_name(embeddings) -> str:
+    return getattr(embeddings, "model_name", None) or getattr(embeddings, "model", None) or type(embeddings).__name__
+
+async def embed_texts_with_store(texts: List[str]) -> List[List[float]]:
+    """
+    Embed `texts` dengan memakai ulang vektor dari EmbeddingStore (content-addressed).
+    Hanya teks yang hash-nya belum pernah tersimpan yang dikirim ke model embedding.
+    """
+    state = get_state()
+    embeddings = state.embeddings
+    if embeddings is None:
+        raise RuntimeError("Embeddings model is not initialized")
+    store = state.embedding_store
+    model = _embedding_model_name(embeddings)
+
+    keys = [content_key(text, model) for text in texts]
+    found = await asyncio.to_thread(store.get_many, keys) if store is not None else {}
+
+    # Teks identik dalam satu batch cukup di-embed sekali
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in found and key not in missing:
+            missing[key] = text
+    if missing:
+        logger.debug("Embedding %s chunk baru (%s dipakai ulang dari store)", len(missing), len(texts) - len(missing))
+        vectors = await embeddings.aembed_documents(list(missing.values()))
+        computed = dict(zip(missing.keys(), vectors))
+        if store is not None:
+            await asyncio.to_thread(store.put_many, computed, model)
+        found.update(computed)
+    return [found[key] for key in keys]
+
+async def stored_vectors(documents: List) -> Optional[List[List[float]]]:
+    """
+    Vektor chunk yang sudah tersimpan, tanpa memanggil model embedding: dari EmbeddingStore
+    (berdasarkan isi chunk), lalu dari koleksi Chroma (berdasarkan ID chunk) untuk sisanya.
+    Mengembalikan None jika ada chunk yang vektornya tidak ditemukan.
+    """
+    state = get_state()
+    found: Dict[int, List[float]] = {}
+
+    store, embeddings = state.embedding_store, state.embeddings
+    if store is not None and embeddings is not None:
+        model = _embedding_model_name(embeddings)
+        keys = [content_key(doc.page_content, model) for doc in documents]
+        by_key = await asyncio.to_thread(store.get_many, keys)
+        found.update((i, by_key[key]) for i, key in enumerate(keys) if key in by_key)
+
+    missing = [i for i in range(len(documents)) if i not in found and getattr(documents[i], "id", None)]
+    collection = getattr(state.vector_store, "_collection", None)
+    if missing and collection is not None:
+        data = await asyncio.to_thread(
+            collection.get, ids=[documents[i].id for i in missing], include=["embeddings"]
+        )
+        vectors = data.get("embeddings")
+        by_id = dict(zip(data.get("ids") or [], vectors if vectors is not None else []))
+        found.update((i, by_id[documents[i].id]) for i in missing if documents[i].id in by_id)
+
+    if len(found) < len(documents):
+        return None
+    return [found[i] for i in range(len(documents))]
+
 async def _chroma_upsert(chroma, docs: List):
-    import asyncio
     try:
-        upsert = getattr(chroma, "upsert", None)
-        if upsert is None:
+        collection = getattr(chroma, "_collection", None)
+        if collection is None:
             def sync_add():
                 chroma.add_documents(docs)
-            loop = asyncio.get_running_loop()
-            await loop.run_in_executor(None, sync_add)
-        else:
-            if callable(upsert):
-                ret = upsert(docs) 
-                if hasattr(ret, "__await__"):
-                    await ret
-            else:
-                def sync_call():
-                    upsert(docs)
-                loop = asyncio.get_running_loop()
-                await loop.run_in_executor(None, sync_call)
+            await asyncio.to_thread(sync_add)
+            return
+
+        vectors = await embed_texts_with_store([doc.page_content for doc in docs])
+        await _chroma_write(chroma, docs, vectors)
     except Exception as e:
         logger.error("Error upserting to chroma: %s", e)
         raise
 
+async def _chroma_write(chroma, docs: List, vectors: List[List[float]]):
+    """Upsert chunk yang vektornya sudah dihitung langsung ke koleksi Chroma."""
+    texts = [doc.page_content for doc in docs]
+    metadatas = [dict(doc.metadata) if doc.metadata else None for doc in docs]
+    ids = [doc.id or str(uuid.uuid4()) for doc in docs]
+
+    def sync_upsert():
+        chroma._collection.upsert(ids=ids, embeddings=vectors, documents=texts, metadatas=metadatas)
+    await asyncio.to_thread(sync_upsert)
+
+def _group_by_index_key(documents) -> dict:
+    grouped = {}
+    for doc in documents:
+        grouped.setdefault(index_key(getattr(doc, "metadata", None)), []).append(doc)
+    return grouped
+
+def _bm25_key(metadata_key: str, metadata_value: str):
+    return index_key({metadata_key: metadata_value}) or f"{metadata_key}:{metadata_value}"
+
 async def add_documents(documents):
-    return await retry_async(_upsert_documents_in_store, documents, tries=3)
+    state = get_state()
+    chroma = state.vector_store
+    if chroma is None:
+        raise RuntimeError("Vector store is not initialized")
+
+    documents = list(documents)
+    ids = assign_chunk_ids(documents)
+    # Upsert Chroma idempoten; catat chunk yang sudah ada agar tidak masuk BM25 dua kali
+    stored = await asyncio.to_thread(chroma.get, ids=ids, include=[])
+    stored_ids = set(stored.get("ids") or [])
+    result = await retry_async(_upsert_documents_in_store, documents, tries=3)
+
+    # Sinkronkan index BM25 hanya untuk chunk yang benar-benar baru
+    index = state.bm25_index
+    if index is not None:
+        new_documents = [doc for doc in documents if doc.id not in stored_ids]
+        for key, docs in _group_by_index_key(new_documents).items():
+            index.add(key, docs)
+    return result
 
 async def delete_documents_by_metadata(metadata_key: str, metadata_value: str):
     """
     Delete all vectors that have metadata[metadata_key] == metadata_value
     """
+    result = await _delete_from_store(metadata_key, metadata_value)
+
+    index = get_state().bm25_index
+    if index is not None:
+        index.remove(_bm25_key(metadata_key, metadata_value))
+    return result
+
+async def _delete_from_store(metadata_key: str, metadata_value: str):
     state = get_state()
     chroma = state.vector_store
     if chroma is None:
@@ -76,7 +216,6 @@ async def delete_documents_by_metadata(metadata_key: str, metadata_value: str):
                 if ids:
                     coll.delete(ids=ids)
                 return len(ids)
-            import asyncio
             loop = asyncio.get_running_loop()
             deleted_count = await loop.run_in_executor(None, sync_query_delete)
             return {"status": "deleted", metadata_key: metadata_value, "deleted_count": deleted_count}
@@ -88,10 +227,192 @@ async def update_documents_by_metadata(metadata_key: str, metadata_value: str, n
     """
     Strategy: delete old docs for metadata_key=metadata_value then upsert new chunks
     """
+    new_documents = list(new_documents)
+
     # Langkah 1: Hapus dokumen lama
-    await delete_documents_by_metadata(metadata_key, metadata_value)
+    await _delete_from_store(metadata_key, metadata_value)
     
     # Langkah 2: Tambahkan dokumen baru
-    await add_documents(new_documents)
+    await retry_async(_upsert_documents_in_store, new_documents, tries=3)
+
+    # Langkah 3: Ganti chunk BM25 untuk key ini sekaligus (tanpa rebuild seluruh index)
+    index = get_state().bm25_index
+    if index is not None:
+        index.replace(_bm25_key(metadata_key, metadata_value), new_documents)
     
-    return {"status": "updated", metadata_key: metadata_value}
\ No newline at end of file
+    return {"status": "updated", metadata_key: metadata_value}
+
+async def replace_chunks(metadata_key: str, metadata_value: str, new_documents, stale_ids: List[str]):
+    """
+    Update sebagian chunk milik satu sumber: upsert `new_documents` lebih dulu, lalu hapus
+    `stale_ids`. Chunk lain milik sumber yang sama tidak disentuh (tidak di-embed ulang).
+    """
+    state = get_state()
+    chroma = state.vector_store
+    if chroma is None:
+        raise RuntimeError("Vector store is not initialized")
+
+    new_documents = list(new_documents)
+    if new_documents:
+        await retry_async(_upsert_documents_in_store, new_documents, tries=3)
+    new_ids = {doc.id for doc in new_documents}
+    stale_ids = [cid for cid in stale_ids if cid not in new_ids]
+    if stale_ids:
+        await _delete_ids(chroma, stale_ids)
+
+    # BM25: ganti chunk untuk key ini dengan isi koleksi terbaru
+    index = state.bm25_index
+    if index is not None:
+        await _refresh_bm25_key(chroma, index, metadata_key, metadata_value)
+
+    return {
+        "status": "updated",
+        metadata_key: metadata_value,
+        "upserted_chunks": len(new_documents),
+        "deleted_chunks": len(stale_ids),
+    }
+
+async def _refresh_bm25_key(chroma, index, metadata_key: str, metadata_value: str) -> None:
+    """Ganti chunk BM25 milik satu sumber dengan isi koleksi Chroma saat ini."""
+    current = await asyncio.to_thread(
+        chroma.get, where={metadata_key: metadata_value}, include=["documents", "metadatas"]
+    )
+    docs = [
+        Document(page_content=text, metadata=meta or {}, id=cid)
+        for cid, text, meta in zip(current.get("ids") or [], current.get("documents") or [], current.get("metadatas") or [])
+        if text
+    ]
+    index.replace(_bm25_key(metadata_key, metadata_value), docs)
+
+async def _delete_ids(chroma, ids: List[str], batch_size: int = 500) -> None:
+    collection = getattr(chroma, "_collection", None)
+    for i in range(0, len(ids), batch_size):
+        part = ids[i:i + batch_size]
+        if collection is not None:
+            await asyncio.to_thread(collection.delete, ids=part)
+        else:
+            await asyncio.to_thread(chroma.delete, ids=part)
+
+class ChunkReconciler:
+    """
+    Samakan isi koleksi dengan chunk sumber tanpa mengosongkannya terlebih dahulu.
+
+    Dipakai sebagai `on_batch` pipeline ingestion: setiap batch dibandingkan dengan ID
+    chunk deterministik yang sudah ada di Chroma dan chunk baru/berubah langsung di-upsert,
+    sehingga selama proses hanya ID chunk yang disimpan, bukan seluruh chunk. Chunk usang
+    baru dihapus di `finish()`, jadi query chat tidak pernah melihat koleksi kosong atau
+    setengah terisi.
+
+    Dokumen PDF yang pernah di-update inkremental bisa punya batas chunk berbeda dari split
+    penuh walau isinya sama. Karena itu chunk baru milik dokumen yang sudah punya metadata
+    halaman ditahan sampai `finish()`: jika hash semua halamannya sama dengan chunk yang ada,
+    dokumen dianggap tidak berubah dan chunk lamanya dipertahankan.
+    """
+
+    def __init__(self, chroma, existing: Dict[str, Optional[Dict]], batch_size: int = 10):
+        self.chroma = chroma
+        self.batch_size = batch_size
+        self.existing_keys: Dict[str, Optional[str]] = {}  # chunk_id -> "faq:<id>" / "doc:<id>"
+        metas_by_key: Dict[Optional[str], List[Optional[Dict]]] = {}
+        for cid, meta in existing.items():
+            key = index_key(meta)
+            self.existing_keys[cid] = key
+            metas_by_key.setdefault(key, []).append(meta)
+        self.existing_pages = {
+            key: pages for key, pages in ((key, page_hash_map(metas)) for key, metas in metas_by_key.items()) if pages
+        }
+        self.seen: Set[str] = set()
+        self.added = 0
+        self.changed_keys: Set[Optional[str]] = set()
+        self.pages: Dict[str, Optional[Dict[int, str]]] = {}  # hash halaman sumber per key
+        self.pending: Dict[str, List] = {}
+
+    @classmethod
+    async def start(cls, batch_size: int = 10) -> "ChunkReconciler":
+        chroma = get_state().vector_store
+        if chroma is None:
+            raise RuntimeError("Vector store is not initialized")
+        existing = await asyncio.to_thread(chroma.get, include=["metadatas"])
+        return cls(chroma, dict(zip(existing.get("ids") or [], existing.get("metadatas") or [])), batch_size)
+
+    def _track_pages(self, key: Optional[str], meta: Dict) -> None:
+        if key not in self.existing_pages:
+            return
+        pages = self.pages.setdefault(key, {})
+        if pages is None:
+            return
+        found = page_hash_map([meta])
+        if found is None:
+            self.pages[key] = None
+        else:
+            for page, value in found.items():
+                pages.setdefault(page, value)
+
+    async def add_batch(self, documents) -> None:
+        documents = list(documents)
+        assign_chunk_ids(documents)
+        to_add = []
+        for doc in documents:
+            if doc.id in self.seen:
+                continue
+            self.seen.add(doc.id)
+            key = index_key(doc.metadata)
+            self._track_pages(key, doc.metadata)
+            if doc.id in self.existing_keys:
+                continue
+            if key in self.existing_pages:
+                self.pending.setdefault(key, []).append(doc)
+            else:
+                to_add.append(doc)
+        await self._upsert(to_add)
+
+    async def _upsert(self, documents: List) -> None:
+        if documents:
+            await retry_async(_upsert_documents_in_store, documents, self.batch_size, tries=3)
+            self.added += len(documents)
+            self.changed_keys.update(index_key(doc.metadata) for doc in documents)
+
+    async def finish(self) -> Dict:
+        # Dokumen PDF dengan hash halaman identik: pertahankan chunk yang ada apa adanya
+        same_pages = {key for key, pages in self.existing_pages.items() if self.pages.get(key) == pages}
+        for key, documents in self.pending.items():
+            if key not in same_pages:
+                await self._upsert(documents)
+
+        to_delete = [
+            cid for cid, key in self.existing_keys.items() if cid not in self.seen and key not in same_pages
+        ]
+        if to_delete:
+            await _delete_ids(self.chroma, to_delete)
+        self.changed_keys.update(self.existing_keys[cid] for cid in to_delete)
+
+        # BM25: ganti hanya sumber (faq_id/doc_id) yang chunk-nya berubah, dari isi koleksi terbaru
+        index = get_state().bm25_index
+        if index is not None:
+            for key in self.changed_keys:
+                if key:
+                    await _refresh_bm25_key(self.chroma, index, *_key_filter(key))
+
+        report = {
+            "added": self.added,
+            "deleted": len(to_delete),
+            "unchanged": len(self.seen) - self.added,
+            "changed_sources": sorted(k for k in self.changed_keys if k),
+        }
+        logger.info(
+            "Reconcile selesai: +%s / -%s / =%s chunk, %s sumber berubah",
+            report["added"], report["deleted"], report["unchanged"], len(report["changed_sources"]),
+        )
+        return report
+
+def _key_filter(key: str):
+    """Kebalikan index_key: "doc:7" -> ("doc_id", "7")."""
+    prefix, _, value = key.partition(":")
+    fields = {p: field for field, p in KEY_FIELDS}
+    return fields[prefix], value
+
+async def reconcile_documents(documents, batch_size: int = 10) -> Dict:
+    """Reconcile koleksi dengan `documents` yang sudah dikumpulkan (lihat ChunkReconciler)."""
+    reconciler = await ChunkReconciler.start(batch_size)
+    await reconciler.add_batch(documents)
+    return await reconciler.finish()
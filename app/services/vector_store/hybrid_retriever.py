@@ -0,0 +1,86 @@
+# app/services/vector_store/hybrid_retriever.py
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Sequence
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+logger = logging.getLogger(__name__)
+
+RRF_C = 60
+
+
+def weighted_reciprocal_rank(
+    doc_lists: Sequence[List[Document]], weights: Sequence[float], c: int = RRF_C
+) -> List[Document]:
+    """
+    Gabungkan beberapa daftar hasil dengan Weighted Reciprocal Rank Fusion:
+    skor(d) = sum(weight_i / (rank_i(d) + c)). Duplikat dikenali dari page_content.
+    """
+    scores: Dict[str, float] = {}
+    docs_by_content: Dict[str, Document] = {}
+    for docs, weight in zip(doc_lists, weights):
+        for rank, doc in enumerate(docs, start=1):
+            content = doc.page_content
+            scores[content] = scores.get(content, 0.0) + weight / (rank + c)
+            docs_by_content.setdefault(content, doc)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [docs_by_content[content] for content in ranked]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Hybrid retriever (BM25 + Chroma) dengan jalur async native.
+
+    `ainvoke` menjalankan kedua leg secara bersamaan: leg keyword di thread,
+    leg vektor memakai embedding query async lalu pencarian Chroma by-vector di thread,
+    sehingga event loop tidak pernah terblokir selama retrieval.
+    """
+
+    keyword_retriever: BaseRetriever
+    vector_store: Any
+    embeddings: Any
+    k: int = 4
+    weights: List[float] = [0.3, 0.7]
+    c: int = RRF_C
+
+    def _fuse(self, keyword_docs: List[Document], vector_docs: List[Document]) -> List[Document]:
+        return weighted_reciprocal_rank([keyword_docs, vector_docs], self.weights, self.c)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        keyword_docs = self.keyword_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        vector_docs = self.vector_store.similarity_search(query, k=self.k)
+        return self._fuse(keyword_docs, vector_docs)
+
+    async def _avector_search(self, query: str) -> List[Document]:
+        embedding = await self.embeddings.aembed_query(query)
+        return await asyncio.to_thread(self.vector_store.similarity_search_by_vector, embedding, self.k)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        keyword_result, vector_result = await asyncio.gather(
+            asyncio.to_thread(self.keyword_retriever.invoke, query),
+            self._avector_search(query),
+            return_exceptions=True,
+        )
+
+        # Satu leg gagal tidak boleh menggagalkan seluruh retrieval
+        if isinstance(keyword_result, BaseException) and isinstance(vector_result, BaseException):
+            raise vector_result
+        if isinstance(keyword_result, BaseException):
+            logger.warning(f"Leg BM25 gagal, hanya memakai hasil vektor: {keyword_result}")
+            keyword_result = []
+        if isinstance(vector_result, BaseException):
+            logger.warning(f"Leg vektor gagal, hanya memakai hasil BM25: {vector_result}")
+            vector_result = []
+
+        return self._fuse(keyword_result, vector_result)
@@ -0,0 +1,217 @@
+# app/services/vector_store/ingestion.py
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Union
+
+from langchain_core.documents import Document
+
+from app.core.config import settings
+from app.services.api_client import download_file_to_temp, release_downloaded_file
+from app.services.vector_store.base import retry_async
+from app.services.vector_store.crud import assign_chunk_ids, embed_texts_with_store, _chroma_write
+from app.services.vector_store.pdf_processing import extract_pdf_chunks
+from app.services.vector_store.splitter import split_documents_to_chunks
+
+logger = logging.getLogger(__name__)
+
+# Penanda akhir antrean; setiap worker yang menerimanya meneruskan ke worker lain di stage yang sama
+_DONE = object()
+
+
+@dataclass(frozen=True)
+class PdfSource:
+    """Dokumen PDF yang perlu diunduh, diekstrak, lalu di-split."""
+    url: str
+    metadata: Dict = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class StageConcurrency:
+    """Jumlah worker per stage dan kapasitas antrean di antara stage."""
+    download: int = 4
+    extract: int = 2
+    split: int = 2
+    embed: int = 2
+    upsert: int = 1
+    queue_size: int = 8
+
+    @classmethod
+    def from_settings(cls) -> "StageConcurrency":
+        return cls(
+            download=settings.INGEST_DOWNLOAD_CONCURRENCY,
+            extract=settings.INGEST_EXTRACT_CONCURRENCY,
+            split=settings.INGEST_SPLIT_CONCURRENCY,
+            embed=settings.INGEST_EMBED_CONCURRENCY,
+            upsert=settings.INGEST_UPSERT_CONCURRENCY,
+            queue_size=settings.INGEST_QUEUE_SIZE,
+        )
+
+
+async def _run_stage(
+    name: str,
+    worker: Callable[[Any, Callable[[Any], Awaitable[None]]], Awaitable[None]],
+    inbox: asyncio.Queue,
+    outbox: Optional[asyncio.Queue],
+    concurrency: int,
+) -> None:
+    """
+    Jalankan `concurrency` worker yang membaca `inbox` sampai _DONE.
+    Worker mengirim hasil lewat `emit`; karena `outbox` terbatas, stage yang lambat
+    otomatis menahan stage sebelumnya (backpressure) sehingga jumlah item yang menunggu
+    di antrean tidak bertambah terus.
+    """
+    async def emit(item: Any) -> None:
+        if outbox is not None:
+            await outbox.put(item)
+
+    async def loop() -> None:
+        while True:
+            item = await inbox.get()
+            if item is _DONE:
+                await inbox.put(_DONE)
+                return
+            await worker(item, emit)
+
+    await asyncio.gather(*(loop() for _ in range(max(1, concurrency))))
+    logger.debug("Stage %s selesai", name)
+    if outbox is not None:
+        await outbox.put(_DONE)
+
+
+async def run_ingestion_pipeline(
+    sources: Iterable[Union[PdfSource, Dict]],
+    target=None,
+    batch_size: int = 64,
+    concurrency: Optional[StageConcurrency] = None,
+    on_batch: Optional[Callable[[List[Document]], Union[None, Awaitable[None]]]] = None,
+) -> List[Document]:
+    """
+    Pipeline ingestion bertahap: download -> extract -> split -> embed -> upsert.
+    PDF diekstrak dan di-split di process pool (lihat pdf_processing), FAQ di-split di thread.
+
+    `sources` berisi PdfSource atau dict {"content", "metadata"} (FAQ / teks siap-split;
+    dict melewati stage download & extract apa adanya). Setiap stage punya jumlah worker
+    sendiri dan dihubungkan antrean terbatas berisi batch chunk (paling banyak
+    `batch_size` chunk per item), sehingga chunk yang "in flight" dibatasi sekitar
+    `queue_size * batch_size` per antrean, ditambah daftar chunk satu PDF yang sedang
+    dipecah menjadi batch oleh setiap worker extract. Jika `target` (Chroma) diberikan,
+    batch di-embed (memakai EmbeddingStore) dan di-upsert ke target; jika tidak, chunk
+    hanya dikumpulkan.
+
+    Jika `on_batch` diberikan, setiap batch yang selesai diteruskan ke callback tersebut
+    (coroutine function di-await, fungsi biasa dijalankan di thread, misal untuk mengisi
+    index BM25) dan tidak disimpan, sehingga chunk tidak menumpuk di memori; nilai
+    kembalian menjadi list kosong.
+
+    Kegagalan satu dokumen di stage download/extract/split hanya di-log; kegagalan
+    embed/upsert menghentikan pipeline. Tanpa `on_batch`, mengembalikan semua chunk yang dihasilkan.
+    """
+    concurrency = concurrency or StageConcurrency.from_settings()
+    queue_size = max(1, concurrency.queue_size)
+
+    inbox: asyncio.Queue = asyncio.Queue()
+    downloaded: asyncio.Queue = asyncio.Queue(queue_size)
+    extracted: asyncio.Queue = asyncio.Queue(queue_size)
+    batches: asyncio.Queue = asyncio.Queue(queue_size)
+    embedded: asyncio.Queue = asyncio.Queue(queue_size)
+    for source in sources:
+        inbox.put_nowait(source)
+    inbox.put_nowait(_DONE)
+
+    produced: List[Document] = []
+    total_chunks = 0
+
+    async def deliver(batch: List[Document]) -> None:
+        nonlocal total_chunks
+        total_chunks += len(batch)
+        if asyncio.iscoroutinefunction(on_batch):
+            await on_batch(batch)
+        elif on_batch is not None:
+            await asyncio.to_thread(on_batch, batch)
+        else:
+            produced.extend(batch)
+
+    async def download(source, emit) -> None:
+        if not isinstance(source, PdfSource):
+            await emit((source, None))
+            return
+        try:
+            path = await download_file_to_temp(source.url, suffix=".pdf")
+        except Exception as e:
+            logger.error(f"❌ Failed to download PDF {source.url}: {e}")
+            return
+        await emit((source, path))
+
+    async def extract(item, emit) -> None:
+        source, path = item
+        if not isinstance(source, PdfSource):
+            await emit(source)
+            return
+        try:
+            # Ekstrak + split PDF sekaligus di process pool
+            chunks = await extract_pdf_chunks(path, source.metadata)
+            logger.info(f"Extracted {len(chunks)} chunks from PDF {source.url}")
+        except Exception as e:
+            logger.error(f"❌ Failed to extract PDF {source.url}: {e}")
+            return
+        finally:
+            # Hanya hapus file unduhan temporer, bukan file uploads lokal / cache unduhan
+            release_downloaded_file(path, source.url)
+        # ID ditetapkan per dokumen sebelum di-batch agar chunk_index tetap dihitung per sumber;
+        # antrean berikutnya hanya menerima batch, bukan seluruh chunk satu PDF sekaligus
+        assign_chunk_ids(chunks)
+        for i in range(0, len(chunks), batch_size):
+            await emit(chunks[i:i + batch_size])
+
+    async def split(doc, emit) -> None:
+        if isinstance(doc, list):
+            await emit(doc)  # PDF: batch yang sudah di-split di process pool
+            return
+        try:
+            chunks = await asyncio.to_thread(split_documents_to_chunks, [doc])
+        except Exception as e:
+            logger.error(f"❌ Failed to split document {doc.get('metadata')}: {e}")
+            return
+        assign_chunk_ids(chunks)
+        for i in range(0, len(chunks), batch_size):
+            await emit(chunks[i:i + batch_size])
+
+    async def embed(batch, emit) -> None:
+        vectors = await retry_async(embed_texts_with_store, [doc.page_content for doc in batch], tries=3)
+        await emit((batch, vectors))
+
+    async def upsert(item, emit) -> None:
+        batch, vectors = item
+        await retry_async(_chroma_write, target, batch, vectors, tries=3)
+        await deliver(batch)
+
+    async def collect(batch, emit) -> None:
+        await deliver(batch)
+
+    stages = [
+        _run_stage("download", download, inbox, downloaded, concurrency.download),
+        _run_stage("extract", extract, downloaded, extracted, concurrency.extract),
+        _run_stage("split", split, extracted, batches, concurrency.split),
+    ]
+    if target is not None:
+        stages += [
+            _run_stage("embed", embed, batches, embedded, concurrency.embed),
+            _run_stage("upsert", upsert, embedded, None, concurrency.upsert),
+        ]
+    else:
+        stages.append(_run_stage("collect", collect, batches, None, 1))
+
+    tasks = [asyncio.create_task(stage) for stage in stages]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        # Satu stage gagal: hentikan stage lain agar tidak menunggu antrean selamanya
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    logger.info(f"📦 Ingestion pipeline produced {total_chunks} chunks")
+    return produced
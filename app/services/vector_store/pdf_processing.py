@@ -0,0 +1,197 @@
+# app/services/vector_store/pdf_processing.py
+
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import threading
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from langchain_community.document_loaders import PyMuPDFLoader
+from langchain_core.documents import Document
+
+from app.core.config import settings
+from app.services.vector_store.splitter import iter_document_chunks
+
+logger = logging.getLogger(__name__)
+
+# Record chunk ringkas yang dikirim balik dari proses worker: (page_content, metadata)
+ChunkRecord = Tuple[str, Dict]
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def page_hash(text: str) -> str:
+    """Hash pendek isi satu halaman (dipakai untuk mendeteksi halaman yang berubah)."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+
+def extract_pdf_pages(path: str) -> List[str]:
+    """Ekstrak teks per halaman PDF (PyMuPDF)."""
+    return [page.page_content for page in PyMuPDFLoader(path).load()]
+
+
+def extract_pdf_text(path: str) -> str:
+    """Ekstrak teks semua halaman PDF (PyMuPDF) menjadi satu string."""
+    return "".join(page + "\n" for page in extract_pdf_pages(path))
+
+
+def _page_range(page_starts: List[int], char_start: int, char_end: int) -> Tuple[int, int]:
+    """Rentang halaman (relatif) dari offset karakter chunk di teks gabungan halaman."""
+    first = bisect_right(page_starts, char_start) - 1
+    last = bisect_right(page_starts, max(char_end - 1, char_start)) - 1
+    return max(first, 0), max(last, 0)
+
+
+def split_pages(pages: List[str], metadata: Dict, first_page: int = 0, char_offset: int = 0) -> List[ChunkRecord]:
+    """
+    Split rangkaian halaman (`pages` dimulai dari halaman `first_page`, yang berada di
+    offset karakter `char_offset` dokumen) menjadi chunk dengan metadata halaman:
+    page_start, page_end, dan page_hashes (hash tiap halaman yang dicakup, dipisah koma)
+    untuk re-index inkremental per halaman.
+
+    `chunk_index` berbentuk "p<page_start>-<urutan>" (urutan dihitung per halaman awal),
+    sama untuk split penuh maupun split sebagian halaman, sehingga ID chunk yang
+    dihasilkan update inkremental dan refresh/reconcile memakai skema yang sama.
+    """
+    page_starts: List[int] = []
+    position = 0
+    for page in pages:
+        page_starts.append(position)
+        position += len(page) + 1
+    text = "".join(page + "\n" for page in pages)
+    hashes = [page_hash(page) for page in pages]
+
+    records: List[ChunkRecord] = []
+    per_page: Dict[int, int] = {}
+    for chunk in iter_document_chunks([{"content": text, "metadata": metadata}]):
+        meta = chunk.metadata
+        start, end = _page_range(page_starts, meta["char_start"], meta["char_end"])
+        meta["char_start"] += char_offset
+        meta["char_end"] += char_offset
+        meta["page_start"] = first_page + start
+        meta["page_end"] = first_page + end
+        meta["page_hashes"] = ",".join(hashes[start:end + 1])
+        position = per_page.get(meta["page_start"], 0)
+        per_page[meta["page_start"]] = position + 1
+        meta["chunk_index"] = f"p{meta['page_start']}-{position}"
+        records.append((chunk.page_content, meta))
+    return records
+
+
+def page_hash_map(metadatas: Iterable[Optional[Dict]]) -> Optional[Dict[int, str]]:
+    """
+    Hash tiap halaman yang dicakup chunk-chunk satu dokumen, {nomor halaman: hash}.
+    None jika ada chunk tanpa metadata halaman (dokumen lama).
+    """
+    hashes_by_page: Dict[int, str] = {}
+    for meta in metadatas:
+        start, hashes = (meta or {}).get("page_start"), (meta or {}).get("page_hashes")
+        if start is None or not hashes:
+            return None
+        for offset, value in enumerate(hashes.split(",")):
+            hashes_by_page.setdefault(int(start) + offset, value)
+    return hashes_by_page
+
+
+def plan_page_reindex(
+    new_hashes: List[str], existing: List[Tuple[str, Dict]]
+) -> Optional[Tuple[List[str], List[Tuple[int, int]]]]:
+    """
+    Bandingkan hash halaman baru dengan metadata chunk lama milik satu dokumen.
+
+    Mengembalikan (ID chunk yang harus dihapus, rentang halaman [awal, akhir] yang perlu
+    di-split & di-embed ulang), atau None jika chunk lama tidak punya metadata halaman
+    (dokumen lama) sehingga perlu re-index penuh.
+    """
+    if not existing:
+        return None
+    old_hashes = page_hash_map(meta for _, meta in existing)
+    if old_hashes is None:
+        return None
+
+    page_count = len(new_hashes)
+    dirty = {page for page, value in enumerate(new_hashes) if old_hashes.get(page) != value}
+    dirty.update(page for page in old_hashes if page >= page_count)  # halaman yang dihapus
+
+    stale_ids: List[str] = []
+    pages = {page for page in dirty if page < page_count}
+    for chunk_id, meta in existing:
+        start, end = int(meta["page_start"]), int(meta.get("page_end", meta["page_start"]))
+        if any(page in dirty for page in range(start, end + 1)):
+            stale_ids.append(chunk_id)
+            pages.update(range(start, min(end, page_count - 1) + 1))
+
+    runs: List[Tuple[int, int]] = []
+    for page in sorted(pages):
+        if runs and runs[-1][1] == page - 1:
+            runs[-1] = (runs[-1][0], page)
+        else:
+            runs.append((page, page))
+    return stale_ids, runs
+
+
+def extract_and_split(path: str, metadata: Dict) -> List[ChunkRecord]:
+    """
+    Ekstrak + split satu PDF. Dijalankan di proses worker, jadi hanya menerima dan
+    mengembalikan objek sederhana yang bisa di-pickle.
+    """
+    return split_pages(extract_pdf_pages(path), metadata)
+
+
+def get_process_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    ProcessPoolExecutor khusus parsing PDF (dibuat sekali, lazy). Memakai start method
+    "spawn" agar proses anak tidak mewarisi thread/lock milik event loop server.
+    None jika PDF_PROCESS_WORKERS <= 0 (fallback ke thread).
+    """
+    global _pool
+    if settings.PDF_PROCESS_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.PDF_PROCESS_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            logger.info(f"PDF process pool dibuat dengan {settings.PDF_PROCESS_WORKERS} worker")
+        return _pool
+
+
+def shutdown_process_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+async def _run_in_pool(func, *args):
+    pool = get_process_pool()
+    if pool is None:
+        return await asyncio.to_thread(func, *args)
+    return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+
+
+def _to_documents(records: List[ChunkRecord]) -> List[Document]:
+    return [Document(page_content=text, metadata=meta) for text, meta in records]
+
+
+async def extract_pdf_chunks(path: str, metadata: Dict) -> List[Document]:
+    """Ekstrak + split PDF di process pool (CPU-bound, bebas dari GIL & executor default)."""
+    return _to_documents(await _run_in_pool(extract_and_split, path, metadata))
+
+
+async def extract_pdf_page_texts(path: str) -> List[str]:
+    """Ekstrak teks per halaman di process pool (untuk update inkremental)."""
+    return await _run_in_pool(extract_pdf_pages, path)
+
+
+async def split_pdf_pages(
+    pages: List[str], metadata: Dict, first_page: int = 0, char_offset: int = 0
+) -> List[Document]:
+    """Split sebagian halaman di process pool; nomor halaman metadata dimulai dari `first_page`."""
+    return _to_documents(await _run_in_pool(split_pages, pages, metadata, first_page, char_offset))
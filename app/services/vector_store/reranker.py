@@ -0,0 +1,100 @@
+# app/services/vector_store/reranker.py
+
+import asyncio
+import logging
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.core.config import settings
+from app.services.vector_store.base import get_state
+from app.services.vector_store.crud import stored_vectors
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def select_documents(
+    query_vector: List[float],
+    doc_vectors: List[List[float]],
+    docs: List[Document],
+    max_docs: int,
+    dedup_threshold: float,
+    min_score: float,
+) -> List[Document]:
+    """
+    Urutkan ulang `docs` berdasarkan cosine similarity ke query, buang chunk yang nyaris
+    identik (cosine antar chunk >= `dedup_threshold`) dengan chunk yang sudah terpilih,
+    lalu ambil paling banyak `max_docs` chunk (<= 0 = tanpa batas). Batas token konteks
+    tidak diterapkan di sini; itu tugas pack_context saat prompt disusun.
+    """
+    if not docs:
+        return []
+    query = _normalize(np.asarray(query_vector, dtype=np.float32))
+    vectors = _normalize(np.asarray(doc_vectors, dtype=np.float32))
+    scores = vectors @ query
+    # Urutan fusi retriever jadi tie-breaker (sort stabil)
+    order = sorted(range(len(docs)), key=lambda i: -scores[i])
+
+    kept: List[int] = []
+    for i in order:
+        if max_docs > 0 and len(kept) >= max_docs:
+            break
+        if kept and scores[i] < min_score:
+            break
+        if kept and float(np.max(vectors[kept] @ vectors[i])) >= dedup_threshold:
+            continue
+        kept.append(i)
+    return [docs[i] for i in kept]
+
+
+async def _rerank(query: str, docs: List[Document]) -> List[Document]:
+    embeddings = get_state().embeddings
+    if embeddings is None:
+        raise RuntimeError("Embeddings model is not initialized")
+    # Vektor query sudah ada di cache embedding (dipakai leg vektor retriever);
+    # vektor chunk hanya diambil dari yang sudah tersimpan, tidak pernah di-embed di sini.
+    query_vector, doc_vectors = await asyncio.gather(
+        embeddings.aembed_query(query),
+        stored_vectors(docs),
+    )
+    if doc_vectors is None:
+        logger.info("Vektor sebagian chunk belum tersimpan, rerank dilewati")
+        return docs
+    return await asyncio.to_thread(
+        select_documents,
+        query_vector,
+        doc_vectors,
+        docs,
+        settings.RERANK_MAX_DOCS,
+        settings.RERANK_DEDUP_THRESHOLD,
+        settings.RERANK_MIN_SCORE,
+    )
+
+
+async def rerank_documents(
+    query: str,
+    docs: List[Document],
+    timeout: Optional[float] = None,
+) -> List[Document]:
+    """
+    Rerank + dedup hasil retrieval dalam batas waktu `timeout` (RERANK_TIMEOUT_SECONDS).
+    Jika melewati batas waktu, gagal, atau vektor chunk belum tersimpan, hasil retriever
+    dikembalikan apa adanya. Pemangkasan ke CONTEXT_TOKEN_BUDGET dilakukan pack_context.
+    """
+    if len(docs) <= 1:
+        return docs
+    timeout = settings.RERANK_TIMEOUT_SECONDS if timeout is None else timeout
+    try:
+        return await asyncio.wait_for(_rerank(query, docs), timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"Rerank melewati batas {timeout}s, memakai urutan retriever")
+    except Exception as e:
+        logger.warning(f"Rerank gagal, memakai urutan retriever: {e}")
+    return docs
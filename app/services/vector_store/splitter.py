@@ -1,8 +1,12 @@
 # app/services/vector_store/splitter.py
 
-from typing import List, Dict, Iterable
+from bisect import bisect_left
+from functools import lru_cache
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from app.core.config import settings
+from app.utils.token_budget import count_tokens
 import re
 import logging
 
@@ -13,6 +17,52 @@ DEFAULT_SPLITTER = {
     "chunk_overlap": 400
 }
 
+# Pola dikompilasi sekali per proses (bukan per dokumen)
+_MARKER = re.compile(r'\n?#{3,}\s*')
+_MARKER_DETECT = re.compile(r'#{3,}')
+_WHITESPACE = re.compile(r'\s+')
+# Hanya run whitespace >= 2 karakter yang menggeser offset saat dinormalisasi menjadi satu spasi
+_COLLAPSIBLE_WHITESPACE = re.compile(r'\s{2,}')
+_PASAL_DETECT = re.compile(r'Pasal\s+\d+')
+# Header struktur peraturan di awal baris: "BAB <romawi/angka>" (huruf besar) atau "Pasal <angka>".
+# Bagian Pasal identik dengan pola split Pasal lama: (?:^|\n)\s*(Pasal\s+\d+)\s+
+_STRUCTURE_HEADER = re.compile(
+    r'(?:^|\n)\s*(?:'
+    r'(?-i:BAB)\s+(?P<bab>(?-i:[IVXLCDM]+)|\d+)\b'
+    r'|(?P<pasal>Pasal\s+(?P<pasal_no>\d+))\s+'
+    r')',
+    re.IGNORECASE,
+)
+# Penanda ayat "(n)" di awal baris teks asli (bukan rujukan "ayat (1)" di tengah kalimat)
+_AYAT = re.compile(r'\n[ \t]*\((\d{1,3})\)')
+
+REGULATION_TITLE_KEYWORDS = ("peraturan", "undang-undang", "keputusan", "perpres", "permendagri")
+REGULATION_DETECT_WINDOW = 5000
+
+
+SIZE_MODES = ("chars", "tokens")
+
+
+@lru_cache(maxsize=8)
+def get_text_splitter(chunk_size: int, chunk_overlap: int, mode: str = "chars") -> RecursiveCharacterTextSplitter:
+    """
+    Text splitter di-cache per (chunk_size, chunk_overlap, mode); stateless sehingga aman
+    dipakai ulang. Mode "tokens" mengukur panjang dengan tiktoken (`count_tokens`).
+    """
+    if mode == "tokens":
+        return RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap, length_function=count_tokens
+        )
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def default_chunk_settings() -> Tuple[int, int, str]:
+    """(chunk_size, chunk_overlap, mode) sesuai CHUNK_SIZE_MODE."""
+    if settings.CHUNK_SIZE_MODE == "tokens":
+        return settings.CHUNK_SIZE_TOKENS, settings.CHUNK_OVERLAP_TOKENS, "tokens"
+    return DEFAULT_SPLITTER["chunk_size"], DEFAULT_SPLITTER["chunk_overlap"], "chars"
+
+
 def pre_split_by_marker(text: str) -> List[str]:
     """
     Pisahkan dokumen berdasarkan tanda ### (delimiter manual).
@@ -21,7 +71,7 @@ def pre_split_by_marker(text: str) -> List[str]:
     ### KTP ELEKTRONIK
     dll.
     """
-    parts = re.split(r'\n?#{3,}\s*', text)
+    parts = _MARKER.split(text)
     # Bersihkan bagian kosong & whitespace
     parts = [p.strip() for p in parts if p.strip()]
     return parts
@@ -35,141 +85,222 @@ def clean_text(text: str) -> str:
     if not text:
         return ""
     # Mengganti semua whitespace (newline, tab, spasi ganda) dengan satu spasi
-    return re.sub(r'\s+', ' ', text).strip()
-
-
+    return _WHITESPACE.sub(' ', text).strip()
 
 
 def split_text_by_pasal(text: str) -> List[str]:
     """
     Memecah teks peraturan perundang-undangan berdasarkan Pasal.
-    Strategi:
-    1. Gunakan Newline sebagai indikator utama Header Pasal.
-    2. Regex mencari pola: (Newline atau Awal String) + "Pasal" + Angka.
-    """
-    chunks = []
-    
-    # Pola untuk menemukan Header Pasal:
-    # (?:\n|^)      -> Non-capturing group: Newline ATAU Awal String
-    # \s*           -> Optional whitespace
-    # (Pasal\s+\d+) -> Group 1: "Pasal 1", "Pasal 20", dst.
-    # \s+           -> Whitespace setelah angka (memastikan bukan "Pasal 10" jika kita cari "Pasal 1")
-    #
-    # Kita gunakan re.split dengan capturing group agar delimiter (Pasal X) juga dikembalikan.
-    
-    # 1. Split berdasarkan Header Pasal
-    # Pattern: \n\s*Pasal\s+\d+\s
-    # Kita gunakan lookahead/lookbehind atau sekadar split dan re-assemble.
-    
-    # Cara paling aman: Split by pattern, lalu gabungkan Header dengan Contentnya.
-    pattern = r'(?:^|\n)\s*(Pasal\s+\d+)\s+'
-    
-    parts = re.split(pattern, text, flags=re.IGNORECASE)
-    
-    # parts[0] adalah teks sebelum Pasal pertama (bisa jadi kosong atau konsiderans/pembukaan)
-    # parts[1] adalah Header Pasal 1 (misal "Pasal 1")
-    # parts[2] adalah Isi Pasal 1
-    # parts[3] adalah Header Pasal 2
-    # parts[4] adalah Isi Pasal 2
-    # dst...
-    
-    # Jika ada teks pembuka (parts[0]), kita bisa simpan atau abaikan. 
-    # Untuk RAG, biasanya kita butuh Pasal.
-    
-    current_chunk = ""
-    
-    # Mulai iterasi dari index 1
-    for i in range(1, len(parts), 2):
-        header = parts[i].strip()      # "Pasal 1"
-        content = parts[i+1].strip()   # "Dalam peraturan ini..."
-        
-        # Gabungkan dan bersihkan
-        full_text = f"{header} {content}"
-        
-        # Normalisasi whitespace (merge lines) HANYA setelah splitting selesai
-        clean_chunk = re.sub(r'\s+', ' ', full_text).strip()
-        
-        if clean_chunk:
-            chunks.append(clean_chunk)
-            
-    return chunks
+    Header Pasal = (Newline atau Awal String) + "Pasal" + Angka. Teks sebelum
+    Pasal pertama (konsiderans/pembukaan) diabaikan.
+    """
+    return [span.text for span, _, _ in _iter_pasal_spans(text) if span.text]
 
-def split_documents_to_chunks(
+
+class _NormalizedSpan:
+    """
+    Teks asli [start, end) dengan whitespace dinormalisasi (hasilnya sama dengan `clean_text`).
+    Peta offset ke teks asli (posisi run whitespace ganda) baru dibangun saat dibutuhkan,
+    sehingga span pendek yang menjadi satu chunk utuh tidak perlu memindai ulang teksnya.
+    """
+
+    __slots__ = ("text", "_source", "_start", "_end", "_run_positions", "_run_shifts")
+
+    def __init__(self, source: str, start: int, end: int):
+        raw = source[start:end]
+        self._start = start + (len(raw) - len(raw.lstrip()))
+        self._end = start + len(raw.rstrip())
+        self._source = source
+        self.text = _WHITESPACE.sub(' ', source[self._start:self._end]) if self._end > self._start else ""
+        self._run_positions: Optional[List[int]] = None
+        self._run_shifts: List[int] = []
+
+    def _build_offsets(self) -> None:
+        positions, shifts, removed = [], [], 0
+        for match in _COLLAPSIBLE_WHITESPACE.finditer(self._source, self._start, self._end):
+            run_start, run_end = match.span()
+            positions.append(run_start - self._start - removed)
+            removed += run_end - run_start - 1
+            shifts.append(removed)
+        self._run_positions, self._run_shifts = positions, shifts
+
+    def _to_original(self, position: int) -> int:
+        # Geser posisi sebanyak whitespace yang dibuang oleh run-run sebelum `position`
+        runs_before = bisect_left(self._run_positions, position)
+        return self._start + position + (self._run_shifts[runs_before - 1] if runs_before else 0)
+
+    def original_range(self, norm_start: int, norm_end: int) -> Tuple[int, int]:
+        """Peta [norm_start, norm_end) di teks ternormalisasi ke [awal, akhir) di teks asli."""
+        if norm_start <= 0 and norm_end >= len(self.text):
+            return self._start, self._end
+        if self._run_positions is None:
+            self._build_offsets()
+        return self._to_original(norm_start), self._to_original(max(norm_end - 1, norm_start)) + 1
+
+
+def _iter_pasal_spans(text: str) -> Iterator[Tuple[_NormalizedSpan, int, Optional[str]]]:
+    """
+    Satu pass linear atas header BAB/Pasal. Yield (span pasal, nomor pasal, BAB aktif).
+    Span sebuah Pasal berakhir di header Pasal berikutnya (judul BAB ikut ke Pasal sebelumnya,
+    sama seperti split lama), sedangkan BAB aktif adalah BAB terakhir sebelum Pasal tersebut.
+    """
+    bab = None
+    pending = None
+    for match in _STRUCTURE_HEADER.finditer(text):
+        if match.group("bab"):
+            bab = match.group("bab")
+            continue
+        if pending is not None:
+            yield _NormalizedSpan(text, pending[0].start("pasal"), match.start()), int(pending[0].group("pasal_no")), pending[1]
+        pending = (match, bab)
+    if pending is not None:
+        yield _NormalizedSpan(text, pending[0].start("pasal"), len(text)), int(pending[0].group("pasal_no")), pending[1]
+
+
+def _iter_span_chunks(
+    span: _NormalizedSpan, text_splitter: RecursiveCharacterTextSplitter
+) -> Iterator[Tuple[str, int, int]]:
+    """Split teks ternormalisasi; yield (chunk, char_start, char_end) pada teks asli."""
+    index = 0
+    previous_len = 0
+    # Overlap hanya bisa dipakai sebagai batas karakter jika panjang diukur dalam karakter
+    char_overlap = text_splitter._chunk_overlap if text_splitter._length_function is len else None
+    for chunk in text_splitter.split_text(span.text):
+        # Chunk berurutan (awal chunk selalu maju), jadi cukup cari maju dari chunk sebelumnya
+        if char_overlap is not None:
+            lower = index + previous_len - char_overlap
+        else:
+            lower = index + 1 if previous_len else 0
+        found = span.text.find(chunk, max(0, lower))
+        if found >= 0:
+            index = found
+        previous_len = len(chunk)
+        start, end = span.original_range(index, index + len(chunk))
+        yield chunk, start, end
+
+
+def _chunk_metadata(base_meta: Dict, char_start: int, char_end: int, **structure) -> Dict:
+    meta = dict(base_meta)
+    meta["char_start"] = char_start
+    meta["char_end"] = char_end
+    # Metadata Chroma tidak boleh None: hanya isi field struktur yang diketahui
+    for key, value in structure.items():
+        if value is not None:
+            meta[key] = value
+    return meta
+
+
+def _ayat_range(source: str, start: int, end: int, previous: Optional[int]) -> Tuple[Optional[int], Optional[int]]:
+    """Rentang nomor ayat di source[start:end]; tanpa penanda, lanjutkan ayat sebelumnya."""
+    # Mulai satu karakter lebih awal agar penanda tepat di awal chunk tetap terbaca
+    numbers = [int(n) for n in _AYAT.findall(source, max(start - 1, 0), end)]
+    if not numbers:
+        return previous, previous
+    return min(numbers), max(numbers)
+
+
+def _is_regulation(content: str, title: str) -> bool:
+    # Deteksi dokumen regulasi (Perpres, Permendagri, UU, dll) dari Title atau Content
+    if any(keyword in title for keyword in REGULATION_TITLE_KEYWORDS):
+        return True
+    # Cek juga kontennya jika title tidak jelas (5000 karakter pertama)
+    return _PASAL_DETECT.search(content, 0, REGULATION_DETECT_WINDOW) is not None
+
+
+def _iter_regulation_chunks(
+    content: str, base_meta: Dict, chunk_size: int, text_splitter: RecursiveCharacterTextSplitter
+) -> Iterator[Document]:
+    """Satu chunk per Pasal (dipecah lagi jika > chunk_size) dengan metadata bab/pasal/ayat."""
+    for span, pasal, bab in _iter_pasal_spans(content):
+        if not span.text:
+            continue
+        if text_splitter._length_function(span.text) <= chunk_size:
+            pieces = [(span.text, *span.original_range(0, len(span.text)))]
+        else:
+            # Pasal yang sangat panjang tetap dipecah dengan text_splitter biasa
+            pieces = _iter_span_chunks(span, text_splitter)
+
+        ayat = None
+        for text, start, end in pieces:
+            ayat_start, ayat = _ayat_range(content, start, end, ayat)
+            yield Document(
+                page_content=text,
+                metadata=_chunk_metadata(
+                    base_meta, start, end, bab=bab, pasal=pasal, ayat_start=ayat_start, ayat_end=ayat
+                ),
+            )
+
+
+def _iter_default_chunks(
+    content: str, base_meta: Dict, text_splitter: RecursiveCharacterTextSplitter
+) -> Iterator[Document]:
+    """Split biasa; dokumen dengan delimiter manual ### dipecah per bagian lebih dulu."""
+    if _MARKER_DETECT.search(content):
+        bounds = []
+        previous = 0
+        for match in _MARKER.finditer(content):
+            bounds.append((previous, match.start()))
+            previous = match.end()
+        bounds.append((previous, len(content)))
+    else:
+        bounds = [(0, len(content))]
+
+    for start, end in bounds:
+        # Whitespace dinormalisasi sebelum di-split menjadi chunks
+        span = _NormalizedSpan(content, start, end)
+        if not span.text:
+            continue
+        for text, char_start, char_end in _iter_span_chunks(span, text_splitter):
+            yield Document(page_content=text, metadata=_chunk_metadata(base_meta, char_start, char_end))
+
+
+def iter_document_chunks(
     docs: Iterable[Dict],
     chunk_size: int = None,
     chunk_overlap: int = None
-) -> List[Document]:
-    """
-    docs: iterable of dict dengan key:
-      - doc_id atau faq_id
-      - content
-      - metadata (opsional)
+) -> Iterator[Document]:
     """
-    chunk_size = chunk_size or DEFAULT_SPLITTER["chunk_size"]
-    chunk_overlap = chunk_overlap or DEFAULT_SPLITTER["chunk_overlap"]
-
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap
-    )
+    Generator chunk untuk `docs` (dict dengan key content & metadata opsional).
 
-    result = []
+    chunk_size/chunk_overlap diukur dalam karakter atau token sesuai CHUNK_SIZE_MODE.
+    Dokumen regulasi dipecah per Pasal dalam satu pass dengan pola yang sudah dikompilasi;
+    setiap chunk membawa metadata struktur (bab, pasal, ayat_start/ayat_end jika ada) dan
+    posisi karakter (char_start/char_end) pada konten asli.
+    """
+    default_size, default_overlap, mode = default_chunk_settings()
+    chunk_size = chunk_size or default_size
+    chunk_overlap = chunk_overlap or default_overlap
+    text_splitter = get_text_splitter(chunk_size, chunk_overlap, mode)
 
     for doc in docs:
         content = doc.get("content") or ""
         base_meta = dict(doc.get("metadata", {}))
         data_source = base_meta.get("source", "")
-        title = base_meta.get("title", "").lower()
-
-        # Deteksi apakah ini dokumen regulasi (Perpres, Permendagri, UU, dll)
-        # Bisa cek dari Title atau Content
-        is_regulation = "peraturan" in title or "undang-undang" in title or "keputusan" in title or "perpres" in title or "permendagri" in title
-        
-        # Cek juga kontennya jika title tidak jelas
-        if not is_regulation and re.search(r'Pasal\s+\d+', content[:5000]): # Cek 5000 karakter pertama
-             is_regulation = True
+        title = (base_meta.get("title") or "").lower()
 
-        if is_regulation:
+        if _is_regulation(content, title):
             logger.info(f"Document detected as Regulation (Pasal-based): {title or data_source}")
-            # Gunakan strategi splitting khusus Pasal
-            pasal_chunks = split_text_by_pasal(content)
-            
-            if pasal_chunks:
-                logger.info(f"Successfully split into {len(pasal_chunks)} Pasal chunks.")
-                for chunk_text in pasal_chunks:
-                    # Kita bisa memperkaya metadata di sini jika mau (misal ekstrak nomor pasal)
-                    # Untuk sekarang, simpan sebagai chunk utuh
-                    
-                    # Jika satu pasal sangat panjang (lebih dari chunk_size), 
-                    # kita tetap perlu memecahnya lagi dengan text_splitter biasa
-                    if len(chunk_text) > chunk_size:
-                        sub_chunks = text_splitter.split_text(chunk_text)
-                        for sub_chunk in sub_chunks:
-                            result.append(Document(page_content=sub_chunk, metadata=base_meta))
-                    else:
-                        result.append(Document(page_content=chunk_text, metadata=base_meta))
-                continue # Lanjut ke dokumen berikutnya, skip logic default
-            else:
-                logger.warning("Regulation detected but failed to split by Pasal. Fallback to default splitter.")
-
-        # --- Default Logic (Existing) ---
-
-        # Gunakan regex untuk deteksi yang lebih robust (menangani variasi newline dsb)
-        if re.search(r'#{3,}', content):
-            logger.info(f"Detected manual delimiter ### in document from source: {data_source}")
-            sections = pre_split_by_marker(content)
-        else:
-            sections = [content]
-
-        for section in sections:
-            # Bersihkan teks sebelum di-split menjadi chunks
-            cleaned_section = clean_text(section)
-            if not cleaned_section:
-                continue
-                
-            chunks = text_splitter.split_text(cleaned_section)
-            for chunk in chunks:
-                meta = dict(base_meta)
-                result.append(Document(page_content=chunk, metadata=meta))
-
-    return result
+            produced = 0
+            for chunk in _iter_regulation_chunks(content, base_meta, chunk_size, text_splitter):
+                produced += 1
+                yield chunk
+            if produced:
+                logger.info(f"Successfully split into {produced} Pasal chunks.")
+                continue  # Lanjut ke dokumen berikutnya, skip logic default
+            logger.warning("Regulation detected but failed to split by Pasal. Fallback to default splitter.")
+
+        yield from _iter_default_chunks(content, base_meta, text_splitter)
+
+
+def split_documents_to_chunks(
+    docs: Iterable[Dict],
+    chunk_size: int = None,
+    chunk_overlap: int = None
+) -> List[Document]:
+    """
+    docs: iterable of dict dengan key:
+      - doc_id atau faq_id
+      - content
+      - metadata (opsional)
+    """
+    return list(iter_document_chunks(docs, chunk_size=chunk_size, chunk_overlap=chunk_overlap))
@@ -1,21 +1,31 @@
 # app/services/vector_store/service.py
-import logging, asyncio, inspect, tempfile, httpx, os, gc
-from typing import Optional, Dict, Any, Callable, List
-from langchain_community.document_loaders import PyMuPDFLoader
+import logging, asyncio, inspect, tempfile, httpx, os, gc, hashlib, json, shutil, time
+from typing import Optional, Dict, Any, Awaitable, Callable, List
 from app.services.vector_store.base import get_state
 from app.services.vector_store.fetcher import fetch_all_faqs, fetch_all_documents
 from app.services.vector_store.splitter import split_documents_to_chunks
 from app.services.vector_store.crud import (
     add_documents as crud_add_documents,
     delete_documents_by_metadata,
-    update_documents_by_metadata
+    update_documents_by_metadata,
+    ChunkReconciler,
+    replace_chunks,
 )
-from app.services.api_client import download_file_to_temp
+from app.services.vector_store.ingestion import PdfSource, run_ingestion_pipeline
+from app.services.vector_store.pdf_processing import (
+    extract_pdf_chunks,
+    extract_pdf_page_texts,
+    page_hash,
+    plan_page_reindex,
+    split_pdf_pages,
+)
+from app.services.api_client import download_file_to_temp, release_downloaded_file
 from app.services.embedding_service import get_embeddings_model
 from app.core.config import settings
 
-from langchain_community.retrievers import BM25Retriever
-from langchain_classic.retrievers import EnsembleRetriever
+from app.services.vector_store.bm25_index import BM25Index, BM25IndexRetriever, index_key
+from app.services.vector_store.hybrid_retriever import HybridRetriever
+from app.services.vector_store.embedding_store import open_embedding_store
 from langchain_core.documents import Document
 
 try:
@@ -26,6 +36,12 @@ except Exception:
 logger = logging.getLogger(__name__)
 BATCH_SIZE = 64
 
+# Blue/green reindex: koleksi bayangan bernama "<base>__<timestamp>", pointer koleksi aktif
+# disimpan di direktori persist Chroma agar restart tetap memakai koleksi hasil swap terakhir.
+SHADOW_SEPARATOR = "__"
+ACTIVE_COLLECTION_FILE = "active_collection.json"
+_reindex_lock = asyncio.Lock()
+
 
 async def maybe_async_call(fn: Callable, *args, **kwargs):
     """
@@ -40,55 +56,135 @@ async def maybe_async_call(fn: Callable, *args, **kwargs):
         return await result
     return await asyncio.to_thread(lambda: result)
 
-async def _create_hybrid_retriever(chroma_client):
+def _bm25_index_dir_for(collection_name: str) -> str:
+    """Satu direktori index BM25 per koleksi Chroma."""
+    return os.path.join(settings.BM25_INDEX_DIR, collection_name)
+
+def _bm25_index_dir(chroma_client) -> str:
+    return _bm25_index_dir_for(_collection_name_of(chroma_client))
+
+async def _collection_fingerprint(chroma_client) -> str:
+    """Hash dari seluruh ID chunk di koleksi (tanpa membaca isi dokumen)."""
+    data = await asyncio.to_thread(chroma_client.get, include=[])
+    digest = hashlib.sha256()
+    for chunk_id in sorted(data.get("ids") or []):
+        digest.update(chunk_id.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+async def _load_bm25_index(chroma_client) -> BM25Index:
     """
-    Membuat EnsembleRetriever (Hybrid Search) menggabungkan BM25 (Keyword) dan Chroma (Vector).
+    Buka index BM25 dari disk (mmap) jika fingerprint-nya cocok dengan isi koleksi.
+    Jika tidak, bangun dari seluruh isi Chroma, tulis ke disk, lalu buka versi mmap-nya
+    sehingga worker lain cukup membaca file yang sama lewat page cache.
     """
-    logger.info("Membangun Hybrid Retriever (BM25 + Vector)...")
-    
-    # 1. Ambil semua dokumen dari Chroma untuk membangun index BM25
+    index_dir = _bm25_index_dir(chroma_client)
+    fingerprint = await _collection_fingerprint(chroma_client)
+
+    index = await asyncio.to_thread(BM25Index.load, index_dir, fingerprint)
+    if index is not None:
+        logger.info(f"Index BM25 dimuat dari disk ({len(index)} chunk): {index_dir}")
+        return index
+
     # Chroma.get() mengembalikan dict dengan keys: ids, embeddings, documents, metadatas
+    # Jalankan di thread terpisah karena bisa berat jika data banyak
+    collection_data = await asyncio.to_thread(chroma_client.get)
+
+    documents = []
+    if collection_data and "documents" in collection_data and collection_data["documents"]:
+        texts = collection_data["documents"]
+        metadatas = collection_data["metadatas"]
+
+        for i, text in enumerate(texts):
+            if text: # Pastikan text tidak None/Empty
+                meta = metadatas[i] if metadatas and i < len(metadatas) else {}
+                documents.append(Document(page_content=text, metadata=meta or {}))
+
+    logger.info(f"Total dokumen untuk BM25: {len(documents)}")
+    index = await asyncio.to_thread(BM25Index.from_documents, documents)
+
+    # Explicitly clear temporary objects and trigger garbage collection
+    # to free RAM as soon as possible, especially for the large 'documents' list.
+    del documents
+    del collection_data
+    gc.collect()
+
     try:
-        # Jalankan di thread terpisah karena bisa berat jika data banyak
-        collection_data = await asyncio.to_thread(chroma_client.get)
-        
-        documents = []
-        if collection_data and "documents" in collection_data and collection_data["documents"]:
-            texts = collection_data["documents"]
-            metadatas = collection_data["metadatas"]
-            
-            for i, text in enumerate(texts):
-                if text: # Pastikan text tidak None/Empty
-                    meta = metadatas[i] if metadatas and i < len(metadatas) else {}
-                    documents.append(Document(page_content=text, metadata=meta))
-        
-        logger.info(f"Total dokumen untuk BM25: {len(documents)}")
+        await asyncio.to_thread(index.save, index_dir, fingerprint)
+        persisted = await asyncio.to_thread(BM25Index.load, index_dir, fingerprint)
+        if persisted is not None:
+            index = persisted
+    except Exception as e:
+        logger.warning(f"Gagal menyimpan index BM25 ke {index_dir}: {e}")
+    return index
 
-        # 2. Siapkan Vector Retriever
-        chroma_retriever = chroma_client.as_retriever(search_kwargs={"k": 4})
+async def persist_bm25_index() -> Optional[str]:
+    """Tulis index BM25 aktif ke disk dengan fingerprint koleksi saat ini. Mengembalikan fingerprint."""
+    state = get_state()
+    chroma, index = state.vector_store, state.bm25_index
+    if chroma is None or index is None:
+        return None
+    fingerprint = await _collection_fingerprint(chroma)
+    if fingerprint == index.fingerprint:
+        return fingerprint
+    await asyncio.to_thread(index.save, _bm25_index_dir(chroma), fingerprint)
+    logger.info("Index BM25 dipersist setelah perubahan data.")
+    return fingerprint
+
+_persist_task: Optional[asyncio.Task] = None
+
+def _schedule_bm25_persist() -> None:
+    """
+    Debounce: persist index BM25 beberapa detik setelah perubahan CRUD terakhir,
+    agar restart berikutnya tidak perlu tokenisasi ulang seluruh korpus.
+    """
+    global _persist_task
+    if _persist_task is not None and not _persist_task.done():
+        _persist_task.cancel()
 
-        if not documents:
-            logger.warning("Tidak ada dokumen untuk BM25, fallback ke Vector Retriever saja.")
-            return chroma_retriever
+    async def _delayed():
+        await asyncio.sleep(settings.BM25_PERSIST_DELAY_SECONDS)
+        try:
+            await persist_bm25_index()
+        except Exception as e:
+            logger.warning(f"Gagal mempersist index BM25: {e}")
 
-        # 3. Siapkan BM25 Retriever
-        bm25_retriever = BM25Retriever.from_documents(documents)
-        bm25_retriever.k = 4  # Samakan k dengan vector retriever
+    _persist_task = asyncio.create_task(_delayed())
 
-        # 4. Gabungkan dengan EnsembleRetriever
-        ensemble_retriever = EnsembleRetriever(
-            retrievers=[bm25_retriever, chroma_retriever],
-            weights=[0.3, 0.7]
-        )
-        
-        # Explicitly clear temporary objects and trigger garbage collection
-        # to free RAM as soon as possible, especially for the large 'documents' list.
-        del documents
-        del collection_data
-        gc.collect()
-        
+def _build_hybrid_retriever(chroma_client, bm25_index: BM25Index) -> HybridRetriever:
+    # 1. Siapkan BM25 Retriever
+    bm25_retriever = BM25IndexRetriever(index=bm25_index, k=4)  # Samakan k dengan vector retriever
+
+    # 2. Gabungkan dengan HybridRetriever (async native)
+    return HybridRetriever(
+        keyword_retriever=bm25_retriever,
+        vector_store=chroma_client,
+        embeddings=get_state().embeddings or chroma_client.embeddings,
+        k=4,
+        weights=[0.3, 0.7]
+    )
+
+async def _create_hybrid_retriever(chroma_client):
+    """
+    Membuat HybridRetriever menggabungkan BM25 (Keyword) dan Chroma (Vector) dengan
+    Weighted Reciprocal Rank Fusion; kedua leg berjalan bersamaan pada `ainvoke`.
+    Index BM25 diambil dari state (dibangun sekali), sehingga update CRUD langsung terlihat
+    oleh retriever tanpa perlu membangun ulang.
+    """
+    logger.info("Membangun Hybrid Retriever (BM25 + Vector)...")
+    state = get_state()
+
+    try:
+        # 1. Pastikan index BM25 tersedia
+        if state.bm25_index is None:
+            state.bm25_index = await _load_bm25_index(chroma_client)
+
+        if len(state.bm25_index) == 0:
+            logger.warning("Index BM25 masih kosong; akan terisi otomatis saat FAQ/dokumen ditambahkan.")
+
+        hybrid_retriever = _build_hybrid_retriever(chroma_client, state.bm25_index)
         logger.info("Hybrid Retriever berhasil dibuat.")
-        return ensemble_retriever
+        return hybrid_retriever
 
     except Exception as e:
         logger.error(f"Gagal membuat Hybrid Retriever: {e}")
@@ -103,27 +199,10 @@ async def _download_pdf_and_get_chunks(pdf_url: str, metadata: Dict) -> List:
         # 1. Download PDF ke file temporer
         temp_path = await download_file_to_temp(pdf_url, suffix=".pdf")
         
-        # 2. Load Dokumen menggunakan PyMuPDFLoader (lebih baik menangani spasi/font)
-        def sync_load_pdf():
-            loader = PyMuPDFLoader(temp_path)
-            return loader.load()  
-
-        documents = await asyncio.to_thread(sync_load_pdf)
+        # 2. Ekstrak teks (PyMuPDFLoader) & split ke chunks di process pool
+        chunks = await extract_pdf_chunks(temp_path, metadata)
 
-        full_text = ""
-        for doc in documents:
-            full_text += doc.page_content + "\n"
-
-        logger.info(f"Extracted {len(full_text)} chars from PDF {pdf_url}. Preview: {full_text[:200]}")
-
-
-        combined = [{
-            "content" : full_text,
-            "metadata": dict(metadata)
-        }]
-
-        # 4. Split ke chunks (menggunakan fungsi yang sudah ada)
-        chunks = split_documents_to_chunks(combined)
+        logger.info(f"Extracted {len(chunks)} chunks from PDF {pdf_url}")
         return chunks
 
     except httpx.HTTPStatusError as e:
@@ -133,9 +212,8 @@ async def _download_pdf_and_get_chunks(pdf_url: str, metadata: Dict) -> List:
         logger.exception(f"Error processing PDF from {pdf_url}: {e}")
         raise RuntimeError(f"Gagal memproses PDF: {e}")
     finally:
-        # 5. Bersihkan file temporer (hanya hapus file temporer unduhan, bukan file uploads lokal)
-        if temp_path and temp_path != pdf_url and os.path.exists(temp_path):
-            os.unlink(temp_path)
+        # 5. Bersihkan file temporer (bukan file uploads lokal / cache unduhan)
+        release_downloaded_file(temp_path, pdf_url)
 
 
 async def _create_or_connect_chroma(
@@ -200,7 +278,15 @@ async def initialize_vector_store(
         state.embeddings = embeddings
         logger.info("embedding model siap")
 
+        if state.embedding_store is None:
+            state.embedding_store = await asyncio.to_thread(open_embedding_store, settings.EMBEDDING_STORE_PATH)
+
         logger.info("Connecting to / creating chroma client...")
+        # Ikuti pointer blue/green: koleksi aktif bisa berupa hasil reindex terakhir
+        persist_directory = persist_directory or settings.CHROMA_PERSIST_DIR
+        collection_name = _resolve_active_collection(
+            persist_directory, collection_name or settings.CHROMA_COLLECTION_NAME
+        )
         try:
             chroma = await _create_or_connect_chroma(
                 embeddings, persist_directory=persist_directory, collection_name=collection_name
@@ -275,17 +361,20 @@ def get_retriever():
     return state.retriever
 
 
-async def refresh_vector_store_data(batch_size: int = BATCH_SIZE) -> Dict[str, Any]:
-    state = get_state()
-    logger.info("🔄 Starting full refresh...")
+def get_cache_stats() -> Dict[str, Any]:
+    """Statistik cache embedding (hit/miss) untuk monitoring."""
+    embeddings = get_state().embeddings
+    stats_fn = getattr(embeddings, "stats", None)
+    return {"embeddings": stats_fn() if callable(stats_fn) else None}
 
+
+REFRESH_MODES = ("full", "reconcile")
+
+async def _collect_sources() -> List:
+    """Ambil daftar FAQ & dokumen dari sumber data sebagai input pipeline ingestion."""
     # Fetch data
-    try:
-        faqs_response = await fetch_all_faqs()
-        docs_response = await fetch_all_documents()
-    except Exception as e:
-        logger.error(f"❌ Fetch failed: {e}")
-        return {"status": "error", "message": str(e)}
+    faqs_response = await fetch_all_faqs()
+    docs_response = await fetch_all_documents()
 
     # Extract arrays
     faqs = faqs_response.get("data", []) if isinstance(faqs_response, dict) else faqs_response
@@ -293,17 +382,16 @@ async def refresh_vector_store_data(batch_size: int = BATCH_SIZE) -> Dict[str, A
     
     logger.info(f"📥 Fetched {len(faqs)} FAQs, {len(docs)} docs")
 
-    combined_full_docs = []    # Dokumen FAQ yang masih perlu di-split
-    pdf_processing_tasks = []  # List tasks untuk PDF (akan menghasilkan chunks)
+    sources = []
 
-    # 1. Normalize FAQs (Masih menggunakan content string dan akan di-split nanti)
+    # 1. Normalize FAQs (content string, di-split oleh pipeline)
     for f in faqs:
         question = f.get("question", "").strip()
         answer = f.get("answer", "").strip()
         content = f"pertanyaan: {question}\njawaban: {answer}".strip()
         
         if content:
-            combined_full_docs.append({
+            sources.append({
                 "content": content,
                 "metadata": {
                     "source": "faq",
@@ -311,7 +399,7 @@ async def refresh_vector_store_data(batch_size: int = BATCH_SIZE) -> Dict[str, A
                 }
             })
 
-    # 2. Siapkan Tasks Pemrosesan Dokumen PDF (Konkuren)
+    # 2. Dokumen PDF (diunduh, diekstrak, dan di-split oleh pipeline)
     for d in docs:
         # Asumsi source_path berisi URL publik yang dikirim dari Laravel
         pdf_url = d.get("source_path", "").strip() 
@@ -319,78 +407,260 @@ async def refresh_vector_store_data(batch_size: int = BATCH_SIZE) -> Dict[str, A
         title = d.get("title", "")
         
         if pdf_url:
-            metadata = {
+            sources.append(PdfSource(url=pdf_url, metadata={
                 "source": "document",
                 "title": title,
                 "doc_id": doc_id,
-            }
-            # Buat task untuk mengunduh, mengekstrak, dan memecah PDF
-            task = _download_pdf_and_get_chunks(pdf_url, metadata)
-            pdf_processing_tasks.append(task)
+            }))
         else:
             logger.warning(f"Document ID {doc_id} skipped: No source_path found.")
 
-    # 3. Eksekusi semua tugas PDF secara Konkuren
-    logger.info(f"🚀 Starting concurrent PDF processing for {len(pdf_processing_tasks)} documents...")
-    
-    # asyncio.gather mengembalikan list of lists of chunks (atau Exception jika gagal)
-    list_of_chunks = await asyncio.gather(*pdf_processing_tasks, return_exceptions=True) 
-
-    # 4. Gabungkan dan filter hasil PDF
-    processed_chunks = []
-    for result in list_of_chunks:
-        if isinstance(result, Exception):
-            # Log error agar tidak menghentikan proses refresh total
-            logger.error(f"❌ Failed to process one PDF document: {result}")
-        else:
-            # Hasilnya adalah list of chunks (list of dicts) dari satu dokumen
-            processed_chunks.extend(result)
+    return sources
 
-    # 5. Split Dokumen FAQ yang tersisa
-    faq_chunks = split_documents_to_chunks(combined_full_docs)
-    
-    # 6. Gabungkan semua chunks (FAQ + PDF)
-    final_chunks = faq_chunks + processed_chunks
-    
-    # Lanjutkan dengan final_chunks
-    if not final_chunks:
+
+async def refresh_vector_store_data(
+    batch_size: int = BATCH_SIZE,
+    mode: str = "full",
+    on_swap: Optional[Callable[[Any], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Bangun ulang isi vector store dari sumber data.
+
+    mode="full"      : bangun koleksi bayangan lalu tukar secara atomik (blue/green);
+                       `on_swap(retriever)` dipanggil di dalam penukaran, misal untuk set_graph.
+    mode="reconcile" : bandingkan ID chunk deterministik dengan isi koleksi dan hanya
+                       terapkan delete/upsert yang diperlukan (tanpa jeda koleksi kosong).
+    """
+    if mode not in REFRESH_MODES:
+        raise ValueError(f"Unsupported refresh mode: {mode}. Supported values are {REFRESH_MODES}.")
+
+    state = get_state()
+    logger.info(f"🔄 Starting {mode} refresh...")
+
+    try:
+        sources = await _collect_sources()
+    except Exception as e:
+        logger.error(f"❌ Fetch failed: {e}")
+        return {"status": "error", "message": str(e)}
+
+    if not sources:
         logger.warning("⚠️ No data")
         return {"status": "no_data"}
 
-    # Clear collection - JANGAN delete_collection, pakai delete dengan where={}
+    if mode == "reconcile":
+        # Satu lock dengan reindex penuh: perubahan reconcile pada koleksi live tidak boleh
+        # hilang tertimpa koleksi bayangan yang sedang dibangun
+        async with _reindex_lock:
+            # Batch chunk langsung dibandingkan & di-upsert saat keluar dari pipeline
+            reconciler = await ChunkReconciler.start()
+            await run_ingestion_pipeline(sources, batch_size=batch_size, on_batch=reconciler.add_batch)
+            if not reconciler.seen:
+                logger.warning("⚠️ No data")
+                return {"status": "no_data"}
+            report = await reconciler.finish()
+        if report["added"] or report["deleted"]:
+            _schedule_bm25_persist()
+        items_indexed = report["added"] + report["unchanged"]
+        logger.info(f"✅ Reconciled {items_indexed} chunks")
+        return {"status": "ok", "mode": mode, "items_indexed": items_indexed, **report}
+
     chroma = state.vector_store
-    # ... (Logika clearing collection tetap sama, menggunakan final_chunks. Tidak ditampilkan di sini)
-    try:
-        # Get all IDs and delete them (safer than delete_collection)
-        logger.info("🗑️ Clearing collection...")
-        collection = chroma._collection
-        
-        # Delete all documents
+
+    # Mode full: pipeline langsung meng-embed & meng-upsert ke koleksi bayangan
+    async def populate(shadow, on_batch) -> None:
+        await run_ingestion_pipeline(sources, target=shadow, batch_size=batch_size, on_batch=on_batch)
+
+    return await _blue_green_reindex(chroma, populate, on_swap=on_swap)
+
+
+async def _blue_green_reindex(
+    live_chroma,
+    populate: Callable[[Any, Callable[[List[Document]], None]], Awaitable[None]],
+    on_swap: Optional[Callable[[Any], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Reindex penuh tanpa downtime: bangun koleksi bayangan (shadow), validasi, lalu
+    tukar vector store, index BM25, retriever, dan graph sekaligus. Koleksi lama
+    disimpan sebagai "previous" sampai reindex berikutnya, karena worker lain baru
+    pindah ke koleksi baru saat watch_active_collection melihat pointer berubah.
+
+    `populate(shadow, on_batch)` mengisi koleksi bayangan dan memanggil `on_batch` untuk
+    setiap batch yang sudah di-upsert; batch langsung masuk index BM25 bayangan dan
+    hitungan validasi, tanpa menyimpan daftar seluruh chunk.
+    """
+    state = get_state()
+    async with _reindex_lock:
+        persist_directory = _persist_directory_of(live_chroma)
+        live_name = _collection_name_of(live_chroma)
+        base_name = _base_collection_name(live_name)
+        shadow_name = f"{base_name}{SHADOW_SEPARATOR}{int(time.time())}"
+
+        logger.info(f"🟦 Building shadow collection '{shadow_name}'...")
+        shadow = await _create_or_connect_chroma(
+            state.embeddings, persist_directory=persist_directory, collection_name=shadow_name
+        )
+
+        bm25_index = BM25Index()
+        chunk_ids: set = set()
+        sample_texts: List[str] = []
+        produced = 0
+
+        def on_batch(batch: List[Document]) -> None:
+            nonlocal produced
+            produced += len(batch)
+            chunk_ids.update(doc.id for doc in batch)
+            if not sample_texts and batch:
+                sample_texts.append(batch[0].page_content[:200])
+            grouped: Dict[Optional[str], List[Document]] = {}
+            for doc in batch:
+                grouped.setdefault(index_key(doc.metadata), []).append(doc)
+            for key, docs in grouped.items():
+                bm25_index.add(key, docs)
+
         try:
-            collection.delete(where={})  # Delete all with empty filter
-        except:
-            # Fallback: get all IDs then delete
-            try:
-                all_data = collection.get()
-                if all_data and all_data.get('ids'):
-                    collection.delete(ids=all_data['ids'])
-            except Exception as e:
-                logger.warning(f"⚠️ Clear fallback failed: {e}")
-        
-        logger.info("✅ Collection cleared")
+            # 1. Isi koleksi bayangan (embedding dipakai ulang dari EmbeddingStore) + index BM25
+            await populate(shadow, on_batch)
+            if not produced:
+                await _drop_collection(shadow)
+                logger.warning("⚠️ No data")
+                return {"status": "no_data"}
+
+            # 2. Validasi: jumlah chunk + satu query sampel
+            expected = len(chunk_ids)
+            actual = await asyncio.to_thread(shadow._collection.count)
+            if actual != expected:
+                raise RuntimeError(f"Shadow collection has {actual} chunks, expected {expected}")
+            sample = await asyncio.to_thread(shadow.similarity_search, sample_texts[0], 1)
+            if not sample:
+                raise RuntimeError("Sample query on shadow collection returned no results")
+
+            # 3. Persist index BM25 koleksi bayangan lalu buka versi mmap-nya
+            fingerprint = await _collection_fingerprint(shadow)
+            shadow_dir = _bm25_index_dir(shadow)
+            await asyncio.to_thread(bm25_index.save, shadow_dir, fingerprint)
+            bm25_index = await asyncio.to_thread(BM25Index.load, shadow_dir, fingerprint) or bm25_index
+        except Exception:
+            logger.exception("❌ Shadow build/validation failed, keeping live collection")
+            await _drop_collection(shadow)
+            raise
+
+        # 4. Tukar secara atomik (tanpa await di antara penugasan)
+        retriever = _build_hybrid_retriever(shadow, bm25_index)
+        async with state.lock:
+            state.vector_store = shadow
+            state.bm25_index = bm25_index
+            state.retriever = retriever
+            if on_swap is not None:
+                on_swap(retriever)
+        stale_name = _read_active_pointer(persist_directory).get("previous")
+        _write_active_collection(persist_directory, base_name, shadow_name, previous_name=live_name)
+        logger.info(f"🔁 Swapped live collection '{live_name}' -> '{shadow_name}'")
+
+        # 5. Hapus koleksi dua generasi sebelumnya; semua worker sudah lama pindah darinya
+        if stale_name and stale_name not in (live_name, shadow_name):
+            await _drop_collection_by_name(stale_name, state.embeddings, persist_directory)
+
+    logger.info(f"✅ Indexed {produced} chunks")
+    return {"status": "ok", "mode": "full", "items_indexed": produced, "collection": shadow_name}
+
+
+def _persist_directory_of(chroma) -> str:
+    return getattr(chroma, "_persist_directory", None) or settings.CHROMA_PERSIST_DIR
+
+def _collection_name_of(chroma) -> str:
+    inner = getattr(chroma, "_collection", None)
+    return getattr(inner, "name", None) or settings.CHROMA_COLLECTION_NAME
+
+def _base_collection_name(name: str) -> str:
+    return name.split(SHADOW_SEPARATOR)[0]
+
+def _read_active_pointer(persist_directory: str) -> Dict[str, Any]:
+    path = os.path.join(persist_directory, ACTIVE_COLLECTION_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _resolve_active_collection(persist_directory: str, collection_name: str) -> str:
+    """Nama koleksi aktif untuk `collection_name` menurut pointer hasil swap terakhir."""
+    pointer = _read_active_pointer(persist_directory)
+    if pointer.get("base") == _base_collection_name(collection_name) and pointer.get("active"):
+        return pointer["active"]
+    return collection_name
+
+def _write_active_collection(
+    persist_directory: str, base_name: str, active_name: str, previous_name: Optional[str] = None
+) -> None:
+    os.makedirs(persist_directory, exist_ok=True)
+    path = os.path.join(persist_directory, ACTIVE_COLLECTION_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"base": base_name, "active": active_name, "previous": previous_name}, f)
+    os.replace(tmp_path, path)
+
+async def _drop_collection(chroma) -> None:
+    name = _collection_name_of(chroma)
+    try:
+        await asyncio.to_thread(chroma.delete_collection)
+        await asyncio.to_thread(shutil.rmtree, _bm25_index_dir_for(name), True)
+        logger.info(f"🗑️ Dropped collection '{name}'")
     except Exception as e:
-        logger.warning(f"⚠️ Clear failed: {e}")
+        logger.warning(f"⚠️ Failed to drop collection '{name}': {e}")
 
-    # Upsert chunks
-    logger.info(f"📤 Upserting {len(final_chunks)} chunks...")
-    await crud_add_documents(final_chunks)
+async def _drop_collection_by_name(name: str, embeddings, persist_directory: str) -> None:
+    try:
+        chroma = await _create_or_connect_chroma(
+            embeddings, persist_directory=persist_directory, collection_name=name
+        )
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to open collection '{name}' for dropping: {e}")
+        return
+    await _drop_collection(chroma)
 
-    # Recreate retriever (HYBRID)
-    state.retriever = await _create_hybrid_retriever(chroma)
-    
-    logger.info(f"✅ Indexed {len(final_chunks)} chunks")
-    return {"status": "ok", "items_indexed": len(final_chunks)}
 
+async def reload_active_collection(on_swap: Optional[Callable[[Any], None]] = None) -> bool:
+    """
+    Pindah ke koleksi aktif menurut pointer jika berbeda dengan koleksi proses ini
+    (reindex dijalankan worker lain). Index BM25 dibuka dari disk yang sudah ditulis
+    worker tersebut. Mengembalikan True jika terjadi penukaran.
+    """
+    state = get_state()
+    live_chroma = state.vector_store
+    if live_chroma is None or _reindex_lock.locked():
+        return False
+    persist_directory = _persist_directory_of(live_chroma)
+    live_name = _collection_name_of(live_chroma)
+    active_name = _resolve_active_collection(persist_directory, live_name)
+    if active_name == live_name:
+        return False
+
+    chroma = await _create_or_connect_chroma(
+        state.embeddings, persist_directory=persist_directory, collection_name=active_name
+    )
+    bm25_index = await _load_bm25_index(chroma)
+    retriever = _build_hybrid_retriever(chroma, bm25_index)
+    async with state.lock:
+        state.vector_store = chroma
+        state.bm25_index = bm25_index
+        state.retriever = retriever
+        if on_swap is not None:
+            on_swap(retriever)
+    logger.info(f"🔁 Reloaded live collection '{live_name}' -> '{active_name}' (pointer changed)")
+    return True
+
+
+async def watch_active_collection(on_swap: Optional[Callable[[Any], None]] = None) -> None:
+    """
+    Loop background per worker: cek pointer koleksi aktif setiap
+    ACTIVE_COLLECTION_POLL_SECONDS agar semua worker uvicorn ikut pindah setelah reindex.
+    """
+    while True:
+        await asyncio.sleep(settings.ACTIVE_COLLECTION_POLL_SECONDS)
+        try:
+            await reload_active_collection(on_swap)
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to reload active collection: {e}")
 
 
 async def add_faq_to_vector_store(content: str, metadata: Optional[Dict] = None) -> Dict[str, Any]:
@@ -413,6 +683,7 @@ async def add_faq_to_vector_store(content: str, metadata: Optional[Dict] = None)
     docs = split_documents_to_chunks([{"content": content, "metadata": metadata}])
     # reuse add_documents CRUD (may be sync/async)
     await maybe_async_call(crud_add_documents, docs)
+    _schedule_bm25_persist()
     return {"status": "ok", "indexed_chunks": len(docs)}
 
 
@@ -427,7 +698,9 @@ async def update_faq_in_vector_store(faq_id: str, content: str, metadata: Option
     metadata = metadata or {}
     metadata["faq_id"] = faq_id
     docs = split_documents_to_chunks([{"content": content, "metadata": metadata}])
-    return await maybe_async_call(update_documents_by_metadata, "faq_id", faq_id, docs)
+    result = await maybe_async_call(update_documents_by_metadata, "faq_id", faq_id, docs)
+    _schedule_bm25_persist()
+    return result
 
 
 async def delete_faq_from_vector_store(faq_id: str) -> Dict[str, Any]:
@@ -438,7 +711,9 @@ async def delete_faq_from_vector_store(faq_id: str) -> Dict[str, Any]:
     if not state.initialized:
         raise RuntimeError("Vector store not initialized")
 
-    return await maybe_async_call(delete_documents_by_metadata, "faq_id", faq_id)
+    result = await maybe_async_call(delete_documents_by_metadata, "faq_id", faq_id)
+    _schedule_bm25_persist()
+    return result
 
 async def add_document_to_vector_store(pdf_url: str, metadata: Optional[Dict] = None) -> Dict[str, Any]:
     """
@@ -461,6 +736,7 @@ async def add_document_to_vector_store(pdf_url: str, metadata: Optional[Dict] =
 
     # Upsert chunks yang sudah diekstrak
     await maybe_async_call(crud_add_documents, chunks)
+    _schedule_bm25_persist()
     
     return {"status": "ok", "indexed_chunks": len(chunks)}
 
@@ -469,31 +745,69 @@ async def add_document_to_vector_store(pdf_url: str, metadata: Optional[Dict] =
 
 async def update_document_in_vector_store(doc_id: str, pdf_url: str, metadata: Optional[Dict] = None) -> Dict[str, Any]:
     """
-    Update: Hapus chunks lama berdasarkan doc_id, lalu unduh, ekstrak PDF baru, dan upsert.
+    Update dokumen PDF secara inkremental per halaman: hash tiap halaman dibandingkan
+    dengan metadata chunk lama, dan hanya halaman yang berubah yang di-split & di-embed
+    ulang. Chunk lama tanpa metadata halaman -> hapus semua lalu upsert ulang.
     """
     state = get_state()
     if not state.initialized:
         raise RuntimeError("Vector store not initialized")
 
-    metadata = metadata or {}
+    metadata = dict(metadata or {})
+    metadata.setdefault("doc_id", doc_id)
     
-    # 1. UNDUH, EKSTRAK, DAN SPLIT PDF BARU
+    # 1. UNDUH & EKSTRAK TEKS PER HALAMAN
     logger.info(f"Processing new PDF content for doc_id: {doc_id}")
+    temp_path = None
     try:
-        # Gunakan fungsi yang modular
-        new_documents_chunks = await _download_pdf_and_get_chunks(pdf_url, metadata)
+        temp_path = await download_file_to_temp(pdf_url, suffix=".pdf")
+        pages = await extract_pdf_page_texts(temp_path)
     except Exception as e:
         # Angkat error, jangan lanjutkan jika pemrosesan PDF baru gagal
         raise RuntimeError(f"Gagal memproses PDF baru untuk update: {e}")
+    finally:
+        release_downloaded_file(temp_path, pdf_url)
 
-    if not new_documents_chunks:
+    if not any(page.strip() for page in pages):
         # Jika PDF kosong atau gagal diekstrak, hapus dokumen lama dan kembalikan status.
         await maybe_async_call(delete_documents_by_metadata, "doc_id", doc_id)
+        _schedule_bm25_persist()
         return {"status": "cleared", "message": "New PDF content was empty, old document deleted.", "doc_id": doc_id}
 
-    # 2. DELETE OLD, UPSERT NEW (Menggunakan CRUD yang modular)
-    # update_documents_by_doc_id menangani DELETE kemudian ADD
-    return await maybe_async_call(update_documents_by_metadata, "doc_id", doc_id, new_documents_chunks)
+    # 2. BANDINGKAN HASH HALAMAN DENGAN CHUNK LAMA
+    existing = await asyncio.to_thread(state.vector_store.get, where={"doc_id": doc_id}, include=["metadatas"])
+    plan = plan_page_reindex(
+        [page_hash(page) for page in pages],
+        list(zip(existing.get("ids") or [], existing.get("metadatas") or [])),
+    )
+
+    if plan is None:
+        # DELETE OLD, UPSERT NEW (update_documents_by_metadata menangani DELETE kemudian ADD)
+        new_documents_chunks = await split_pdf_pages(pages, metadata)
+        result = await maybe_async_call(update_documents_by_metadata, "doc_id", doc_id, new_documents_chunks)
+        _schedule_bm25_persist()
+        return {**result, "mode": "full", "pages": len(pages)}
+
+    stale_ids, runs = plan
+    if not stale_ids and not runs:
+        logger.info(f"Tidak ada halaman yang berubah untuk doc_id {doc_id}")
+        return {"status": "unchanged", "doc_id": doc_id, "pages": len(pages)}
+
+    # 3. SPLIT ULANG HANYA RENTANG HALAMAN YANG BERUBAH
+    new_chunks = []
+    for first, last in runs:
+        char_offset = sum(len(page) + 1 for page in pages[:first])
+        # chunk_index berbasis halaman (lihat split_pages): sama dengan hasil split penuh
+        new_chunks.extend(
+            await split_pdf_pages(pages[first:last + 1], metadata, first_page=first, char_offset=char_offset)
+        )
+
+    result = await replace_chunks("doc_id", doc_id, new_chunks, stale_ids)
+    _schedule_bm25_persist()
+    logger.info(
+        f"Update inkremental doc_id {doc_id}: {sum(b - a + 1 for a, b in runs)}/{len(pages)} halaman di-index ulang"
+    )
+    return {**result, "mode": "incremental", "pages": len(pages), "reindexed_pages": [list(run) for run in runs]}
 
 
 async def delete_document_from_vector_store(doc_id: str) -> Dict[str, Any]:
@@ -504,5 +818,7 @@ async def delete_document_from_vector_store(doc_id: str) -> Dict[str, Any]:
     if not state.initialized:
         raise RuntimeError("Vector store not initialized")
 
-    return await maybe_async_call(delete_documents_by_metadata, "doc_id", doc_id)
+    result = await maybe_async_call(delete_documents_by_metadata, "doc_id", doc_id)
+    _schedule_bm25_persist()
+    return result
 
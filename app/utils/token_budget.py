@@ -0,0 +1,90 @@
+import logging
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Perkiraan kasar jika encoding tiktoken tidak tersedia (misal server offline saat pertama kali jalan)
+_CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=4)
+def _get_encoding(name: str):
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        logger.warning(f"Encoding tiktoken '{name}' tidak tersedia, memakai perkiraan karakter: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Jumlah token `text` menurut encoding tiktoken yang dikonfigurasi (TOKEN_ENCODING)."""
+    if not text:
+        return 0
+    encoding = _get_encoding(settings.TOKEN_ENCODING)
+    if encoding is None:
+        return (len(text) + _CHARS_PER_TOKEN - 1) // _CHARS_PER_TOKEN
+    return len(encoding.encode_ordinary(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Potong `text` agar paling banyak `max_tokens` token."""
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding(settings.TOKEN_ENCODING)
+    if encoding is None:
+        return text[: max_tokens * _CHARS_PER_TOKEN]
+    tokens = encoding.encode_ordinary(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+
+def pack_context(
+    docs: Iterable,
+    budget_tokens: Optional[int] = None,
+    separator: str = "\n\n",
+) -> Tuple[str, List]:
+    """
+    Susun konteks prompt dari dokumen hasil retrieval (urutan = peringkat) sampai
+    `budget_tokens` terpenuhi (<= 0 berarti tanpa batas). Dokumen dengan isi sama hanya
+    dipakai sekali; dokumen pertama yang melebihi sisa budget dipotong, lalu pengisian berhenti.
+
+    Mengembalikan (teks konteks, daftar dokumen yang dipakai).
+    """
+    budget = settings.CONTEXT_TOKEN_BUDGET if budget_tokens is None else budget_tokens
+    separator_tokens = count_tokens(separator)
+
+    parts: List[str] = []
+    used: List = []
+    seen = set()
+    remaining = budget
+    for doc in docs:
+        content = (doc.page_content or "").strip()
+        if not content or content in seen:
+            continue
+        seen.add(content)
+
+        if budget <= 0:
+            parts.append(content)
+            used.append(doc)
+            continue
+
+        cost = count_tokens(content) + (separator_tokens if parts else 0)
+        if cost <= remaining:
+            parts.append(content)
+            used.append(doc)
+            remaining -= cost
+            continue
+
+        # Sisa budget hanya cukup untuk sebagian dokumen ini
+        room = remaining - (separator_tokens if parts else 0)
+        if room > 0:
+            parts.append(truncate_to_tokens(content, room))
+            used.append(doc)
+        break
+
+    return separator.join(parts), used
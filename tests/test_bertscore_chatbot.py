@@ -6,6 +6,7 @@ from bert_score import score, model2layers
 # Import fungsi-fungsi dari sistemmu
 import sys
 import os
+import time
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from app.core.startup import get_graph, init_graph
@@ -48,6 +49,11 @@ refs = [
 ]
 
 
+# Mode pipeline yang diuji (A/B): "staged" / "fused"; None = ikuti PIPELINE_MODE di settings
+# Contoh: python tests/test_bertscore_chatbot.py fused
+PIPELINE_MODE = sys.argv[1] if len(sys.argv) > 1 else None
+
+
 # === 2. Fungsi untuk menghasilkan jawaban dari sistem chatbot ===
 async def generate_answers():
     graph = get_graph()
@@ -60,6 +66,7 @@ async def generate_answers():
         raise RuntimeError("Graph belum siap, pastikan sistem LLM kamu sudah diinisialisasi.")
 
     preds = []
+    durations = []
     for q in pertanyaan:
         state: State = {
             "question": q,
@@ -69,18 +76,23 @@ async def generate_answers():
             "user_id": "test_evaluation",
             "intent": "unknown",
             "tracking_number": None,
-            "tracking_data": None
+            "tracking_data": None,
+            "pipeline_mode": PIPELINE_MODE
         }
 
         try:
+            start_time = time.time()
             final_state = await graph.ainvoke(state)
+            durations.append(time.time() - start_time)
             answer = final_state.get("answer", "Maaf, belum bisa menjawab.")
             preds.append(answer)
             logger.info(f"✅ Q: {q}\n→ A: {answer}\n")
         except Exception as e:
             logger.error(f"❌ Error saat memproses '{q}': {e}")
             preds.append("Error saat memproses jawaban.")
-    
+
+    if durations:
+        print(f"\nRata-rata waktu respons ({PIPELINE_MODE or 'default'}): {sum(durations) / len(durations):.2f} detik")
     return preds
 
 
@@ -110,8 +122,9 @@ async def main():
     print(f"F1 Score: {F1.mean().item():.4f}")
 
     # Simpan ke CSV jika ingin dokumentasi hasil penelitian
-    df.to_csv("hasil_evaluasi_chatbot2.csv", index=False, encoding="utf-8-sig")
-    print("\n✅ Hasil evaluasi disimpan ke 'hasil_evaluasi_chatbot2.csv'")
+    output_file = f"hasil_evaluasi_chatbot_{PIPELINE_MODE}.csv" if PIPELINE_MODE else "hasil_evaluasi_chatbot2.csv"
+    df.to_csv(output_file, index=False, encoding="utf-8-sig")
+    print(f"\n✅ Hasil evaluasi disimpan ke '{output_file}'")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,58 @@
+import json
+import os
+import re
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.faq_index import build_faq_index, normalize_question
+
+FAQ_PATH = os.path.join(os.path.dirname(__file__), '..', 'faqs.json')
+DOCUMENT_KEYWORDS = ["ktp", "kk", "kia"]
+
+
+@pytest.fixture(scope="module")
+def faqs():
+    with open(FAQ_PATH, encoding="utf-8") as f:
+        return [dict(faq, id=i) for i, faq in enumerate(json.load(f))]
+
+
+@pytest.fixture(scope="module")
+def faq_index(faqs):
+    return build_faq_index(faqs)
+
+
+@pytest.mark.parametrize("question", [
+    "apakah pembuatan ktp dikenakan biaya",
+    "berapa lama proses penerbitan ktp",
+    "apakah ktp berbayar",
+])
+def test_swapped_document_keyword_does_not_match_other_faq(faq_index, question):
+    entry = faq_index.match(question)
+    assert entry is None or entry.normalized == normalize_question(question)
+
+
+def test_swapped_document_keywords_in_all_faqs(faqs, faq_index):
+    # Menukar KTP/KK/KIA pada pertanyaan FAQ tidak boleh menghasilkan jawaban FAQ dokumen lain
+    wrong = []
+    for faq in faqs:
+        question = normalize_question(faq["question"])
+        for original in DOCUMENT_KEYWORDS:
+            if not re.search(rf"\b{original}\b", question):
+                continue
+            for replacement in DOCUMENT_KEYWORDS:
+                if replacement == original:
+                    continue
+                swapped = re.sub(rf"\b{original}\b", replacement, question)
+                entry = faq_index.match(swapped)
+                if entry is not None and entry.normalized != swapped:
+                    wrong.append((swapped, entry.question))
+    assert wrong == []
+
+
+def test_typo_still_matches(faq_index):
+    entry = faq_index.match("Berapa lama prses pembuatan KTP elektronik?")
+    assert entry is not None
+    assert entry.question == "Berapa lama proses pembuatan KTP elektronik?"
@@ -0,0 +1,139 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from langchain_core.documents import Document
+
+from app.core.config import settings
+from app.services.vector_store import ingestion
+from app.services.vector_store import vector_store_service as service
+from app.services.vector_store.base import get_state
+from app.services.vector_store.bm25_index import BM25Index
+from app.services.vector_store.pdf_processing import split_pages
+
+DOC_ID = "7"
+PDF_URL = "http://example.test/panduan.pdf"
+
+
+class FakeCollection:
+    def __init__(self):
+        self.rows = {}
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        for cid, vector, text, meta in zip(ids, embeddings, documents, metadatas):
+            self.rows[cid] = (vector, text, meta)
+
+    def delete(self, ids=None, where=None):
+        for cid in list(ids if ids is not None else self._matching(where)):
+            self.rows.pop(cid, None)
+
+    def get(self, ids=None, where=None, include=None):
+        matched = [cid for cid in self._matching(where) if ids is None or cid in ids]
+        return {
+            "ids": matched,
+            "embeddings": [self.rows[cid][0] for cid in matched],
+            "documents": [self.rows[cid][1] for cid in matched],
+            "metadatas": [self.rows[cid][2] for cid in matched],
+        }
+
+    def _matching(self, where):
+        return [
+            cid for cid, (_, _, meta) in self.rows.items()
+            if not where or all((meta or {}).get(k) == v for k, v in where.items())
+        ]
+
+
+class FakeChroma:
+    def __init__(self):
+        self._collection = FakeCollection()
+
+    def get(self, **kwargs):
+        return self._collection.get(**kwargs)
+
+    def delete(self, ids=None, where=None):
+        self._collection.delete(ids=ids, where=where)
+
+
+class FakeEmbeddings:
+    model_name = "fake"
+
+    async def aembed_documents(self, texts):
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def make_pages(changed_page=None):
+    pages = []
+    for page in range(6):
+        version = "baru" if page == changed_page else "lama"
+        sentences = " ".join(
+            f"Langkah {page}.{i} pengurusan dokumen kependudukan versi {version}." for i in range(30)
+        )
+        pages.append(f"Halaman {page}. {sentences}")
+    return pages
+
+
+@pytest.fixture
+def pdf(monkeypatch):
+    current = {"pages": make_pages()}
+    metadata = {"source": "document", "title": "Panduan Layanan", "doc_id": DOC_ID}
+
+    async def fake_download(url, suffix=".pdf"):
+        return "/tmp/panduan.pdf"
+
+    async def fake_page_texts(path):
+        return list(current["pages"])
+
+    async def fake_pdf_chunks(path, meta):
+        return [Document(page_content=text, metadata=m) for text, m in split_pages(current["pages"], meta)]
+
+    async def fake_sources():
+        return [ingestion.PdfSource(url=PDF_URL, metadata=metadata)]
+
+    monkeypatch.setattr(settings, "PDF_PROCESS_WORKERS", 0)
+    for module in (service, ingestion):
+        monkeypatch.setattr(module, "download_file_to_temp", fake_download)
+        monkeypatch.setattr(module, "release_downloaded_file", lambda path, url: None)
+    monkeypatch.setattr(service, "extract_pdf_page_texts", fake_page_texts)
+    monkeypatch.setattr(ingestion, "extract_pdf_chunks", fake_pdf_chunks)
+    monkeypatch.setattr(service, "_collect_sources", fake_sources)
+    monkeypatch.setattr(service, "_schedule_bm25_persist", lambda: None)
+
+    state = get_state()
+    monkeypatch.setattr(state, "vector_store", FakeChroma())
+    monkeypatch.setattr(state, "embeddings", FakeEmbeddings())
+    monkeypatch.setattr(state, "embedding_store", None)
+    monkeypatch.setattr(state, "bm25_index", BM25Index.from_documents([]))
+    monkeypatch.setattr(state, "initialized", True)
+    return current
+
+
+def test_reconcile_after_incremental_update_is_noop(pdf):
+    async def scenario():
+        first = await service.refresh_vector_store_data(mode="reconcile")
+        assert first["added"] > 0
+
+        pdf["pages"] = make_pages(changed_page=2)
+        update = await service.update_document_in_vector_store(DOC_ID, PDF_URL)
+        assert update["mode"] == "incremental"
+
+        return await service.refresh_vector_store_data(mode="reconcile")
+
+    report = asyncio.run(scenario())
+    assert report["added"] == 0
+    assert report["deleted"] == 0
+    assert report["changed_sources"] == []
+
+
+def test_reconcile_picks_up_changed_page(pdf):
+    async def scenario():
+        await service.refresh_vector_store_data(mode="reconcile")
+        pdf["pages"] = make_pages(changed_page=4)
+        return await service.refresh_vector_store_data(mode="reconcile")
+
+    report = asyncio.run(scenario())
+    assert report["added"] > 0
+    assert report["changed_sources"] == [f"doc:{DOC_ID}"]